@@ -0,0 +1,242 @@
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+# 准入控制配置
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '32'))                # 每个模型最多排队的请求数
+ADMISSION_USER_QUEUE = int(os.getenv('ADMISSION_USER_QUEUE', '2'))                 # 每个用户在一个模型上最多排队的请求数
+ADMISSION_DEADLINE = float(os.getenv('ADMISSION_DEADLINE', '120'))                 # 最长排队时间（秒），预计超过时直接拒绝
+ADMISSION_UPDATE_INTERVAL = float(os.getenv('ADMISSION_UPDATE_INTERVAL', '1'))     # 向客户端推送排队位置的间隔（秒）
+ADMISSION_DEFAULT_DURATION = float(os.getenv('ADMISSION_DEFAULT_DURATION', '30'))  # 还没有请求完成时假定的单个请求耗时（秒）
+
+
+class AdmissionRejected(Exception):
+    """请求无法排队：队列已满、用户排队过多或预计等待超过截止时间"""
+
+    def __init__(self, message, status=503, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """一个请求的排队凭证，拿到后必须调用 close()"""
+
+    def __init__(self, controller, user):
+        self.controller = controller
+        self.user = user
+        self.enqueued_at = time.monotonic()
+        self.deadline = self.enqueued_at + ADMISSION_DEADLINE
+        self.granted_at = None
+        self.closed = False
+        self.on_grant = None  # 轮到时额外调用（在授予的线程中），异步网关用它唤醒协程
+        self._event = threading.Event()
+
+    @property
+    def granted(self):
+        return self.granted_at is not None
+
+    def status(self):
+        """轮到时返回 None，否则返回 {'position', 'eta'}；超过截止时间时出队并抛出 AdmissionRejected"""
+        return self.controller.status(self)
+
+    def updates(self):
+        """阻塞等待，期间每隔 ADMISSION_UPDATE_INTERVAL 产出一次排队状态，轮到时结束"""
+        while True:
+            status = self.status()
+            if status is None:
+                return
+            yield status
+            self._event.wait(min(ADMISSION_UPDATE_INTERVAL, max(0.0, self.deadline - time.monotonic())))
+
+    def close(self):
+        """请求结束或放弃排队，可以重复调用"""
+        self.controller.close(self)
+
+
+class AdmissionController:
+    """一个模型的准入控制
+
+    请求数不超过可用 slot 数时直接放行，否则进入有界队列。slot 空出时在途
+    请求最少的用户优先，相同时按轮转顺序，一个用户开再多标签页也只能轮流
+    占用 slot。预计等待时间按排队位置、slot 数和最近请求的平均耗时估算，
+    超过 ADMISSION_DEADLINE 的请求在入队时直接拒绝。
+
+    可用 slot 数由调用方传入的函数给出（存活副本的 slot 总数减去其他进程
+    占用的），每次放行前重新读取；返回 None 表示没有副本的负载信息，不限制。
+    队列按进程维护，多个 worker 之间只通过 llama-server 报告的 slot 占用协调。
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+        self._waiting = OrderedDict()  # user -> deque[Ticket]，顺序即轮转顺序
+        self._queued = 0
+        self._running = 0
+        self._active = Counter()       # user -> 已放行、尚未结束的请求数
+        self._capacity_fn = None
+        self._capacity = None
+        self._avg_duration = None
+        self._stats = Counter()
+
+    def acquire(self, user, capacity_fn):
+        """返回 Ticket，可能已经放行，也可能在排队；无法排队时抛出 AdmissionRejected"""
+        with self._lock:
+            self._capacity_fn = capacity_fn
+            ticket = Ticket(self, user)
+            queue = self._waiting.get(user)
+            if self._queued >= ADMISSION_QUEUE_SIZE:
+                self._stats['rejected'] += 1
+                raise AdmissionRejected('排队人数已满，请稍后再试', 503, self._retry_after(self._queued))
+            if queue is not None and len(queue) >= ADMISSION_USER_QUEUE:
+                self._stats['rejected'] += 1
+                raise AdmissionRejected('排队中的请求过多，请等待之前的回复完成', 429, self._retry_after(len(queue)))
+            if queue is None:
+                queue = self._waiting[user] = deque()
+            queue.append(ticket)
+            self._queued += 1
+            self._dispatch()
+            if ticket.granted:
+                return ticket
+
+            position = self._positions()[ticket]
+            eta = self._eta(position)
+            if eta > ADMISSION_DEADLINE:
+                self._dequeue(ticket)
+                self._stats['rejected'] += 1
+                raise AdmissionRejected('模型繁忙，预计等待时间过长', 503, self._retry_after(position))
+            self._stats['queued'] += 1
+            return ticket
+
+    def status(self, ticket):
+        with self._lock:
+            self._dispatch()
+            if ticket.granted:
+                return None
+            if ticket.closed:
+                raise AdmissionRejected('请求已取消')
+            if time.monotonic() >= ticket.deadline:
+                self._dequeue(ticket)
+                ticket.closed = True
+                self._stats['timeouts'] += 1
+                raise AdmissionRejected('排队超时，请稍后再试', 503, self._retry_after(self._queued))
+            position = self._positions()[ticket]
+            return {'position': position + 1, 'eta': math.ceil(self._eta(position))}
+
+    def close(self, ticket):
+        with self._lock:
+            if ticket.closed:
+                return
+            ticket.closed = True
+            if not ticket.granted:
+                self._dequeue(ticket)
+                self._stats['cancelled'] += 1
+                return
+            self._running -= 1
+            self._active[ticket.user] -= 1
+            if not self._active[ticket.user]:
+                del self._active[ticket.user]
+            duration = time.monotonic() - ticket.granted_at
+            self._avg_duration = duration if self._avg_duration is None else 0.8 * self._avg_duration + 0.2 * duration
+            self._dispatch()
+
+    def _dispatch(self):
+        """在 slot 允许的范围内按公平顺序放行排队的请求"""
+        if not self._queued:
+            return
+        self._capacity = self._capacity_fn() if self._capacity_fn else None
+        while self._queued and (self._capacity is None or self._running < self._capacity):
+            # 在途请求最少的用户优先；min 取第一个最小值，配合下面移到队尾实现轮转
+            user = min(self._waiting, key=lambda u: self._active[u])
+            queue = self._waiting.pop(user)
+            ticket = queue.popleft()
+            if queue:
+                self._waiting[user] = queue
+            self._queued -= 1
+            self._grant(ticket)
+
+    def _grant(self, ticket):
+        ticket.granted_at = time.monotonic()
+        self._running += 1
+        self._active[ticket.user] += 1
+        self._stats['admitted'] += 1
+        self._stats['wait_seconds'] += ticket.granted_at - ticket.enqueued_at
+        ticket._event.set()
+        if ticket.on_grant is not None:
+            ticket.on_grant()
+
+    def _dequeue(self, ticket):
+        queue = self._waiting.get(ticket.user)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            self._queued -= 1
+            if not queue:
+                del self._waiting[ticket.user]
+
+    def _positions(self):
+        """按 _dispatch 的规则模拟出队顺序，返回 ticket -> 前面的请求数"""
+        active = Counter(self._active)
+        queues = OrderedDict((user, deque(queue)) for user, queue in self._waiting.items())
+        positions = {}
+        while queues:
+            user = min(queues, key=lambda u: active[u])
+            queue = queues.pop(user)
+            positions[queue.popleft()] = len(positions)
+            active[user] += 1
+            if queue:
+                queues[user] = queue
+        return positions
+
+    def _eta(self, position):
+        """前面还有 position 个请求时的预计等待秒数"""
+        duration = self._avg_duration if self._avg_duration is not None else ADMISSION_DEFAULT_DURATION
+        return (position + 1) * duration / max(self._capacity or 0, 1)
+
+    def _retry_after(self, position):
+        return max(1, math.ceil(self._eta(position)))
+
+    def snapshot(self):
+        with self._lock:
+            admitted = self._stats['admitted']
+            return {
+                'capacity': self._capacity,
+                'running': self._running,
+                'queued': self._queued,
+                'waiting_users': len(self._waiting),
+                'avg_duration': self._avg_duration,
+                'avg_wait': self._stats['wait_seconds'] / admitted if admitted else 0.0,
+                'admitted': admitted,
+                'queued_total': self._stats['queued'],
+                'rejected': self._stats['rejected'],
+                'timeouts': self._stats['timeouts'],
+                'cancelled': self._stats['cancelled']
+            }
+
+
+class Admission:
+    """按模型名创建的准入控制器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._controllers = {}
+
+    def controller(self, model):
+        with self._lock:
+            controller = self._controllers.get(model)
+            if controller is None:
+                controller = self._controllers[model] = AdmissionController(model)
+            return controller
+
+    def acquire(self, model, user, capacity_fn):
+        return self.controller(model).acquire(user, capacity_fn)
+
+    def snapshot(self):
+        with self._lock:
+            controllers = list(self._controllers.values())
+        return {c.model: c.snapshot() for c in controllers}
+
+
+admission = Admission()
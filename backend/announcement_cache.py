@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# 缓存最长有效期（秒）。公告的增删改会立即让本进程的缓存失效，
+# 其他 gunicorn worker 最多在这段时间后重新加载
+ANNOUNCEMENT_CACHE_TTL = float(os.getenv('ANNOUNCEMENT_CACHE_TTL', '10'))
+
+EMPTY_ANNOUNCEMENT = {
+    'content': '',
+    'display_start': None,
+    'display_end': None
+}
+
+
+class AnnouncementCache:
+    """当前生效公告的进程内缓存
+
+    读路径只做一次 SELECT 且只在缓存过期时执行；缓存在下一个
+    display_start/display_end 边界到达时自动过期，不再在每次请求时
+    UPDATE 过期公告。
+    """
+
+    def __init__(self, ttl=ANNOUNCEMENT_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entry = None  # (payload, body, etag, expires_at)
+
+    def get(self, db):
+        """返回 (payload, body, etag)，body 为序列化好的 JSON"""
+        entry = self._entry
+        if entry is None or time.time() >= entry[3]:
+            with self._lock:
+                entry = self._entry
+                if entry is None or time.time() >= entry[3]:
+                    entry = self._load(db)
+                    self._entry = entry
+        return entry[:3]
+
+    def invalidate(self):
+        self._entry = None
+
+    def _load(self, db):
+        cursor = db.cursor()
+        cursor.execute('''
+            SELECT content, display_start, display_end FROM announcements
+            WHERE datetime('now') BETWEEN datetime(display_start) AND datetime(display_end)
+            AND is_active = 1
+            ORDER BY created_at DESC LIMIT 1
+        ''')
+        row = cursor.fetchone()
+        if row:
+            payload = {
+                'content': row['content'],
+                'display_start': row['display_start'],
+                'display_end': row['display_end']
+            }
+        else:
+            payload = dict(EMPTY_ANNOUNCEMENT)
+
+        # 下一个可能改变结果的时间点：尚未开始公告的开始时间或生效中公告的结束时间
+        cursor.execute('''
+            SELECT MIN(boundary) FROM (
+                SELECT (julianday(display_start) - 2440587.5) * 86400.0 AS boundary
+                FROM announcements
+                WHERE is_active = 1 AND julianday(display_start) > julianday('now')
+                UNION ALL
+                SELECT (julianday(display_end) - 2440587.5) * 86400.0
+                FROM announcements
+                WHERE is_active = 1 AND julianday(display_end) >= julianday('now')
+            )
+        ''')
+        boundary = cursor.fetchone()[0]
+        expires_at = time.time() + self.ttl
+        if boundary is not None:
+            # datetime() 按秒比较，边界之后再多等 1 秒确保结果已经变化
+            expires_at = min(expires_at, boundary + 1)
+
+        body = json.dumps(payload)
+        etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+        return payload, body, etag, expires_at
+
+
+announcement_cache = AnnouncementCache()
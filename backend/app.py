@@ -1,15 +1,33 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt, get_jwt_identity, get_jwt_request_location
 from datetime import timedelta, datetime
-import bcrypt
 from dotenv import load_dotenv
 import os
-import sqlite3
-from contextlib import closing
 import json
-from functools import wraps
-import jwt
+import base64
+import time
+import threading
+from database import get_db, init_db, init_app as init_database
+from announcement_cache import announcement_cache, EMPTY_ANNOUNCEMENT
+from events import announcement_changed, stream as event_stream
+from auth import admin_required, role_cache
+from passwords import password_hasher, login_throttle, HasherBusy
+from model_registry import model_registry
+from search import search_index
+from completions import completion_stats, build_payload, relay, sse_event, StreamParser, UpstreamError
+from admission import admission, AdmissionRejected
+from router import upstream_router
+from usage_stats import usage_stats, USAGE_MAX_POINTS
+from write_queue import write_queue
+from data_versions import data_versions, versioned
+from archive import session_archive, init_app as init_archive
+from context_window import context_window, count_tokens, ContextTooLong
+from response_cache import response_cache, replay
+from rate_limits import rate_limiter, rate_limited, too_many_requests, QuotaExceeded
+from migrate import DB_AUTO_MIGRATE
+import compression
+import metrics
 
 load_dotenv()
 
@@ -19,21 +37,39 @@ CORS(app, supports_credentials=True)
 # JWT配置
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
+# EventSource 无法设置请求头，推送接口允许通过 ?token= 传递 /api/stream-token 签发的推送专用 token
+app.config['JWT_QUERY_STRING_NAME'] = 'token'
+STREAM_TOKEN_EXPIRES = int(os.getenv('STREAM_TOKEN_EXPIRES', '60'))  # 推送专用 token 的有效期（秒），只在建立连接时校验
 jwt = JWTManager(app)
 
-# 数据库配置
-DATABASE = 'users.db'
+@jwt.token_verification_loader
+def check_token_scope(jwt_header, jwt_data):
+    # 推送专用 token（带 stream 声明）只能用于 /api/events
+    return not jwt_data.get('stream') or request.endpoint == 'events'
 
-def init_db():
-    with closing(sqlite3.connect(DATABASE)) as db:
-        with open('schema.sql', 'r') as f:
-            db.cursor().executescript(f.read())
-        db.commit()
+@jwt.token_verification_failed_loader
+def token_scope_rejected(jwt_header, jwt_data):
+    return jsonify({'msg': 'Stream tokens are only accepted by /api/events'}), 401
+
+# 数据库连接在请求结束时归还连接池
+init_database(app)
+# 每个 worker 启动时把数据库升级到最新结构，已是最新版本时只读一次版本号，见 migrate.py
+if DB_AUTO_MIGRATE:
+    init_db()
+# 冷会话归档和空间回收的后台任务
+init_archive(app)
+
+def too_many_attempts(retry_after):
+    response = jsonify({'error': '尝试次数过多，请稍后再试'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
 
-def get_db():
-    db = sqlite3.connect(DATABASE)
-    db.row_factory = sqlite3.Row
-    return db
+def hasher_busy():
+    response = jsonify({'error': '服务繁忙，请稍后再试'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
 
 # 支持的模型列表
 AVAILABLE_MODELS = ['gpt-3.5', 'gpt-4', 'claude']
@@ -53,6 +89,10 @@ def register():
     if password != confirm_password:
         return jsonify({'error': '两次输入的密码不一致'}), 400
 
+    retry_after = login_throttle.check_register(request.remote_addr)
+    if retry_after:
+        return too_many_attempts(retry_after)
+
     db = get_db()
     cursor = db.cursor()
     
@@ -62,7 +102,10 @@ def register():
         return jsonify({'error': '用户名已存在'}), 400
 
     # 创建新用户
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    try:
+        hashed_password = password_hasher.hash(password)
+    except HasherBusy:
+        return hasher_busy()
     cursor.execute('''
         INSERT INTO users (username, email, password, current_model, is_admin)
         VALUES (?, ?, ?, ?, ?)
@@ -83,6 +126,12 @@ def login():
         print('登录失败: 缺少必要字段')
         return jsonify({'error': '请填写所有字段'}), 400
 
+    # 在计算哈希之前按用户名和 IP 限流，避免暴力破解占满哈希进程池
+    retry_after = login_throttle.check(username, request.remote_addr)
+    if retry_after:
+        print(f'登录失败: 用户 {username} 尝试次数过多')
+        return too_many_attempts(retry_after)
+
     db = get_db()
     cursor = db.cursor()
     cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
@@ -90,12 +139,25 @@ def login():
 
     if not user:
         print(f'登录失败: 用户 {username} 不存在')
+        login_throttle.failed(username, request.remote_addr)
         return jsonify({'error': '用户名或密码错误'}), 401
 
-    if not bcrypt.checkpw(password.encode('utf-8'), user['password']):
-        print(f'登录失败: 用户 {username} 密码错误')
-        return jsonify({'error': '用户名或密码错误'}), 401
+    try:
+        if not password_hasher.check(password, user['password']):
+            print(f'登录失败: 用户 {username} 密码错误')
+            login_throttle.failed(username, request.remote_addr)
+            return jsonify({'error': '用户名或密码错误'}), 401
+
+        # cost 配置变化后，登录成功时用新 cost 重新哈希
+        if password_hasher.needs_rehash(user['password']):
+            cursor.execute('UPDATE users SET password = ? WHERE id = ?',
+                           (password_hasher.hash(password), user['id']))
+            db.commit()
+    except HasherBusy:
+        print('登录失败: 密码校验繁忙')
+        return hasher_busy()
 
+    login_throttle.succeeded(username)
     print(f'用户 {username} 登录成功')
     access_token = create_access_token(identity=username)
     return jsonify({
@@ -153,6 +215,7 @@ def update_user():
         WHERE username = ?
     ''', (new_username, new_email, new_model or 'gpt-3.5', current_user))
     db.commit()
+    role_cache.invalidate(current_user)
     
     return jsonify({
         'message': '更新成功',
@@ -161,8 +224,34 @@ def update_user():
         'current_model': new_model or 'gpt-3.5'
     })
 
+# 分页参数
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def get_page_limit():
+    """读取 limit 参数，非法时返回 None"""
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if limit is None or limit <= 0:
+        return None
+    return min(limit, MAX_PAGE_SIZE)
+
+def encode_cursor(*values):
+    """把排序键编码成不透明的分页游标"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, size):
+    """解析分页游标，格式错误时返回 None"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
 @app.route('/api/chat', methods=['POST'])
 @jwt_required()
+@rate_limited('chat')
 def chat():
     current_user = get_jwt_identity()
     data = request.json
@@ -175,300 +264,666 @@ def chat():
     if model not in AVAILABLE_MODELS:
         return jsonify({'error': '无效的模型'}), 400
     
-    # 更新用户当前使用的模型
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute('UPDATE users SET current_model = ? WHERE username = ?', (model, current_user))
-    
-    # 更新模型使用统计
-    update_model_stats(model, True)  # 开始使用
-    
     # 这里可以添加与AI模型的交互逻辑
     response = f"AI ({model}): 我收到了你的消息: {message}"
     
-    # 保存到历史记录
-    cursor.execute('''
-        INSERT INTO chat_history (username, user, ai, model, timestamp)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (current_user, message, response, model, str(datetime.now())))
-    
-    # 更新模型使用统计
-    cursor.execute('''
-        UPDATE model_stats 
-        SET total_chats = total_chats + 1
-        WHERE model_name = ?
-    ''', (model,))
-    
-    db.commit()
+    # 保存到历史记录，时间戳为 Unix 时间（秒），便于排序和分页
+    timestamp = time.time()
+
+    def save(cursor):
+        # 更新用户当前使用的模型
+        cursor.execute('UPDATE users SET current_model = ? WHERE username = ?', (model, current_user))
+        cursor.execute('''
+            INSERT INTO chat_history (username, user, ai, model, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (current_user, message, response, model, timestamp))
+        record_id = cursor.lastrowid
+        search_index.add_history(cursor, current_user, record_id, message, response)
+        data_versions.bump(cursor, current_user)
+        return record_id
+
+    # 返回时记录已经提交
+    record_id = write_queue.run(save)
+
+    # 这里的模型只是占位（AVAILABLE_MODELS），不计入模型使用统计；
+    # 使用统计由 /api/chat/completions 按实际调用的模型记录
     
+    # 只返回本次新增的记录，完整历史通过 /api/history 分页获取
     return jsonify({
         'response': response,
-        'history': get_history()
+        'record': {
+            'id': record_id,
+            'user': message,
+            'ai': response,
+            'model': model,
+            'timestamp': timestamp,
+            'cursor': encode_cursor(timestamp, record_id)
+        }
     })
 
+# 聊天历史按时间倒序分页
+# before: 获取比游标更早的记录；since: 获取比游标更新的记录（用于增量同步）
+# next_cursor 用于沿同一方向继续获取，没有更多数据时为 null
 @app.route('/api/history', methods=['GET'])
 @jwt_required()
+@versioned
 def get_history():
     current_user = get_jwt_identity()
+    limit = get_page_limit()
+    if limit is None:
+        return jsonify({'error': '无效的分页参数'}), 400
+
+    before = request.args.get('before')
+    since = request.args.get('since')
+    if before and since:
+        return jsonify({'error': 'before 和 since 不能同时使用'}), 400
+
     db = get_db()
     cursor = db.cursor()
-    cursor.execute('SELECT * FROM chat_history WHERE username = ? ORDER BY timestamp DESC', (current_user,))
+    if since:
+        position = decode_cursor(since, 2)
+        if position is None:
+            return jsonify({'error': '无效的游标'}), 400
+        cursor.execute('''
+            SELECT id, user, ai, model, timestamp FROM chat_history
+            WHERE username = ? AND (timestamp, id) > (?, ?)
+            ORDER BY timestamp, id LIMIT ?
+        ''', (current_user, position[0], position[1], limit + 1))
+    elif before:
+        position = decode_cursor(before, 2)
+        if position is None:
+            return jsonify({'error': '无效的游标'}), 400
+        cursor.execute('''
+            SELECT id, user, ai, model, timestamp FROM chat_history
+            WHERE username = ? AND (timestamp, id) < (?, ?)
+            ORDER BY timestamp DESC, id DESC LIMIT ?
+        ''', (current_user, position[0], position[1], limit + 1))
+    else:
+        cursor.execute('''
+            SELECT id, user, ai, model, timestamp FROM chat_history
+            WHERE username = ?
+            ORDER BY timestamp DESC, id DESC LIMIT ?
+        ''', (current_user, limit + 1))
     history = cursor.fetchall()
-    
-    return jsonify([{
-        'id': row['id'],
-        'user': row['user'],
-        'ai': row['ai'],
-        'model': row['model'],
-        'timestamp': row['timestamp']
-    } for row in history])
 
+    next_cursor = None
+    if len(history) > limit:
+        history = history[:limit]
+        next_cursor = encode_cursor(history[-1]['timestamp'], history[-1]['id'])
+    if since:
+        history.reverse()
+
+    return jsonify({
+        'history': [{
+            'id': row['id'],
+            'user': row['user'],
+            'ai': row['ai'],
+            'model': row['model'],
+            'timestamp': row['timestamp'],
+            'cursor': encode_cursor(row['timestamp'], row['id'])
+        } for row in history],
+        'next_cursor': next_cursor
+    })
+
+# 会话消息的合法角色
+MESSAGE_ROLES = ('system', 'user', 'assistant')
+
+def validate_messages(messages):
+    """校验消息列表，返回只包含 role/content 的副本，格式错误时返回 None"""
+    if not isinstance(messages, list):
+        return None
+    result = []
+    for msg in messages:
+        if not isinstance(msg, dict):
+            return None
+        role = msg.get('role')
+        content = msg.get('content', '')
+        if role not in MESSAGE_ROLES or not isinstance(content, str):
+            return None
+        result.append({'role': role, 'content': content})
+    return result
+
+def session_messages_json(cursor, session_id):
+    """会话消息的 JSON 数组（UTF-8 字节），直接拼接写入时生成的 message_json，不经过 Python 对象
+
+    按 BLOB 读取，SQLite 中的 UTF-8 字节原样复制出来，不需要解码成 str 再编码。
+    """
+    raw = cursor.connection.cursor()
+    raw.row_factory = None
+    raw.execute('SELECT CAST(message_json AS BLOB) FROM session_messages WHERE session_id = ? ORDER BY seq',
+                (session_id,))
+    rows = raw.fetchall()
+    if not rows:
+        # 冷会话的消息已归档，解压后同样是 JSON 数组
+        archived = session_archive.messages_json(cursor, session_id)
+        if archived is not None:
+            return archived
+    return b'[' + b','.join(row[0] for row in rows) + b']'
+
+def json_with_raw(fields, **raw):
+    """fields 正常序列化，raw 中的值是已经序列化好的 JSON（bytes），原样拼接进响应"""
+    parts = [json.dumps(fields, ensure_ascii=False)[:-1].encode('utf-8')]
+    for key, value in raw.items():
+        parts += [f', {json.dumps(key)}: '.encode('utf-8'), value]
+    parts.append(b'}')
+    return app.response_class(b''.join(parts), mimetype='application/json')
+
+def count_session_messages(cursor, session_id):
+    """只在写入会话之前调用，已归档的会话先还原"""
+    session_archive.restore(cursor, session_id)
+    cursor.execute('SELECT COALESCE(MAX(seq) + 1, 0) FROM session_messages WHERE session_id = ?', (session_id,))
+    return cursor.fetchone()[0]
+
+def write_session_messages(cursor, username, session_id, start, messages):
+    """用 messages 替换会话中从 start 开始的消息，写入量只与 messages 的长度有关
+
+    搜索索引只更新内容有变化的消息。已归档的会话先还原再修改。
+    """
+    session_archive.restore(cursor, session_id)
+    cursor.execute('SELECT seq, content FROM session_messages WHERE session_id = ? AND seq >= ?',
+                   (session_id, start))
+    old = cursor.fetchall()
+    # message_json 由 SQLite 按已校验的 role/content 生成，读取时原样拼接；token 数只在这里计算一次
+    cursor.executemany('''
+        INSERT INTO session_messages (session_id, seq, role, content, message_json, tokens)
+        VALUES (?1, ?2, ?3, ?4, json_object('role', ?3, 'content', ?4), ?5)
+        ON CONFLICT (session_id, seq) DO UPDATE SET
+            role = excluded.role, content = excluded.content, message_json = excluded.message_json,
+            tokens = excluded.tokens
+    ''', [(session_id, start + i, msg['role'], msg['content'], count_tokens(msg['content']))
+          for i, msg in enumerate(messages)])
+    cursor.execute('DELETE FROM session_messages WHERE session_id = ? AND seq >= ?',
+                   (session_id, start + len(messages)))
+    cursor.execute('UPDATE chat_sessions SET message_count = ?, updatedAt = ? WHERE id = ?',
+                   (start + len(messages), str(datetime.now()), session_id))
+    search_index.replace_messages(cursor, username, session_id, old, messages, start)
+
+def session_belongs_to(cursor, session_id, username):
+    cursor.execute('SELECT id FROM chat_sessions WHERE id = ? AND username = ?', (session_id, username))
+    return cursor.fetchone() is not None
+
+def finish_completion(username, session_id, messages, model_name, content, ttft, tokens, generation_seconds,
+                      prompt_tokens=None, window=None):
+    """一次补全结束后记录统计，并保存本轮的用户消息和回复（同步路由和异步网关共用）
+
+    messages 是客户端发送的完整消息列表，window 是实际发送给上游的部分。
+    """
+    usage_stats.record(model_name, username, prompt_tokens, tokens, ttft, generation_seconds)
+    rate_limiter.consume(username, model_name, tokens)
+    if window is not None:
+        context_window.calibrate(model_name, window.estimated, prompt_tokens)
+    if ttft is not None:
+        completion_stats.record(model_name, ttft, tokens, generation_seconds)
+        print(f"补全完成 - 模型: {model_name}, 首 token: {ttft * 1000:.0f}ms, "
+              f"{tokens} tokens, {tokens / generation_seconds if generation_seconds else 0:.1f} tokens/s")
+    if not content:
+        return
+
+    def save(cursor):
+        start = min(len(messages) - 1, count_session_messages(cursor, session_id))
+        write_session_messages(cursor, username, session_id, start, [
+            messages[-1],
+            {'role': 'assistant', 'content': content}
+        ])
+        if window is not None:
+            context_window.save(cursor, session_id, window)
+        data_versions.bump(cursor, username)
+
+    try:
+        write_queue.run(save)
+    except Exception as e:
+        print(f"Error saving completion for session {session_id}: {str(e)}")
+
+# 会话列表只返回索引信息，按创建时间倒序分页，消息通过单个会话接口按需加载
 @app.route('/api/chat/sessions', methods=['GET'])
 @jwt_required()
+@versioned
 def get_chat_sessions():
     try:
         current_user = get_jwt_identity()
+        limit = get_page_limit()
+        if limit is None:
+            return jsonify({'error': '无效的分页参数'}), 400
+
         db = get_db()
         cursor = db.cursor()
-        cursor.execute('SELECT * FROM chat_sessions WHERE username = ?', (current_user,))
+        if request.args.get('cursor'):
+            position = decode_cursor(request.args['cursor'], 2)
+            if position is None:
+                return jsonify({'error': '无效的游标'}), 400
+            cursor.execute('''
+                SELECT id, title, createdAt, updatedAt, message_count FROM chat_sessions
+                WHERE username = ? AND (createdAt, id) < (?, ?)
+                ORDER BY createdAt DESC, id DESC LIMIT ?
+            ''', (current_user, position[0], position[1], limit + 1))
+        else:
+            cursor.execute('''
+                SELECT id, title, createdAt, updatedAt, message_count FROM chat_sessions
+                WHERE username = ?
+                ORDER BY createdAt DESC, id DESC LIMIT ?
+            ''', (current_user, limit + 1))
         sessions = cursor.fetchall()
-        
-        result = []
-        for row in sessions:
-            try:
-                # 尝试解析 messages 字段
-                if row['messages']:
-                    try:
-                        messages = json.loads(row['messages'])
-                    except json.JSONDecodeError:
-                        # 如果解析失败，尝试修复格式
-                        messages_str = row['messages'].replace("'", '"')
-                        try:
-                            messages = json.loads(messages_str)
-                        except json.JSONDecodeError:
-                            messages = []
-                else:
-                    messages = []
-                
-                result.append({
-                    'id': row['id'],
-                    'title': row['title'],
-                    'messages': messages,
-                    'createdAt': row['createdAt']
-                })
-            except Exception as e:
-                print(f"Error processing session {row['id']}: {str(e)}")
-                continue
-        
-        return jsonify(result)
+
+        next_cursor = None
+        if len(sessions) > limit:
+            sessions = sessions[:limit]
+            next_cursor = encode_cursor(sessions[-1]['createdAt'], sessions[-1]['id'])
+
+        return jsonify({
+            'sessions': [{
+                'id': row['id'],
+                'title': row['title'],
+                'createdAt': row['createdAt'],
+                'updatedAt': row['updatedAt'] or row['createdAt'],
+                'messageCount': row['message_count']
+            } for row in sessions],
+            'next_cursor': next_cursor
+        })
     except Exception as e:
         print(f"Error in get_chat_sessions: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chat/sessions/<int:session_id>', methods=['GET'])
+@jwt_required()
+@versioned
+def get_chat_session(session_id):
+    try:
+        current_user = get_jwt_identity()
+        db = get_db()
+        cursor = db.cursor()
+
+        # 检查会话是否存在且属于当前用户
+        cursor.execute('SELECT * FROM chat_sessions WHERE id = ? AND username = ?', (session_id, current_user))
+        session = cursor.fetchone()
+        if not session:
+            return jsonify({'error': '会话不存在'}), 404
+
+        return json_with_raw({
+            'id': session_id,
+            'title': session['title'],
+            'createdAt': session['createdAt'],
+            'updatedAt': session['updatedAt'] or session['createdAt']
+        }, messages=session_messages_json(cursor, session_id))
+    except Exception as e:
+        print(f"Error in get_chat_session: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/chat/sessions', methods=['POST'])
 @jwt_required()
+@rate_limited('writes')
 def create_chat_session():
     try:
         current_user = get_jwt_identity()
-        data = request.json
+        data = request.json or {}
         title = data.get('title', '新对话')
-        messages = data.get('messages', [])
-        
-        db = get_db()
-        cursor = db.cursor()
-        cursor.execute('''
-            INSERT INTO chat_sessions (username, title, messages, createdAt)
-            VALUES (?, ?, ?, ?)
-        ''', (current_user, title, json.dumps(messages, ensure_ascii=False), str(datetime.now())))
-        db.commit()
-        
-        session_id = cursor.lastrowid
-        return jsonify({
+        messages = validate_messages(data.get('messages', []))
+        if messages is None:
+            return jsonify({'error': '消息格式错误'}), 400
+
+        created_at = str(datetime.now())
+
+        def save(cursor):
+            cursor.execute('''
+                INSERT INTO chat_sessions (username, title, messages, createdAt, updatedAt)
+                VALUES (?, ?, '[]', ?, ?)
+            ''', (current_user, title, created_at, created_at))
+            session_id = cursor.lastrowid
+            search_index.replace_title(cursor, current_user, session_id, None, title)
+            write_session_messages(cursor, current_user, session_id, 0, messages)
+            data_versions.bump(cursor, current_user)
+            return session_id, session_messages_json(cursor, session_id)
+
+        session_id, messages_json = write_queue.run(save)
+
+        return json_with_raw({
             'id': session_id,
             'title': title,
-            'messages': messages,
-            'createdAt': str(datetime.now())
-        })
+            'createdAt': created_at
+        }, messages=messages_json)
     except Exception as e:
         print(f"Error in create_chat_session: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/chat/sessions/<int:session_id>', methods=['PUT'])
 @jwt_required()
+@rate_limited('writes')
 def update_chat_session(session_id):
     try:
         current_user = get_jwt_identity()
         data = request.json
         title = data.get('title')
         messages = data.get('messages')
-        
-        db = get_db()
-        cursor = db.cursor()
-        
-        # 检查会话是否存在且属于当前用户
-        cursor.execute('SELECT * FROM chat_sessions WHERE id = ? AND username = ?', (session_id, current_user))
-        session = cursor.fetchone()
-        if not session:
-            return jsonify({'error': '会话不存在'}), 404
-        
-        # 更新会话
-        if title is not None:
-            cursor.execute('UPDATE chat_sessions SET title = ? WHERE id = ?', (title, session_id))
         if messages is not None:
-            cursor.execute('UPDATE chat_sessions SET messages = ? WHERE id = ?', 
-                         (json.dumps(messages, ensure_ascii=False), session_id))
-        db.commit()
-        
-        return jsonify({
+            messages = validate_messages(messages)
+            if messages is None:
+                return jsonify({'error': '消息格式错误'}), 400
+
+        def save(cursor):
+            # 检查会话是否存在且属于当前用户
+            cursor.execute('SELECT * FROM chat_sessions WHERE id = ? AND username = ?', (session_id, current_user))
+            session = cursor.fetchone()
+            if not session:
+                return None, None
+
+            # 更新会话
+            if title is not None:
+                cursor.execute('UPDATE chat_sessions SET title = ?, updatedAt = ? WHERE id = ?',
+                               (title, str(datetime.now()), session_id))
+                search_index.replace_title(cursor, current_user, session_id, session['title'], title)
+            if messages is not None:
+                write_session_messages(cursor, current_user, session_id, 0, messages)
+            data_versions.bump(cursor, current_user)
+            return session, session_messages_json(cursor, session_id)
+
+        session, messages_json = write_queue.run(save)
+        if session is None:
+            return jsonify({'error': '会话不存在'}), 404
+
+        return json_with_raw({
             'id': session_id,
             'title': title or session['title'],
-            'messages': messages or json.loads(session['messages']) if session['messages'] else [],
             'createdAt': session['createdAt']
-        })
+        }, messages=messages_json)
     except Exception as e:
         print(f"Error in update_chat_session: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# 增量保存会话消息：只发送新增或变化的消息
+# start 为第一条变化消息的序号，缺省时追加到末尾；start 之后原有的消息会被 messages 替换
+@app.route('/api/chat/sessions/<int:session_id>/messages', methods=['PATCH'])
+@jwt_required()
+@rate_limited('writes')
+def patch_session_messages(session_id):
+    try:
+        current_user = get_jwt_identity()
+        data = request.json or {}
+        messages = validate_messages(data.get('messages', []))
+        if messages is None:
+            return jsonify({'error': '消息格式错误'}), 400
+
+        requested_start = data.get('start')
+
+        def save(cursor):
+            # 检查会话是否存在且属于当前用户，返回 (错误, 状态码) 或写入的起始位置
+            cursor.execute('SELECT id FROM chat_sessions WHERE id = ? AND username = ?', (session_id, current_user))
+            if not cursor.fetchone():
+                return '会话不存在', 404
+
+            count = count_session_messages(cursor, session_id)
+            start = count if requested_start is None else requested_start
+            if not isinstance(start, int) or isinstance(start, bool) or start < 0 or start > count:
+                return '无效的起始位置', 400
+
+            write_session_messages(cursor, current_user, session_id, start, messages)
+            data_versions.bump(cursor, current_user)
+            return start
+
+        start = write_queue.run(save)
+        if isinstance(start, tuple):
+            return jsonify({'error': start[0]}), start[1]
+
+        return jsonify({
+            'id': session_id,
+            'count': start + len(messages)
+        })
+    except Exception as e:
+        print(f"Error in patch_session_messages: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# 搜索内容的最大长度
+MAX_SEARCH_LENGTH = 200
+
+# 全文搜索：在自己的会话标题、会话消息和聊天历史中搜索，按相关度排序
+# next_cursor 用于获取下一页，没有更多结果时为 null
+@app.route('/api/search', methods=['GET'])
+@jwt_required()
+@rate_limited('search')
+def search_messages():
+    current_user = get_jwt_identity()
+    q = request.args.get('q', '').strip()
+    if not q or len(q) > MAX_SEARCH_LENGTH:
+        return jsonify({'error': '无效的搜索内容'}), 400
+    limit = get_page_limit()
+    if limit is None:
+        return jsonify({'error': '无效的分页参数'}), 400
+
+    offset = 0
+    cursor = request.args.get('cursor')
+    if cursor:
+        position = decode_cursor(cursor, 1)
+        if position is None or not isinstance(position[0], int) or position[0] < 0:
+            return jsonify({'error': '无效的游标'}), 400
+        offset = position[0]
+
+    results, has_more = search_index.search(get_db().cursor(), current_user, q, limit, offset)
+    return jsonify({
+        'results': results,
+        'next_cursor': encode_cursor(offset + limit) if has_more else None
+    })
+
+# 流式补全代理：通过连接池转发到模型所在的 llama-server，边收边发
+# 回复结束（包括用户中途停止）后在服务端保存一次本轮的用户消息和回复
+@app.route('/api/chat/completions', methods=['POST'])
+@jwt_required()
+@rate_limited('completions')
+def chat_completions():
+    current_user = get_jwt_identity()
+    data = request.json or {}
+    session_id = data.get('session_id')
+    model = data.get('model')
+    messages = validate_messages(data.get('messages'))
+    if not model or not messages or messages[-1]['role'] != 'user':
+        return jsonify({'error': '消息格式错误'}), 400
+
+    cursor = get_db().cursor()
+    if not session_belongs_to(cursor, session_id, current_user):
+        return jsonify({'error': '会话不存在'}), 404
+
+    model_name = model_registry.resolve(model)
+    urls = model_registry.upstreams(model)
+    if not urls:
+        return jsonify({'error': '模型当前不可用'}), 503
+    try:
+        rate_limiter.check_quota(cursor, current_user, model_name)
+    except QuotaExceeded as e:
+        return too_many_requests(e.message, e.retry_after)
+
+    try:
+        window = context_window.assemble(cursor, session_id, model_name, messages, data)
+    except ContextTooLong:
+        return jsonify({'error': '消息超出模型的上下文长度'}), 400
+
+    cache_key = response_cache.prepare(model_name, window.messages, data)
+    cached = cache_key and response_cache.lookup(cursor, cache_key)
+    if cached:
+        # 命中回复缓存时不占用模型 slot，直接回放
+        save = run_once(lambda: finish_completion(current_user, session_id, messages, model_name, cached.content,
+                                                  None, 0, 0.0, window=window))
+        return event_stream_response(cached_completion(model_name, cached, save), save)
+
+    try:
+        ticket = admission.acquire(model_name, current_user, lambda: upstream_router.capacity(urls))
+    except AdmissionRejected as e:
+        return admission_rejected(e)
+
+    payload = build_payload(model_name, window.messages, data)
+    opened = []  # 已建立的上游连接的 finish
+
+    def open_upstream():
+        lease, upstream = upstream_router.open_stream(urls, payload, session_key=session_id)
+
+        @run_once
+        def finish(parser):
+            upstream.close()
+            ticket.close()
+            upstream_router.end(lease, parser.prompt_tokens, parser.cached_tokens)
+            finish_completion(current_user, session_id, messages, model_name, *parser.result(),
+                              parser.prompt_tokens, window)
+            if cache_key:
+                response_cache.store(cache_key, parser)
+
+        opened.append(finish)
+        return relay(upstream, finish)
+
+    def cleanup():
+        ticket.close()
+        for finish in opened:
+            finish(StreamParser())
+
+    if ticket.granted:
+        # 不需要排队时和原来一样，上游错误以状态码返回
+        try:
+            body = open_upstream()
+        except UpstreamError as e:
+            ticket.close()
+            print(f"Error in chat_completions: {str(e)}")
+            return jsonify({'error': '模型服务请求失败'}), 502
+    else:
+        body = queued_completion(ticket, open_upstream)
+    return event_stream_response(body, cleanup)
+
+def event_stream_response(body, cleanup=None):
+    """流式响应；cleanup 在响应关闭时执行
+
+    客户端在响应开始前断开时生成器从未开始迭代，关闭它不会执行其中的
+    finally，票据、上游连接等由 cleanup 释放。cleanup 在生成器关闭之后
+    执行，需要可以重复调用。
+    """
+    response = app.response_class(body, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    if cleanup is not None:
+        response.call_on_close(cleanup)
+    return response
+
+def run_once(fn):
+    """只执行一次的回调，之后的调用什么也不做"""
+    lock = threading.Lock()
+
+    def wrapper(*args):
+        if lock.acquire(blocking=False):
+            return fn(*args)
+    return wrapper
+
+def cached_completion(model_name, cached, save):
+    """回放缓存的回复，结束后和正常补全一样保存本轮消息（不计入生成的 token 数）"""
+    try:
+        yield from replay(model_name, cached.content)
+    finally:
+        save()
+
+def admission_rejected(e):
+    response = jsonify({'error': e.message})
+    response.status_code = e.status
+    if e.retry_after:
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def queued_completion(ticket, open_upstream):
+    """排队期间推送 {"queue": {"position", "eta"}}，轮到后转发上游的流
+
+    响应已经开始，之后的错误以 {"error": ...} 数据块告知客户端。客户端在
+    排队时断开，生成器被关闭，请求随之出队。
+    """
+    try:
+        for status in ticket.updates():
+            yield sse_event({'queue': status})
+        relayed = open_upstream()
+    except AdmissionRejected as e:
+        yield sse_event({'error': e.message})
+        return
+    except UpstreamError as e:
+        ticket.close()
+        print(f"Error in chat_completions: {str(e)}")
+        yield sse_event({'error': '模型服务请求失败'})
+        return
+    finally:
+        if not ticket.granted:
+            ticket.close()
+    yield from relayed
+
 @app.route('/api/chat/sessions/<int:session_id>', methods=['DELETE'])
 @jwt_required()
+@rate_limited('writes')
 def delete_chat_session(session_id):
     try:
         current_user = get_jwt_identity()
-        db = get_db()
-        cursor = db.cursor()
-        
-        # 检查会话是否存在且属于当前用户
-        cursor.execute('SELECT * FROM chat_sessions WHERE id = ? AND username = ?', (session_id, current_user))
-        session = cursor.fetchone()
-        if not session:
+
+        def delete(cursor):
+            # 检查会话是否存在且属于当前用户
+            cursor.execute('SELECT * FROM chat_sessions WHERE id = ? AND username = ?', (session_id, current_user))
+            session = cursor.fetchone()
+            if not session:
+                return False
+
+            # 删除会话，已归档的消息先还原以便从搜索索引中移除
+            session_archive.restore(cursor, session_id)
+            search_index.remove_session(cursor, current_user, session_id, session['title'])
+            cursor.execute('DELETE FROM session_messages WHERE session_id = ?', (session_id,))
+            cursor.execute('DELETE FROM chat_sessions WHERE id = ?', (session_id,))
+            data_versions.bump(cursor, current_user)
+            return True
+
+        if not write_queue.run(delete):
             return jsonify({'error': '会话不存在'}), 404
         
-        # 删除会话
-        cursor.execute('DELETE FROM chat_sessions WHERE id = ?', (session_id,))
-        db.commit()
-        
         return jsonify({'message': '删除成功'})
     except Exception as e:
         print(f"Error in delete_chat_session: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-# JWT验证装饰器
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            token = request.headers['Authorization'].split(' ')[1]
-        
-        if not token:
-            return jsonify({'message': '缺少token'}), 401
-        
-        try:
-            data = jwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-            current_user = data['username']
-        except:
-            return jsonify({'message': '无效的token'}), 401
-        
-        return f(current_user, *args, **kwargs)
-    
-    return decorated
-
-# 管理员验证装饰器
-def admin_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            token = request.headers['Authorization'].split(' ')[1]
-        
-        if not token:
-            return jsonify({'message': '缺少token'}), 401
-        
-        try:
-            data = jwt.decode(token, app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-            current_user = data['username']
-            
-            # 检查用户是否是管理员
-            conn = sqlite3.connect(DATABASE)
-            c = conn.cursor()
-            c.execute('SELECT is_admin FROM users WHERE username = ?', (current_user,))
-            result = c.fetchone()
-            conn.close()
-            
-            if not result or not result[0]:
-                return jsonify({'message': '需要管理员权限'}), 403
-                
-        except:
-            return jsonify({'message': '无效的token'}), 401
-        
-        return f(current_user, *args, **kwargs)
-    
-    return decorated
-
 # 获取公告内容
+# 所有客户端每 5 秒轮询一次，结果来自进程内缓存并带强 ETag，内容未变时返回 304
 @app.route('/api/admin/announcement', methods=['GET'])
 @jwt_required()
 def get_announcement():
     try:
-        db = get_db()
-        cursor = db.cursor()
-        
-        # 自动禁用已过期的公告
-        cursor.execute('''
-            UPDATE announcements 
-            SET is_active = 0
-            WHERE datetime(display_end) < datetime('now') AND is_active = 1
-        ''')
-        db.commit()
-        
-        # 获取当前时间在显示时间范围内且启用的最新公告
-        cursor.execute('''
-            SELECT content, display_start, display_end FROM announcements 
-            WHERE datetime('now') BETWEEN datetime(display_start) AND datetime(display_end)
-            AND is_active = 1
-            ORDER BY created_at DESC LIMIT 1
-        ''')
-        result = cursor.fetchone()
-        
-        if result:
-            content = result['content']
-            display_start = result['display_start']
-            display_end = result['display_end']
-            return jsonify({
-                'content': content,
-                'display_start': display_start,
-                'display_end': display_end
-            })
+        _, body, etag = announcement_cache.get(get_db())
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
         else:
-            # 返回空内容但确保结构一致
-            return jsonify({
-                'content': '',
-                'display_start': None,
-                'display_end': None
-            })
+            response = app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         print('Error in get_announcement:', str(e))
         # 返回空内容但确保结构一致
-        return jsonify({
-            'content': '',
-            'display_start': None,
-            'display_end': None
-        }), 500
+        return jsonify(EMPTY_ANNOUNCEMENT), 500
+
+# 推送专用 token：有效期 STREAM_TOKEN_EXPIRES 秒，只能用于建立 /api/events 连接，
+# 放在查询参数中也不会泄露可以访问其他接口的 access token
+@app.route('/api/stream-token', methods=['POST'])
+@jwt_required()
+def create_stream_token():
+    token = create_access_token(identity=get_jwt_identity(), additional_claims={'stream': True},
+                                expires_delta=timedelta(seconds=STREAM_TOKEN_EXPIRES))
+    return jsonify({'token': token, 'expires_in': STREAM_TOKEN_EXPIRES})
+
+# 服务端推送（SSE）：公告变化和模型上下线
+# 需要以 gevent 等异步 worker 运行 gunicorn，或者交给 gateway.py 异步网关承载
+@app.route('/api/events', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def events():
+    if get_jwt_request_location() == 'query_string' and not get_jwt().get('stream'):
+        return jsonify({'msg': 'Only stream tokens are allowed in the query string'}), 401
+    # 前端换新 token 重连时无法设置 Last-Event-ID，改用查询参数传递
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    response = app.response_class(
+        event_stream(last_event_id),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 # 更新公告内容
 @app.route('/api/admin/announcement', methods=['POST'])
-@jwt_required()
+@admin_required
 def update_announcement():
-    current_user = get_jwt_identity()
     db = get_db()
     cursor = db.cursor()
     
-    # 检查用户是否是管理员
-    cursor.execute('SELECT is_admin FROM users WHERE username = ?', (current_user,))
-    result = cursor.fetchone()
-    if not result or not result['is_admin']:
-        return jsonify({'error': '需要管理员权限'}), 403
-    
     data = request.json
     content = data.get('content', '')
     display_start = data.get('display_start')
@@ -483,33 +938,123 @@ def update_announcement():
         VALUES (?, ?, ?, ?)
     ''', (content, display_start, display_end, is_active))
     db.commit()
+    announcement_changed()
     
     return jsonify({'message': '公告更新成功'})
 
-# 获取统计数据
+# 模型使用统计：从按时间桶汇总的表中查询 [start, end)，按 step 秒聚合为时间序列
+# start/end 为 Unix 时间（秒），默认最近 24 小时；其他 worker 的数据最多延迟 USAGE_FLUSH_INTERVAL 秒
 @app.route('/api/admin/stats', methods=['GET'])
-@jwt_required()
 @admin_required
 def get_stats():
-    return jsonify({'message': 'success'})
+    try:
+        end = float(request.args.get('end', time.time()))
+        start = float(request.args.get('start', end - 86400))
+        step = int(request.args.get('step', 3600 if end - start <= 7 * 86400 else 86400))
+    except ValueError:
+        return jsonify({'error': '无效的时间范围'}), 400
+    if (start >= end or step <= 0 or step % usage_stats.bucket_seconds
+            or (end - start) / step > USAGE_MAX_POINTS):
+        return jsonify({'error': '无效的时间范围'}), 400
+
+    # 先写出本进程尚未写入的计数
+    usage_stats.flush()
+    cursor = get_db().cursor()
+    model = request.args.get('model') or None
+    totals, series = usage_stats.query(cursor, start, end, step, model)
+    cursor.execute('SELECT COUNT(*) FROM users')
+    total_users = cursor.fetchone()[0]
+    return jsonify({
+        'start': start,
+        'end': end,
+        'step': step,
+        'bucket_seconds': usage_stats.bucket_seconds,
+        'total_users': total_users,
+        'total_chats': sum(stats['chats'] for stats in totals.values()),
+        'active_users': usage_stats.active_users(cursor, start, end, model),
+        'models': totals,
+        'series': series
+    })
+
+# 数据库文件大小、空闲空间、冷会话归档节省的空间
+@app.route('/api/admin/storage', methods=['GET'])
+@admin_required
+def get_storage():
+    return jsonify(session_archive.storage(get_db().cursor()))
+
+# 立即执行一轮冷会话归档和空间回收（平时由后台任务每隔 MAINTENANCE_INTERVAL 秒执行）
+@app.route('/api/admin/storage/maintenance', methods=['POST'])
+@admin_required
+def run_maintenance():
+    result = session_archive.run_once()
+    if result is None:
+        return jsonify({'error': '整理任务正在执行'}), 409
+    return jsonify(result)
+
+# 模型副本的负载和会话亲和统计（当前 worker 进程）
+@app.route('/api/admin/routing', methods=['GET'])
+@admin_required
+def get_routing():
+    return jsonify({
+        'replicas': upstream_router.snapshot(),
+        'affinity': upstream_router.affinity_stats(),
+        'admission': admission.snapshot(),
+        'completions': completion_stats.snapshot(),
+        'context': context_window.snapshot(),
+        'response_cache': response_cache.snapshot()
+    })
+
+# 每天的 token 额度规则和各组接口的限流配置
+@app.route('/api/admin/quotas', methods=['GET'])
+@admin_required
+def get_quotas():
+    rules = rate_limiter.rules(get_db().cursor())
+    return jsonify({
+        'default_daily_tokens': rate_limiter.default_quota,
+        'rules': [{'username': username, 'model': model, 'daily_tokens': daily_tokens}
+                  for (username, model), daily_tokens in sorted(rules.items())],
+        'rate_limits': {group: {'burst': burst, 'seconds': seconds}
+                        for group, (burst, seconds) in rate_limiter.limits.items()}
+    })
+
+# 设置一条额度规则，username / model 可以为 *；daily_tokens 为 0 表示不限，为 null 时删除规则
+@app.route('/api/admin/quotas', methods=['PUT'])
+@admin_required
+def set_quota():
+    data = request.json or {}
+    username = data.get('username')
+    model = data.get('model')
+    daily_tokens = data.get('daily_tokens')
+    if (not isinstance(username, str) or not username or not isinstance(model, str) or not model
+            or (daily_tokens is not None and (not isinstance(daily_tokens, int) or isinstance(daily_tokens, bool)
+                                              or daily_tokens < 0))):
+        return jsonify({'error': '无效的额度规则'}), 400
+    if model != '*':
+        model = model_registry.resolve(model) or model
+    write_queue.run(rate_limiter.set_rule, username, model, daily_tokens)
+    rate_limiter.rules_changed()
+    return jsonify({'username': username, 'model': model, 'daily_tokens': daily_tokens})
 
-# 更新模型使用统计
-def update_model_stats(model_name, is_start=True):
-    pass
+# 用户今天在各模型上已生成的 token 数和额度
+@app.route('/api/admin/quotas/usage', methods=['GET'])
+@admin_required
+def get_quota_usage():
+    username = request.args.get('username', '').strip()
+    if not username:
+        return jsonify({'error': '缺少用户名'}), 400
+    return jsonify({
+        'username': username,
+        'models': rate_limiter.usage(get_db().cursor(), username, model_registry.names())
+    })
 
 @app.route('/api/admin/check', methods=['GET'])
 @jwt_required()
 def check_admin_status():
-    current_user = get_jwt_identity()
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute('SELECT is_admin FROM users WHERE username = ?', (current_user,))
-    result = cursor.fetchone()
-    
-    if not result:
+    is_admin = role_cache.is_admin(get_jwt_identity())
+    if is_admin is None:
         return jsonify({'error': '用户不存在'}), 404
         
-    return jsonify({'is_admin': bool(result['is_admin'])})
+    return jsonify({'is_admin': is_admin})
 
 @app.route('/api/agreement', methods=['GET'])
 def get_agreement():
@@ -527,7 +1072,6 @@ def get_agreement():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/agreement', methods=['POST'])
-@jwt_required()
 @admin_required
 def update_agreement():
     try:
@@ -547,35 +1091,22 @@ def update_agreement():
 
 # 获取所有公告
 @app.route('/api/admin/announcements', methods=['GET'])
-@jwt_required()
+@admin_required
 def get_announcements():
     try:
-        current_user = get_jwt_identity()
         db = get_db()
         cursor = db.cursor()
-        
-        # 检查用户是否是管理员
-        cursor.execute('SELECT is_admin FROM users WHERE username = ?', (current_user,))
-        result = cursor.fetchone()
-        if not result or not result['is_admin']:
-            return jsonify({'error': '需要管理员权限'}), 403
-            
-        # 自动禁用已过期的公告
-        cursor.execute('''
-            UPDATE announcements 
-            SET is_active = 0
-            WHERE datetime(display_end) < datetime('now') AND is_active = 1
-        ''')
-        db.commit()
             
+        # 已过期的公告视为未启用，查询时计算而不是写回数据库
         cursor.execute('''
-            SELECT id, content, display_start, display_end, is_active, created_at
+            SELECT id, content, display_start, display_end, created_at,
+                   is_active AND datetime(display_end) >= datetime('now') AS is_active
             FROM announcements 
             ORDER BY created_at DESC
         ''')
         announcements = cursor.fetchall()
         
-        return jsonify([{
+        response = jsonify([{
             'id': row['id'],
             'content': row['content'],
             'display_start': row['display_start'],
@@ -583,24 +1114,21 @@ def get_announcements():
             'is_active': bool(row['is_active']),
             'created_at': row['created_at']
         } for row in announcements])
+        # 启用状态随时间变化，ETag 按内容计算，未变化时返回 304 节省传输
+        response.add_etag()
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
     except Exception as e:
         print('Error in get_announcements:', str(e))
         return jsonify({'error': str(e)}), 500
 
 # 删除公告
 @app.route('/api/admin/announcement/<int:announcement_id>', methods=['DELETE'])
-@jwt_required()
+@admin_required
 def delete_announcement(announcement_id):
     try:
-        current_user = get_jwt_identity()
         db = get_db()
         cursor = db.cursor()
-        
-        # 检查用户是否是管理员
-        cursor.execute('SELECT is_admin FROM users WHERE username = ?', (current_user,))
-        result = cursor.fetchone()
-        if not result or not result['is_admin']:
-            return jsonify({'error': '需要管理员权限'}), 403
             
         # 检查公告是否存在
         cursor.execute('SELECT id FROM announcements WHERE id = ?', (announcement_id,))
@@ -610,6 +1138,7 @@ def delete_announcement(announcement_id):
         # 删除公告
         cursor.execute('DELETE FROM announcements WHERE id = ?', (announcement_id,))
         db.commit()
+        announcement_changed()
         
         return jsonify({'message': '公告删除成功'})
     except Exception as e:
@@ -618,18 +1147,11 @@ def delete_announcement(announcement_id):
 
 # 更新公告
 @app.route('/api/admin/announcement/<int:announcement_id>', methods=['PUT'])
-@jwt_required()
+@admin_required
 def update_announcement_by_id(announcement_id):
     try:
-        current_user = get_jwt_identity()
         db = get_db()
         cursor = db.cursor()
-        
-        # 检查用户是否是管理员
-        cursor.execute('SELECT is_admin FROM users WHERE username = ?', (current_user,))
-        result = cursor.fetchone()
-        if not result or not result['is_admin']:
-            return jsonify({'error': '需要管理员权限'}), 403
             
         # 检查公告是否存在
         cursor.execute('SELECT id FROM announcements WHERE id = ?', (announcement_id,))
@@ -652,13 +1174,24 @@ def update_announcement_by_id(announcement_id):
             WHERE id = ?
         ''', (content, display_start, display_end, is_active, announcement_id))
         db.commit()
+        announcement_changed()
         
         return jsonify({'message': '公告更新成功'})
     except Exception as e:
         print('Error in update_announcement_by_id:', str(e))
         return jsonify({'error': str(e)}), 500
 
+# Prometheus 指标，汇总所有 worker；设置 METRICS_TOKEN 后需要携带 Bearer token
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    if metrics.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {metrics.METRICS_TOKEN}':
+        return jsonify({'error': '未授权'}), 401
+    return Response(metrics.store.render(), mimetype='text/plain; version=0.0.4')
+
+# 请求指标的钩子在所有路由注册之后安装；压缩在其后注册、先于指标执行，记录的是实际发送的字节数
+metrics.init_app(app)
+compression.init_app(app)
+
 if __name__ == '__main__':
-    with app.app_context():
-        init_db()
+    init_db()
     app.run(host='0.0.0.0', port=50000, debug=True) 
\ No newline at end of file
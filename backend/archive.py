@@ -0,0 +1,233 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import database
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，未安装时用 zlib 压缩
+    zstandard = None
+
+# 冷会话归档和数据库整理配置
+ARCHIVE_AFTER_DAYS = float(os.getenv('ARCHIVE_AFTER_DAYS', '30'))          # 超过该天数未修改的会话归档，0 表示不归档
+ARCHIVE_CODEC = os.getenv('ARCHIVE_CODEC', 'zstd' if zstandard is not None else 'zlib')
+ARCHIVE_ZSTD_LEVEL = int(os.getenv('ARCHIVE_ZSTD_LEVEL', '9'))
+ARCHIVE_ZLIB_LEVEL = int(os.getenv('ARCHIVE_ZLIB_LEVEL', '9'))
+ARCHIVE_BATCH = int(os.getenv('ARCHIVE_BATCH', '50'))                       # 每个写事务归档的会话数
+MAINTENANCE_INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL', '3600'))    # 归档和整理的间隔（秒）
+COMPACT_MIN_FREE_PAGES = int(os.getenv('COMPACT_MIN_FREE_PAGES', '1024'))  # 空闲页达到该数量才回收
+COMPACT_STEP_PAGES = int(os.getenv('COMPACT_STEP_PAGES', '2048'))          # 每步回收的页数，分步执行避免长时间占用写锁
+
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+def compress(codec, data):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ARCHIVE_ZLIB_LEVEL)
+
+
+def decompress(codec, data):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class SessionArchive:
+    """冷会话归档
+
+    超过 ARCHIVE_AFTER_DAYS 天未修改的会话，把 session_messages 中的消息拼成
+    一个 JSON 数组压缩后存入 session_archive（每个会话一行），并删除原来的
+    消息行。读取会话时直接解压返回；修改或删除会话之前先还原回
+    session_messages，之后按普通会话处理。搜索索引不变，命中归档会话时从
+    归档中取摘要。
+
+    后台线程每隔 MAINTENANCE_INTERVAL 秒归档一批会话，然后在 auto_vacuum 为
+    INCREMENTAL 时分步回收空闲页并截断 WAL，让删除和归档腾出的空间还给文件
+    系统。多个 worker 进程通过文件锁保证同一时刻只有一个在执行。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+
+    def messages_json(self, cursor, session_id):
+        """归档会话的消息 JSON 数组（UTF-8 字节），未归档时返回 None"""
+        cursor.execute('SELECT codec, data FROM session_archive WHERE session_id = ?', (session_id,))
+        row = cursor.fetchone()
+        return decompress(row[0], row[1]) if row else None
+
+    def messages(self, cursor, session_id):
+        data = self.messages_json(cursor, session_id)
+        return None if data is None else json.loads(data)
+
+    def restore(self, cursor, session_id):
+        """把归档的会话还原到 session_messages，在修改或删除会话之前调用；返回是否还原"""
+        messages = self.messages(cursor, session_id)
+        if messages is None:
+            return False
+        cursor.executemany('''
+            INSERT INTO session_messages (session_id, seq, role, content, message_json)
+            VALUES (?1, ?2, ?3, ?4, json_object('role', ?3, 'content', ?4))
+        ''', [(session_id, seq, msg['role'], msg['content']) for seq, msg in enumerate(messages)])
+        cursor.execute('DELETE FROM session_archive WHERE session_id = ?', (session_id,))
+        return True
+
+    def all_messages(self, conn):
+        """遍历所有归档会话，产出 (session_id, username, messages)，重建搜索索引时使用"""
+        rows = conn.execute('''
+            SELECT a.session_id, s.username, a.codec, a.data
+            FROM session_archive a JOIN chat_sessions s ON s.id = a.session_id
+        ''')
+        for session_id, username, codec, data in rows:
+            yield session_id, username, json.loads(decompress(codec, data))
+
+    def archive_idle(self, conn, cutoff):
+        """归档 updatedAt 早于 cutoff 的会话，返回归档的会话数
+
+        读取和压缩在写事务之外进行，写入时核对 updatedAt 没有变化，期间被
+        修改的会话留到下一轮。按 id 顺序分批，一轮只扫描一遍会话表。
+        """
+        archived = 0
+        last_id = 0
+        while True:
+            rows = conn.execute('''
+                SELECT id, updatedAt FROM chat_sessions s
+                WHERE id > ? AND updatedAt < ? AND message_count > 0
+                  AND NOT EXISTS (SELECT 1 FROM session_archive a WHERE a.session_id = s.id)
+                ORDER BY id LIMIT ?
+            ''', (last_id, cutoff, ARCHIVE_BATCH)).fetchall()
+            if not rows:
+                return archived
+            last_id = rows[-1][0]
+
+            batch = []
+            for session_id, updated_at in rows:
+                parts = conn.execute('''
+                    SELECT CAST(message_json AS BLOB) FROM session_messages WHERE session_id = ? ORDER BY seq
+                ''', (session_id,)).fetchall()
+                data = b'[' + b','.join(row[0] for row in parts) + b']'
+                batch.append((session_id, updated_at, len(data), compress(ARCHIVE_CODEC, data)))
+
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                now = int(time.time())
+                for session_id, updated_at, size, data in batch:
+                    cursor.execute('SELECT updatedAt FROM chat_sessions WHERE id = ?', (session_id,))
+                    row = cursor.fetchone()
+                    if row is None or row[0] != updated_at:
+                        continue
+                    cursor.execute('''
+                        INSERT INTO session_archive (session_id, codec, data, raw_size, archived_at)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (session_id, ARCHIVE_CODEC, data, size, now))
+                    cursor.execute('DELETE FROM session_messages WHERE session_id = ?', (session_id,))
+                    archived += 1
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+
+    def compact(self, conn):
+        """auto_vacuum 为 INCREMENTAL 时分步回收空闲页并截断 WAL，返回回收的页数"""
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return 0
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if free < COMPACT_MIN_FREE_PAGES:
+            return 0
+        freed = 0
+        while True:
+            # incremental_vacuum 每执行一步释放一页，execute 只执行第一步，executescript 会执行到结束
+            conn.executescript(f'PRAGMA incremental_vacuum({COMPACT_STEP_PAGES});')
+            remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if remaining >= free:
+                break
+            freed += free - remaining
+            free = remaining
+            if free == 0:
+                break
+            time.sleep(0.05)  # 两步之间让出写锁
+        # 回收的页先写在 WAL 里，检查点完成后数据库文件才会变小
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+        return freed
+
+    def run_once(self):
+        """执行一轮归档和整理，返回 {'archived', 'freed_pages'}；其他进程正在执行时返回 None"""
+        with open(database.DATABASE + '.maintenance', 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            conn = database.connect()
+            try:
+                archived = 0
+                if ARCHIVE_AFTER_DAYS > 0:
+                    cutoff = str(datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS))
+                    archived = self.archive_idle(conn, cutoff)
+                freed = self.compact(conn)
+            finally:
+                conn.close()
+        if archived or freed:
+            print(f"数据库整理完成 - 归档会话: {archived}, 回收页: {freed}")
+        return {'archived': archived, 'freed_pages': freed}
+
+    def ensure_worker(self):
+        if self._worker is None or self._pid != os.getpid() or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or self._pid != os.getpid() or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._loop, name='session-archive', daemon=True)
+                    self._pid = os.getpid()
+                    self._worker.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(MAINTENANCE_INTERVAL)
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error in database maintenance: {str(e)}")
+
+    def storage(self, cursor):
+        """数据库文件大小、空闲空间和归档节省的空间（字节）"""
+        page_size = cursor.execute('PRAGMA page_size').fetchone()[0]
+        page_count = cursor.execute('PRAGMA page_count').fetchone()[0]
+        freelist = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+        auto_vacuum = cursor.execute('PRAGMA auto_vacuum').fetchone()[0]
+        wal = database.DATABASE + '-wal'
+        cursor.execute('SELECT COUNT(*) FROM chat_sessions')
+        sessions = cursor.fetchone()[0]
+        cursor.execute('''
+            SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(length(data)), 0) FROM session_archive
+        ''')
+        archived, raw_size, stored_size = cursor.fetchone()
+        return {
+            'database_bytes': page_size * page_count,
+            'wal_bytes': os.path.getsize(wal) if os.path.exists(wal) else 0,
+            'free_bytes': page_size * freelist,
+            'auto_vacuum': AUTO_VACUUM_MODES.get(auto_vacuum, auto_vacuum),
+            'sessions': sessions,
+            'archived_sessions': archived,
+            'archive': {
+                'codec': ARCHIVE_CODEC,
+                'after_days': ARCHIVE_AFTER_DAYS,
+                'raw_bytes': raw_size,
+                'stored_bytes': stored_size,
+                'saved_bytes': raw_size - stored_size,
+                'ratio': stored_size / raw_size if raw_size else None
+            }
+        }
+
+
+def init_app(app):
+    # 后台线程在每个 worker 收到第一个请求时启动
+    app.before_request(session_archive.ensure_worker)
+
+
+session_archive = SessionArchive()
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify
+from flask_jwt_extended import get_jwt_identity, jwt_required
+
+from database import get_db
+
+# 角色缓存配置
+ROLE_CACHE_SIZE = int(os.getenv('ROLE_CACHE_SIZE', '1024'))
+ROLE_CACHE_TTL = float(os.getenv('ROLE_CACHE_TTL', '60'))  # 秒，其他 worker 中角色变更最多延迟这么久生效
+
+
+class RoleCache:
+    """用户是否为管理员的 LRU + TTL 缓存
+
+    命中时不查询数据库；用户名或角色变化时调用 invalidate。
+    不存在的用户不缓存，避免注册后仍被当作不存在。
+    """
+
+    def __init__(self, size=ROLE_CACHE_SIZE, ttl=ROLE_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # username -> (is_admin, expires_at)
+
+    def is_admin(self, username):
+        """返回 True/False，用户不存在时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(username)
+                return entry[0]
+
+        cursor = get_db().cursor()
+        cursor.execute('SELECT is_admin FROM users WHERE username = ?', (username,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+
+        is_admin = bool(row['is_admin'])
+        with self._lock:
+            self._entries[username] = (is_admin, now + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return is_admin
+
+    def invalidate(self, username=None):
+        with self._lock:
+            if username is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(username, None)
+
+
+role_cache = RoleCache()
+
+
+def admin_required(f):
+    """管理员接口的唯一鉴权入口：校验一次 JWT，再从角色缓存判断权限"""
+    @wraps(f)
+    @jwt_required()
+    def decorated(*args, **kwargs):
+        if not role_cache.is_admin(get_jwt_identity()):
+            return jsonify({'error': '需要管理员权限'}), 403
+        return f(*args, **kwargs)
+
+    return decorated
@@ -0,0 +1,89 @@
+"""管理员接口鉴权开销检查
+
+统计每个管理员请求在角色缓存预热前后查询用户角色（users.is_admin）的
+次数，预热后应为 0。任一接口预热后仍查询角色时以非零状态退出。接口本身
+的业务查询（如统计信息中的用户总数）不计入。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_admin.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret-key-0123456789abcdef')
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+
+import database  # noqa: E402
+from app import app  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+statements = []
+ROLE_LOOKUP = 'SELECT is_admin FROM users'  # auth.py 中角色缓存未命中时的查询
+_connect = database.connect
+
+
+def traced_connect(path=None):
+    conn = _connect(path)
+    conn.set_trace_callback(statements.append)
+    return conn
+
+
+def seed():
+    database.init_db()
+    conn = database.connect()
+    conn.execute('''
+        INSERT INTO users (username, email, password, is_admin)
+        VALUES ('admin', 'admin@example.com', 'x', 1)
+    ''')
+    conn.execute('''
+        INSERT INTO announcements (content, display_start, display_end, is_active)
+        VALUES ('benchmark', datetime('now', '-1 hour'), datetime('now', '+1 day'), 1)
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def main():
+    seed()
+    database.connect = traced_connect
+    database.pool.close_all()
+
+    with app.app_context():
+        headers = {'Authorization': f'Bearer {create_access_token(identity="admin")}'}
+    end = (datetime.utcnow() + timedelta(days=1)).isoformat() + 'Z'
+    announcement = {'content': 'x', 'display_start': '2000-01-01T00:00:00Z', 'display_end': end, 'is_active': True}
+    requests = [
+        ('GET', '/api/admin/check', None),
+        ('GET', '/api/admin/stats', None),
+        ('GET', '/api/admin/announcements', None),
+        ('POST', '/api/admin/announcement', announcement),
+        ('PUT', '/api/admin/announcement/1', announcement),
+        ('POST', '/api/agreement', {'content': 'agreement'}),
+        ('DELETE', '/api/admin/announcement/2', None),
+    ]
+
+    client = app.test_client()
+    failed = False
+    print(f'{"接口":<40} {"冷启动":>6} {"预热后":>6}')
+    for method, url, body in requests:
+        counts = []
+        for _ in range(2):
+            del statements[:]
+            resp = client.open(url, method=method, json=body, headers=headers)
+            assert resp.status_code < 400 or method == 'DELETE', (url, resp.status_code, resp.data)
+            counts.append(sum(1 for sql in statements if ROLE_LOOKUP in sql))
+        print(f'{method + " " + url:<40} {counts[0]:>6} {counts[1]:>6}')
+        failed = failed or counts[1] > 0
+
+    if failed:
+        print('预热后仍有管理员请求查询用户角色')
+        sys.exit(1)
+    print('预热后管理员请求不再查询用户角色')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""准入控制公平性测试
+
+一个模拟 llama-server（4 个 slot），一个用户同时开多个标签页不停发送请求，
+另外几个普通用户每次发一个请求、读完回复后再发下一个。对比：
+- direct: 直接发往 llama-server，多出的请求在 llama-server 中排队
+- admission: 经过 admission 按用户公平排队
+
+输出每类用户完成的请求数、等待首 token 的 p50/p95、被拒绝的次数，以及
+总吞吐（tokens/s），吞吐不下降说明 slot 一直是满的。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_admission.py --tabs 12 --users 3 --duration 15
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('ROUTER_POLL_INTERVAL', '0.5')
+
+from admission import AdmissionController, AdmissionRejected  # noqa: E402
+from completions import build_payload, StreamParser  # noqa: E402
+from router import UpstreamRouter  # noqa: E402
+from fake_llama_server import serve  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else float('nan')
+
+
+def run_mode(name, use_admission, args):
+    server, url = serve(tokens=args.tokens, delay=0.01, first_token_delay=0.02, slots=4, prefill_delay=0)
+    router = UpstreamRouter()
+    controller = AdmissionController('bench')
+    results = {'greedy': [], 'normal': []}
+    rejected = {'greedy': 0, 'normal': 0}
+    total_tokens = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + args.duration
+
+    def complete(user, kind, rng):
+        started = time.monotonic()
+        ticket = None
+        if use_admission:
+            try:
+                ticket = controller.acquire(user, lambda: router.capacity([url]))
+                for _ in ticket.updates():
+                    pass
+            except AdmissionRejected as e:
+                with lock:
+                    rejected[kind] += 1
+                time.sleep(min(e.retry_after or 1, 2) * rng.uniform(0.5, 1))
+                return
+        payload = build_payload('bench', [{'role': 'user', 'content': f'hello from {user}'}], {})
+        lease, resp = router.open_stream([url], payload)
+        parser = StreamParser()
+        try:
+            for chunk in resp.iter_content(chunk_size=None):
+                parser.feed(chunk)
+        finally:
+            resp.close()
+            router.end(lease)
+            if ticket is not None:
+                ticket.close()
+        _, ttft, tokens, _ = parser.result()
+        if ttft is None:
+            return
+        with lock:
+            # 从发起请求（包括排队）到收到第一个 token
+            results[kind].append(parser.first_token_at - started)
+            total_tokens[0] += tokens
+
+    def client(user, kind, think):
+        rng = random.Random(user)
+        while time.monotonic() < stop_at:
+            complete(user, kind, rng)
+            time.sleep(rng.uniform(*think))
+
+    threads = [threading.Thread(target=client, args=('greedy', 'greedy', (0, 0.05))) for _ in range(args.tabs)]
+    threads += [threading.Thread(target=client, args=(f'user{i}', 'normal', (0.2, 0.8))) for i in range(args.users)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    server.shutdown()
+
+    print(f'{name}: {total_tokens[0] / elapsed:.0f} tokens/s')
+    for kind in ('greedy', 'normal'):
+        waits = results[kind]
+        print(f'  {kind:6s} completed {len(waits):4d}  wait p50 {percentile(waits, 50) * 1000:6.0f}ms  '
+              f'p95 {percentile(waits, 95) * 1000:6.0f}ms  '
+              f'mean {statistics.mean(waits) * 1000 if waits else float("nan"):6.0f}ms  rejected {rejected[kind]}')
+    if use_admission:
+        print('  admission:', controller.snapshot())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tabs', type=int, default=12, help='一个用户同时打开的标签页数')
+    parser.add_argument('--users', type=int, default=3, help='普通用户数')
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--tokens', type=int, default=50, help='每个回复的 token 数')
+    args = parser.parse_args()
+    print(f'1 replica x 4 slots, 1 user with {args.tabs} tabs, {args.users} normal users, {args.duration:.0f}s')
+    run_mode('direct', False, args)
+    run_mode('admission', True, args)
+
+
+if __name__ == '__main__':
+    main()
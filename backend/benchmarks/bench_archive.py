@@ -0,0 +1,111 @@
+"""冷会话归档压测
+
+生成一批会话，把其中一部分的 updatedAt 改到归档期限之前，执行一轮归档和空间
+回收（与后台任务相同），输出：
+- 归档前后数据库文件的大小、归档耗时和回收的页数
+- zlib / zstd 两种编码的压缩率和压缩耗时
+- 读取普通会话和已归档会话的耗时，以及修改已归档会话（先还原）的耗时
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_archive.py --sessions 2000 --messages 40 --cold 0.8
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret-key-0123456789abcdef')
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+os.environ.setdefault('RATE_LIMITS', '')  # 测的是吞吐，不按用户限流
+
+import archive  # noqa: E402
+import database  # noqa: E402
+from app import app  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+
+def text(rng, n):
+    words = ['模型', '推理', '部署', '显卡', '数据', '代码', 'python', 'flask', 'def ', 'return ', '\n', '，', '。']
+    return ''.join(rng.choice(words) for _ in range(n))
+
+
+def file_size():
+    return sum(os.path.getsize(database.DATABASE + suffix)
+               for suffix in ('', '-wal') if os.path.exists(database.DATABASE + suffix))
+
+
+def average_ms(fn, ids):
+    started = time.perf_counter()
+    for session_id in ids:
+        fn(session_id)
+    return (time.perf_counter() - started) / len(ids) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=40, help='每个会话的消息数')
+    parser.add_argument('--words', type=int, default=150, help='每条消息的词数')
+    parser.add_argument('--cold', type=float, default=0.8, help='需要归档的会话比例')
+    args = parser.parse_args()
+
+    database.init_db()
+    conn = database.connect()
+    conn.execute("INSERT INTO users (username, email, password, is_admin) VALUES ('bench', '', 'x', 1)")
+    conn.commit()
+    with app.app_context():
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity='bench')}
+    client = app.test_client()
+    rng = random.Random(1)
+    ids = []
+    for _ in range(args.sessions):
+        messages = [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': text(rng, args.words)}
+                    for i in range(args.messages)]
+        ids.append(client.post('/api/chat/sessions', headers=headers,
+                               json={'title': 'bench', 'messages': messages}).json['id'])
+    cold = ids[:int(len(ids) * args.cold)]
+    hot = ids[len(cold):]
+    conn.execute('UPDATE chat_sessions SET updatedAt = ? WHERE id <= ?', ('2000-01-01 00:00:00', cold[-1]))
+    conn.commit()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+
+    sample = [conn.execute('''
+        SELECT CAST(message_json AS BLOB) FROM session_messages WHERE session_id = ? ORDER BY seq
+    ''', (session_id,)).fetchall() for session_id in cold[:200]]
+    sample = [b'[' + b','.join(row[0] for row in rows) + b']' for rows in sample]
+    raw = sum(len(data) for data in sample)
+    print(f'{args.sessions} sessions x {args.messages} messages, {len(cold)} cold')
+    for codec in ('zlib', 'zstd') if archive.zstandard is not None else ('zlib',):
+        started = time.process_time()
+        compressed = sum(len(archive.compress(codec, data)) for data in sample)
+        elapsed = time.process_time() - started
+        print(f'{codec:5s} ratio {compressed / raw:5.3f}  {raw / elapsed / 1e6:6.1f} MB/s')
+
+    read = lambda session_id: client.get(f'/api/chat/sessions/{session_id}', headers=headers).get_data()  # noqa: E731
+    hot_read = average_ms(read, hot[:200])
+    before = file_size()
+    archive.COMPACT_MIN_FREE_PAGES = 0
+    started = time.perf_counter()
+    result = archive.session_archive.run_once()
+    elapsed = time.perf_counter() - started
+    after = file_size()
+    print(f'database {before / 1e6:7.1f} MB -> {after / 1e6:7.1f} MB  '
+          f'archived {result["archived"]} in {elapsed:.2f}s, freed {result["freed_pages"]} pages')
+    storage = client.get('/api/admin/storage', headers=headers).json['archive']
+    print(f'archive raw {storage["raw_bytes"] / 1e6:.1f} MB stored {storage["stored_bytes"] / 1e6:.1f} MB '
+          f'({storage["codec"]})')
+
+    cold_read = average_ms(read, cold[:200])
+    patch = lambda session_id: client.patch(  # noqa: E731
+        f'/api/chat/sessions/{session_id}/messages', headers=headers,
+        json={'messages': [{'role': 'user', 'content': 'hello'}]})
+    print(f'read hot {hot_read:.2f} ms  read archived {cold_read:.2f} ms  '
+          f'patch archived (restore) {average_ms(patch, cold[:200]):.2f} ms  patch hot {average_ms(patch, hot[:200]):.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""响应压缩与条件 GET 压测
+
+构造一个有大量会话和聊天记录的用户，对 GET /api/chat/sessions、
+GET /api/history 和 GET /api/admin/announcements 分别测试：
+- 各编码（identity / gzip / br）下实际发送的字节数和每次压缩耗费的 CPU 时间
+- 带 If-None-Match 的条件请求（304）与完整请求的耗时对比
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_compression.py --sessions 200 --history 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret-key-0123456789abcdef')
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+os.environ.setdefault('RATE_LIMITS', '')  # 测的是吞吐，不按用户限流
+
+import compression  # noqa: E402
+import database  # noqa: E402
+from app import app  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+
+def text(rng, n):
+    words = ['模型', '推理', '部署', '显卡', '数据', '代码', 'python', 'flask', 'token', '上下文', '，', '。']
+    return ''.join(rng.choice(words) for _ in range(n))
+
+
+def populate(args):
+    database.init_db()
+    conn = database.connect()
+    conn.execute("INSERT INTO users (username, email, password, is_admin) VALUES ('bench', '', 'x', 1)")
+    rng = random.Random(1)
+    now = time.time()
+    conn.executemany('''
+        INSERT INTO chat_sessions (username, title, messages, createdAt, updatedAt) VALUES (?, ?, '[]', ?, ?)
+    ''', [('bench', text(rng, 8), f'2025-01-01T00:00:{i % 60:02d}', f'2025-01-02T00:00:{i % 60:02d}')
+          for i in range(args.sessions)])
+    conn.executemany('INSERT INTO chat_history (username, user, ai, model, timestamp) VALUES (?, ?, ?, ?, ?)',
+                     [('bench', text(rng, 40), text(rng, 200), 'QwQ-32B', now - i) for i in range(args.history)])
+    conn.executemany('INSERT INTO announcements (content, display_start, display_end, is_active) VALUES (?, ?, ?, 1)',
+                     [(text(rng, 60), '2000-01-01T00:00:00', '2100-01-01T00:00:00') for _ in range(args.announcements)])
+    conn.commit()
+    conn.close()
+
+
+def cpu_per_request(client, url, headers, repeat):
+    client.get(url, headers=headers)
+    started = time.process_time()
+    for _ in range(repeat):
+        response = client.get(url, headers=headers)
+    return (time.process_time() - started) / repeat, response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=200)
+    parser.add_argument('--history', type=int, default=200, help='聊天记录条数（单页最多 200 条）')
+    parser.add_argument('--announcements', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    populate(args)
+    with app.app_context():
+        auth = {'Authorization': 'Bearer ' + create_access_token(identity='bench')}
+    client = app.test_client()
+    urls = ('/api/chat/sessions?limit=200', '/api/history?limit=200', '/api/admin/announcements')
+    encodings = ['identity', 'gzip'] + (['br'] if 'br' in compression.ENCODINGS else [])
+
+    print(f'{args.sessions} sessions, {args.history} history, {args.announcements} announcements')
+    print(f'{"url":34s} {"encoding":8s} {"bytes":>9s} {"ratio":>6s} {"cpu/req":>9s}')
+    for url in urls:
+        baseline = None
+        for encoding in encodings:
+            elapsed, response = cpu_per_request(client, url, dict(auth, **{'Accept-Encoding': encoding}), args.repeat)
+            assert response.status_code == 200, response.status_code
+            size = len(response.get_data())
+            baseline = baseline or size
+            print(f'{url:34s} {encoding:8s} {size:9d} {size / baseline:6.2f} {elapsed * 1000:7.3f}ms')
+
+    print()
+    print(f'{"url":34s} {"full 200":>9s} {"304":>9s}')
+    for url in urls:
+        headers = dict(auth, **{'Accept-Encoding': 'gzip'})
+        full, response = cpu_per_request(client, url, headers, args.repeat)
+        headers['If-None-Match'] = response.headers['ETag']
+        cached, response = cpu_per_request(client, url, headers, args.repeat)
+        assert response.status_code == 304, response.status_code
+        print(f'{url:34s} {full * 1000:7.3f}ms {cached * 1000:7.3f}ms')
+
+
+if __name__ == '__main__':
+    main()
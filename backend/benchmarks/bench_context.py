@@ -0,0 +1,134 @@
+"""服务端上下文窗口测试
+
+启动本地模拟 llama-server，一个会话连续进行多轮对话，每轮和前端一样发送完整
+历史。分别在不裁剪（窗口足够大）和按模型预算裁剪两种情况下，输出每轮发送给
+上游的提示词 token 数、实际预填充的 token 数（其余命中 KV 缓存）和耗时。
+slot 被其他会话占用过、缓存失效时，预填充的就是整个提示词。最后对比长会话组装一次提示词的耗时：读取保存的 token 数与全部重新计算。
+
+模拟服务按空白切分计算 token，与估算方法不同，可以看到校准比例的变化。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_context.py --turns 60 --words 300 --window 10240
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret-key-0123456789abcdef')
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+os.environ.setdefault('RATE_LIMITS', '')  # 测的是吞吐，不按用户限流
+
+from fake_llama_server import serve  # noqa: E402
+
+
+def words(turn, n):
+    return ' '.join(f'第{turn}轮 word{i % 97}' for i in range(n // 2))
+
+
+def final_usage(body):
+    """从补全流的最后一个数据块中取出 (prompt_tokens, prompt_n)"""
+    usage = timings = None
+    for line in body.split(b'\n'):
+        if line.startswith(b'data: {'):
+            chunk = json.loads(line[6:])
+            usage = chunk.get('usage', usage)
+            timings = chunk.get('timings', timings)
+    return usage['prompt_tokens'], timings['prompt_n']
+
+
+SYSTEM = {'role': 'system', 'content': '你是一个乐于助人的助手。'}
+
+
+def converse(client, headers, session_id, args):
+    """返回每轮的 (提示词 token 数, 预填充 token 数, 耗时秒)"""
+    messages = [SYSTEM]
+    turns = []
+    for turn in range(args.turns):
+        messages.append({'role': 'user', 'content': words(turn, args.words)})
+        started = time.perf_counter()
+        response = client.post('/api/chat/completions', headers=headers, json={
+            'session_id': session_id, 'model': 'QwQ', 'messages': messages, 'max_tokens': args.reply
+        })
+        body = response.get_data()
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200, body
+        prompt_tokens, prefilled = final_usage(body)
+        turns.append((prompt_tokens, prefilled, elapsed))
+        reply = ''.join(json.loads(line[6:])['choices'][0]['delta'].get('content', '')
+                        for line in body.split(b'\n') if line.startswith(b'data: {') and b'"choices"' in line)
+        messages.append({'role': 'assistant', 'content': reply})
+    return turns, messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--turns', type=int, default=60)
+    parser.add_argument('--words', type=int, default=300, help='每条用户消息的词数')
+    parser.add_argument('--reply', type=int, default=200, help='每次回复的 token 数')
+    parser.add_argument('--window', type=int, default=10240, help='每个请求的上下文长度')
+    parser.add_argument('--prefill-delay', type=float, default=0.0002, help='每个预填充 token 的耗时（秒）')
+    args = parser.parse_args()
+
+    fake, upstream_url = serve(tokens=args.reply, delay=0, first_token_delay=0, slots=1,
+                               prefill_delay=args.prefill_delay)
+    os.environ['MODEL_UPSTREAMS'] = f'QwQ-32B={upstream_url}'
+    os.environ['ROUTER_DEFAULT_SLOTS'] = '1'
+
+    from flask_jwt_extended import create_access_token
+    import context_window
+    import database
+    from app import app
+
+    database.init_db()
+    conn = database.connect()
+    conn.execute("INSERT INTO users (username, email, password) VALUES ('bench', 'bench@example.com', 'x')")
+    conn.commit()
+    with app.app_context():
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity='bench')}
+    client = app.test_client()
+
+    results = {}
+    for mode, window in (('full', 10 ** 9), ('window', args.window)):
+        context_window.CONTEXT_DEFAULT_WINDOW = window
+        session_id = client.post('/api/chat/sessions', headers=headers,
+                                 json={'title': mode, 'messages': [SYSTEM]}).json['id']
+        results[mode], messages = converse(client, headers, session_id, args)
+
+    print(f'{args.turns} turns, {args.words} words per message, window {args.window}, '
+          f'calibration ratio {context_window.context_window.ratio("QwQ-32B"):.2f}')
+    print(f'{"turn":>4s} {"prompt full":>12s} {"prompt window":>14s} {"prefill full":>13s} '
+          f'{"prefill window":>15s} {"time full":>10s} {"time window":>12s}')
+    step = max(1, args.turns // 15)
+    for turn in list(range(0, args.turns, step)) + [args.turns - 1]:
+        (pf, ff, tf), (pw, fw, tw) = results['full'][turn], results['window'][turn]
+        print(f'{turn + 1:4d} {pf:12d} {pw:14d} {ff:13d} {fw:15d} {tf * 1000:8.0f}ms {tw * 1000:10.0f}ms')
+    for mode, turns in results.items():
+        prompts = [t[0] for t in turns]
+        over = sum(prompt > args.window for prompt in prompts)
+        print(f'{mode:6s} max prompt {max(prompts):6d}  mean prompt {sum(prompts) / len(prompts):8.0f}  '
+              f'over window {over:3d} turns  warm-cache prefill {sum(t[1] for t in turns):7d}  '
+              f'total time {sum(t[2] for t in turns):6.2f}s')
+
+    # 组装开销：最后一个会话的完整历史，读取保存的 token 数 / 旧数据没有 token 数时重新计算
+    options = {'max_tokens': args.reply}
+    repeat = 200
+    cursor = conn.cursor()
+    for label in ('stored counts', 'recount all'):
+        if label == 'recount all':
+            conn.execute('UPDATE session_messages SET tokens = NULL WHERE session_id = ?', (session_id,))
+            conn.commit()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            context_window.context_window.assemble(cursor, session_id, 'QwQ-32B', messages[:-1], options)
+        elapsed = (time.perf_counter() - started) / repeat
+        print(f'assemble {len(messages) - 1} messages, {label:13s} {elapsed * 1000:7.3f}ms')
+    fake.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""异步网关并发长连接压测
+
+在子进程中启动 gateway.py，同时打开大量 SSE 推送连接和流式补全连接，
+全部连接建立后修改一次公告，统计：
+- 每类连接的建立时间（到收到第一个字节）和错误数
+- 公告推送到所有 SSE 连接的延迟
+- 补全回复是否全部由网关保存
+- 网关进程的线程数和内存
+- 连接上游期间（上游返回响应头之前）客户端断开若干次之后，请求能否照常完成；
+  断开时没有归还准入票据或副本的在途计数，模型的 slot 会被逐渐占满
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_gateway.py --events 2000 --streams 1000
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret-key-0123456789abcdef')
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+os.environ.setdefault('RATE_LIMITS', '')  # 测的是吞吐，不按用户限流
+
+import aiohttp  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else float('nan')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def process_status(pid):
+    status = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('Threads', 'VmRSS'):
+                status[key] = value.strip()
+    return status
+
+
+def seed(sessions):
+    import database
+    database.init_db()
+    conn = database.connect()
+    conn.execute("INSERT INTO users (username, email, password) VALUES ('bench', 'bench@example.com', 'x')")
+    conn.executemany('''
+        INSERT INTO chat_sessions (username, title, messages, createdAt, updatedAt)
+        VALUES ('bench', ?, '[]', datetime('now'), datetime('now'))
+    ''', [(f'session {i}',) for i in range(sessions)])
+    conn.commit()
+    ids = [row[0] for row in conn.execute('SELECT id FROM chat_sessions ORDER BY id')]
+    conn.close()
+    return ids
+
+
+def publish_announcement():
+    import database
+    conn = database.connect()
+    conn.execute('''
+        INSERT INTO announcements (content, display_start, display_end, is_active)
+        VALUES ('bench-announcement', datetime('now', '-1 hour'), datetime('now', '+1 day'), 1)
+    ''')
+    conn.commit()
+    conn.close()
+
+
+async def wait_for_port(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError('gateway did not start')
+
+
+async def run(args):
+    from flask_jwt_extended import create_access_token
+    from app import app
+
+    # 最后一个会话留给连接上游期间断开的测试
+    *session_ids, cancel_session = seed(args.streams + 1)
+    with app.app_context():
+        token = create_access_token(identity='bench')
+        # /api/events 的查询参数只接受推送专用 token
+        stream_token = create_access_token(identity='bench', additional_claims={'stream': True})
+
+    # 每个补全流持续约 hold 秒，保证所有连接同时处于打开状态
+    delay = args.hold / args.tokens
+    # 模拟的 llama-server 和网关各自运行在独立进程中，压测进程只负责客户端
+    upstream_port = free_port()
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(BACKEND, 'benchmarks', 'fake_llama_server.py'),
+        '--port', str(upstream_port), '--tokens', str(args.tokens), '--delay', str(delay),
+        '--first-token-delay', '0.01', '--slots', str(args.streams)
+    ], stdout=subprocess.DEVNULL)
+    # 返回响应头很慢的上游，只有 2 个 slot
+    slow_port = free_port()
+    slow = subprocess.Popen([
+        sys.executable, os.path.join(BACKEND, 'benchmarks', 'fake_llama_server.py'),
+        '--port', str(slow_port), '--tokens', '5', '--delay', '0.01', '--header-delay', str(args.connect_delay),
+        '--slots', '2'
+    ], stdout=subprocess.DEVNULL)
+    port = free_port()
+    env = dict(os.environ, GATEWAY_PORT=str(port), GATEWAY_HOST='127.0.0.1',
+               MODEL_UPSTREAMS=f'QwQ-32B=http://127.0.0.1:{upstream_port},DS-R1=http://127.0.0.1:{slow_port}',
+               SSE_POLL_INTERVAL='0.5', ROUTER_DEFAULT_SLOTS=str(args.streams))
+    gateway = subprocess.Popen([sys.executable, 'gateway.py'], cwd=BACKEND, env=env,
+                               stdout=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        await wait_for_port(upstream_port)
+        await wait_for_port(slow_port)
+        await wait_for_port(port)
+        connector = aiohttp.TCPConnector(limit=0)
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=args.hold * 4 + 30)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+            results = {'events': [], 'streams': [], 'fanout': [], 'errors': []}
+            all_connected = asyncio.Event()
+            published_at = {}
+            connected = [0]
+            total = args.events + args.streams
+
+            def mark_connected():
+                connected[0] += 1
+                if connected[0] == total:
+                    all_connected.set()
+
+            async def sse_client():
+                started = time.perf_counter()
+                try:
+                    async with http.get(f'{base_url}/api/events', params={'token': stream_token}) as resp:
+                        if resp.status != 200:
+                            results['errors'].append(resp.status)
+                            return
+                        first = True
+                        async for line in resp.content:
+                            if first:
+                                results['events'].append(time.perf_counter() - started)
+                                mark_connected()
+                                first = False
+                            if b'bench-announcement' in line:
+                                results['fanout'].append(time.perf_counter() - published_at['t'])
+                                return
+                except Exception as e:
+                    results['errors'].append(repr(e))
+
+            async def stream_client(session_id):
+                started = time.perf_counter()
+                try:
+                    async with http.post(f'{base_url}/api/chat/completions', headers={
+                        'Authorization': f'Bearer {token}'
+                    }, json={
+                        'session_id': session_id,
+                        'model': 'QwQ',
+                        'messages': [{'role': 'user', 'content': 'hello'}]
+                    }) as resp:
+                        if resp.status != 200:
+                            results['errors'].append(resp.status)
+                            return
+                        first = True
+                        async for _ in resp.content.iter_any():
+                            if first:
+                                results['streams'].append(time.perf_counter() - started)
+                                mark_connected()
+                                first = False
+                except Exception as e:
+                    results['errors'].append(repr(e))
+
+            started = time.perf_counter()
+            tasks = [asyncio.ensure_future(sse_client()) for _ in range(args.events)]
+            tasks += [asyncio.ensure_future(stream_client(sid)) for sid in session_ids]
+            try:
+                await asyncio.wait_for(all_connected.wait(), args.hold * 2 + 30)
+            except asyncio.TimeoutError:
+                pass
+            open_at_peak = connected[0]
+            status = process_status(gateway.pid)
+            published_at['t'] = time.perf_counter()
+            publish_announcement()
+            await asyncio.wait(tasks, timeout=args.hold * 4 + 30)
+            elapsed = time.perf_counter() - started
+
+            # 每个请求在上游返回响应头之前断开，之后的请求应照常完成
+            completion = {
+                'session_id': cancel_session,
+                'model': 'DS-R1',
+                'messages': [{'role': 'user', 'content': 'hello'}]
+            }
+            headers = {'Authorization': f'Bearer {token}'}
+            for _ in range(args.cancels):
+                try:
+                    resp = await asyncio.wait_for(http.post(f'{base_url}/api/chat/completions', headers=headers,
+                                                            json=completion), args.connect_delay / 3)
+                    resp.release()
+                except asyncio.TimeoutError:
+                    pass
+            # 等网关处理完断开
+            await asyncio.sleep(0.5)
+            after_cancel = None
+            try:
+                async with http.post(f'{base_url}/api/chat/completions', headers=headers, json=completion,
+                                     timeout=aiohttp.ClientTimeout(total=args.connect_delay + 10)) as resp:
+                    body = await resp.read()
+                    after_cancel = resp.status == 200 and b'[DONE]' in body
+            except asyncio.TimeoutError:
+                after_cancel = False
+    finally:
+        for process in (gateway, fake, slow):
+            process.terminate()
+            process.wait()
+
+    import database
+    conn = database.connect()
+    saved = conn.execute("SELECT COUNT(*) FROM session_messages WHERE role = 'assistant' AND session_id != ?",
+                         (cancel_session,)).fetchone()[0]
+    conn.close()
+
+    print(f'gateway process: threads {status.get("Threads")}, rss {status.get("VmRSS")}')
+    print(f'open connections at peak: {open_at_peak}/{total}, errors: {len(results["errors"])}, '
+          f'elapsed {elapsed:.1f}s')
+    for name in ('events', 'streams'):
+        values = results[name]
+        print(f'{name:8s} connected {len(values):5d}  first byte p50 {percentile(values, 50) * 1000:.0f}ms  '
+              f'p99 {percentile(values, 99) * 1000:.0f}ms')
+    fanout = results['fanout']
+    print(f'announcement fan-out to {len(fanout)} clients: p50 {percentile(fanout, 50) * 1000:.0f}ms  '
+          f'p99 {percentile(fanout, 99) * 1000:.0f}ms')
+    print(f'assistant messages saved: {saved}/{args.streams}')
+    print(f'request after {args.cancels} disconnects while connecting upstream: '
+          f'{"ok" if after_cancel else "FAILED (admission slots or router leases leaked)"}')
+    if results['errors']:
+        print('first errors:', results['errors'][:5])
+    return open_at_peak == total and not results['errors'] and saved == args.streams and after_cancel
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=2000, help='SSE 推送连接数')
+    parser.add_argument('--streams', type=int, default=1000, help='流式补全连接数')
+    parser.add_argument('--tokens', type=int, default=50, help='每个补全的 token 数')
+    parser.add_argument('--hold', type=float, default=10, help='每个补全流持续的秒数')
+    parser.add_argument('--cancels', type=int, default=10, help='连接上游期间断开的请求数')
+    parser.add_argument('--connect-delay', type=float, default=1.0, help='慢速上游返回响应头之前的耗时（秒）')
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == '__main__':
+    main()
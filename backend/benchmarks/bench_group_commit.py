@@ -0,0 +1,98 @@
+"""成组提交压测
+
+多个线程同时保存聊天记录（与 /api/chat 相同的写事务：更新用户模型、插入
+chat_history、更新搜索索引），对比 write_queue 的两种模式：
+- strict: 每次写入单独提交
+- grouped: 写线程把同一时间段内的写入合并为一个事务提交
+
+分别在 synchronous=FULL（每次提交 fsync）和 NORMAL 下测试，输出每秒写入数、
+单次写入（到确认提交）的耗时和平均每个事务包含的写入数，并核对写入条数。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_group_commit.py --threads 16 --duration 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+
+import database  # noqa: E402
+from search import search_index  # noqa: E402
+from write_queue import WriteQueue  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def save(cursor, username, message):
+    cursor.execute('UPDATE users SET current_model = ? WHERE username = ?', ('QwQ-32B', username))
+    cursor.execute('''
+        INSERT INTO chat_history (username, user, ai, model, timestamp) VALUES (?, ?, ?, ?, ?)
+    ''', (username, message, f'收到: {message}', 'QwQ-32B', time.time()))
+    record_id = cursor.lastrowid
+    search_index.add_history(cursor, username, record_id, message, f'收到: {message}')
+    return record_id
+
+
+def run_mode(mode, synchronous, args):
+    path = os.path.join(tempfile.mkdtemp(), 'group.db')
+    database.DATABASE = path
+    database.SQLITE_SYNCHRONOUS = synchronous
+    database.pool.close_all()
+    database.init_db()
+    conn = database.connect()
+    conn.executemany("INSERT INTO users (username, email, password) VALUES (?, '', 'x')",
+                     [(f'user{i}',) for i in range(args.threads)])
+    conn.commit()
+
+    writes = WriteQueue(mode)
+    timings = [[] for _ in range(args.threads)]
+    stop_at = time.monotonic() + args.duration
+
+    def client(i):
+        n = 0
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            writes.run(save, f'user{i}', f'第 {n} 条消息 hello {i}')
+            timings[i].append(time.perf_counter() - started)
+            n += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.threads)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    writes.close()
+
+    latencies = [t for per_thread in timings for t in per_thread]
+    rows = conn.execute('SELECT COUNT(*) FROM chat_history').fetchone()[0]
+    conn.close()
+    stats = writes.snapshot()
+    batch = f'{stats["avg_batch"]:5.1f}' if mode == 'grouped' else '  1.0'
+    print(f'{mode:8s} {synchronous:6s} {len(latencies) / elapsed:8.0f} writes/s  '
+          f'p50 {percentile(latencies, 50) * 1000:6.2f}ms  p95 {percentile(latencies, 95) * 1000:6.2f}ms  '
+          f'batch {batch}  rows {rows}/{len(latencies)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5)
+    args = parser.parse_args()
+    print(f'{args.threads} threads, {args.duration:.0f}s per mode')
+    for synchronous in ('FULL', 'NORMAL'):
+        for mode in ('strict', 'grouped'):
+            run_mode(mode, synchronous, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,435 @@
+"""后端负载测试
+
+按给定规模生成用户、会话和聊天记录，然后让每个虚拟用户按前端的使用方式
+持续发送请求：
+- 登录：开始时所有用户同时登录，之后每隔 --login-burst 秒有一部分用户同时
+  重新登录（token 过期、批量刷新页面）
+- 公告轮询：每 5 秒 GET /api/admin/announcement，带上次的 ETag
+- 会话列表：进入页面和每轮对话后刷新列表，打开其中一个会话
+- 对话：每隔 --turn 秒一轮，追加用户消息和回复（与流式补全结束时的保存相同）；
+  指定 --completions 时改为经由模拟 llama-server 的真实流式补全，由后端保存
+- 偶尔新建会话、改标题、翻看聊天记录
+
+每个接口输出请求数、错误数、吞吐和 p50/p95/p99 延迟，结果可保存为 JSON，
+用 --compare 与另一次（例如上一个提交）的结果对比。默认通过 Flask test client
+在进程内运行；指定 --url 时向本地启动的服务发送请求，此时用 --database
+指向服务使用的数据库（不存在时先生成数据，再启动服务）。不需要 GPU。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_load.py --users 50 --duration 60 --output results.json
+    python benchmarks/bench_load.py --users 50 --duration 60 --compare results.json
+    python benchmarks/bench_load.py --database /tmp/load.db --seed-only
+    DATABASE=/tmp/load.db RATE_LIMITS= gunicorn -w 4 app:app &
+    python benchmarks/bench_load.py --database /tmp/load.db --url http://127.0.0.1:8000
+"""
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret-key-0123456789abcdef')
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+os.environ.setdefault('RATE_LIMITS', '')  # 测的是吞吐，不按用户限流
+
+PASSWORD = 'loadtest-password'
+WORDS = ['模型', '推理', '部署', '显卡', '数据', '代码', '上下文', 'python', 'flask', 'token', 'GPU', '，', '。', '\n']
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def text(rng, words):
+    return ''.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed(args):
+    """生成测试数据，数据库中已有测试用户时跳过；返回生成耗时（秒），跳过时为 None"""
+    import database
+    from passwords import password_hasher
+    from search import search_index
+
+    database.init_db()
+    conn = database.connect()
+    if conn.execute("SELECT 1 FROM users WHERE username = 'load0'").fetchone():
+        conn.close()
+        return None
+    started = time.perf_counter()
+    rng = random.Random(args.seed)
+    # 所有用户使用同一个密码，按服务端当前的 cost 计算一次
+    hashed = password_hasher.hash(PASSWORD)
+    conn.executemany('INSERT INTO users (username, email, password, current_model) VALUES (?, ?, ?, ?)',
+                     [(f'load{u}', f'load{u}@example.com', hashed, 'QwQ-32B') for u in range(args.users)])
+    now = datetime.now()
+    for u in range(args.users):
+        username = f'load{u}'
+        for s in range(args.sessions):
+            created = str(now - timedelta(days=rng.uniform(0, 20)))
+            cursor = conn.execute('''
+                INSERT INTO chat_sessions (username, title, messages, createdAt, updatedAt, message_count)
+                VALUES (?, ?, '[]', ?, ?, ?)
+            ''', (username, text(rng, 4), created, created, args.messages))
+            conn.executemany('''
+                INSERT INTO session_messages (session_id, seq, role, content, message_json)
+                VALUES (?1, ?2, ?3, ?4, json_object('role', ?3, 'content', ?4))
+            ''', [(cursor.lastrowid, i, 'user' if i % 2 == 0 else 'assistant', text(rng, args.words))
+                  for i in range(args.messages)])
+        conn.executemany('INSERT INTO chat_history (username, user, ai, model, timestamp) VALUES (?, ?, ?, ?, ?)',
+                         [(username, text(rng, 20), text(rng, args.words), 'QwQ-32B', time.time() - rng.uniform(0, 86400 * 20))
+                          for _ in range(args.history)])
+    conn.execute('''
+        INSERT INTO announcements (content, display_start, display_end, is_active)
+        VALUES ('负载测试公告', datetime('now', '-1 day'), datetime('now', '+30 days'), 1)
+    ''')
+    conn.commit()
+    # 与接口写入的数据一致，改标题等操作需要索引中有原来的内容
+    search_index.rebuild(conn)
+    conn.commit()
+    conn.close()
+    return time.perf_counter() - started
+
+
+class TestClientTarget:
+    """进程内的 Flask test client，每个线程一个"""
+
+    name = 'testclient'
+
+    def __init__(self):
+        from app import app
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, headers=None, json=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, headers=headers, json=json)
+        body = response.get_data()  # 流式响应在这里读完
+        if response.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)  # 与浏览器和 requests 一样计入解压
+        return response.status_code, response.headers, body
+
+
+class HTTPTarget:
+    """本地启动的服务，每个线程一个 requests.Session"""
+
+    def __init__(self, url):
+        import requests
+        self.name = url
+        self.url = url.rstrip('/')
+        self._requests = requests
+        self._local = threading.local()
+
+    def request(self, method, path, headers=None, json=None):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        response = session.request(method, self.url + path, headers=headers, json=json)
+        return response.status_code, response.headers, response.content
+
+
+class VirtualUser:
+    """一个按前端使用方式发送请求的用户，think time 均除以 speedup"""
+
+    def __init__(self, index, target, args, recorder, started, stop_at):
+        self.username = f'load{index}'
+        self.target = target
+        self.args = args
+        self.rng = random.Random(args.seed * 100003 + index)
+        self.record = recorder
+        self.started = started
+        self.stop_at = stop_at
+        self.token = None
+        self.etags = {}
+        self.session_ids = []
+        self.current = None
+
+    def call(self, label, method, path, json=None, conditional=False):
+        headers = {'Accept-Encoding': 'gzip'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        if conditional and path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+        begin = time.perf_counter()
+        try:
+            status, response_headers, body = self.target.request(method, path, headers, json)
+        except Exception:
+            self.record(label, 0, time.perf_counter() - begin)
+            return 0, None
+        self.record(label, status, time.perf_counter() - begin)
+        if conditional and response_headers.get('ETag'):
+            self.etags[path] = response_headers['ETag']
+        return status, body
+
+    def login(self):
+        # 与前端一样，服务繁忙（503）或被限流（429）时稍后重试
+        for _ in range(20):
+            status, body = self.call('POST /api/login', 'POST', '/api/login',
+                                     json={'username': self.username, 'password': PASSWORD})
+            if status == 200:
+                self.token = json.loads(body)['access_token']
+                return
+            if status not in (429, 503) or time.monotonic() >= self.stop_at:
+                return
+            time.sleep(0.1)
+
+    def list_sessions(self):
+        status, body = self.call('GET /api/chat/sessions', 'GET', '/api/chat/sessions', conditional=True)
+        if status == 200:
+            self.session_ids = [s['id'] for s in json.loads(body)['sessions']]
+
+    def open_session(self):
+        if not self.session_ids:
+            return
+        # 多数时候打开最近的会话
+        self.current = self.session_ids[min(int(self.rng.expovariate(0.5)), len(self.session_ids) - 1)]
+        self.call('GET /api/chat/sessions/<id>', 'GET', f'/api/chat/sessions/{self.current}', conditional=True)
+
+    def new_session(self):
+        status, body = self.call('POST /api/chat/sessions', 'POST', '/api/chat/sessions',
+                                 json={'title': '新对话', 'messages': []})
+        if status == 201 or status == 200:
+            self.current = json.loads(body)['id']
+            self.session_ids.insert(0, self.current)
+
+    def turn(self):
+        if self.current is None:
+            self.new_session()
+            if self.current is None:
+                return
+        question = text(self.rng, 20)
+        if self.args.completions:
+            self.call('POST /api/chat/completions', 'POST', '/api/chat/completions', json={
+                'model': 'QwQ-32B', 'session_id': self.current, 'stream': True,
+                'messages': [{'role': 'user', 'content': question}]
+            })
+        else:
+            self.call('PATCH /api/chat/sessions/<id>/messages', 'PATCH',
+                      f'/api/chat/sessions/{self.current}/messages',
+                      json={'messages': [{'role': 'user', 'content': question},
+                                         {'role': 'assistant', 'content': text(self.rng, self.args.words)}]})
+        self.list_sessions()
+
+    def rename(self):
+        if self.current is not None:
+            self.call('PUT /api/chat/sessions/<id>', 'PUT', f'/api/chat/sessions/{self.current}',
+                      json={'title': text(self.rng, 4)})
+
+    def history(self):
+        self.call('GET /api/history', 'GET', '/api/history?limit=50', conditional=True)
+
+    def poll(self):
+        self.call('GET /api/admin/announcement', 'GET', '/api/admin/announcement', conditional=True)
+
+    def run(self):
+        args = self.args
+        speedup = args.speedup
+        now = time.monotonic()
+        # 开始时在 --ramp 秒内全部登录
+        time.sleep(self.rng.uniform(0, args.ramp))
+        self.login()
+        self.list_sessions()
+        self.open_session()
+        now = time.monotonic()
+        schedule = {
+            'poll': now + self.rng.uniform(0, 5 / speedup),
+            'turn': now + self.rng.expovariate(speedup / args.turn),
+            'burst': self.started + args.login_burst / speedup,
+            'browse': now + self.rng.expovariate(speedup / args.browse),
+        }
+        while True:
+            action = min(schedule, key=schedule.get)
+            wait = schedule[action] - time.monotonic()
+            if schedule[action] >= self.stop_at:
+                return
+            if wait > 0:
+                time.sleep(wait)
+            if action == 'poll':
+                self.poll()
+                schedule['poll'] += 5 / speedup
+            elif action == 'turn':
+                self.turn()
+                schedule['turn'] = time.monotonic() + self.rng.expovariate(speedup / args.turn)
+            elif action == 'burst':
+                # 所有用户在同一时刻决定是否重新登录，形成登录高峰
+                if self.rng.random() < args.login_burst_fraction:
+                    self.login()
+                    self.list_sessions()
+                    self.open_session()
+                schedule['burst'] += args.login_burst / speedup
+            else:
+                choice = self.rng.random()
+                if choice < 0.5:
+                    self.open_session()
+                elif choice < 0.7:
+                    self.history()
+                elif choice < 0.85:
+                    self.new_session()
+                else:
+                    self.rename()
+                schedule['browse'] = time.monotonic() + self.rng.expovariate(speedup / args.browse)
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}  # label -> [(status, seconds)]
+
+    def __call__(self, label, status, seconds):
+        with self._lock:
+            self.samples.setdefault(label, []).append((status, seconds))
+
+
+def summarize(samples, elapsed):
+    latencies = [seconds for _, seconds in samples]
+    statuses = {}
+    for status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'count': len(samples),
+        'errors': sum(1 for status, _ in samples if status == 0 or status >= 500),
+        'status': statuses,
+        'throughput': len(samples) / elapsed,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def git_revision():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True).stdout.strip())
+    except OSError:
+        return None, None
+    return commit or None, dirty
+
+
+def print_report(results):
+    print(f'{"endpoint":40s} {"count":>7s} {"err":>5s} {"req/s":>8s} {"p50":>8s} {"p95":>8s} {"p99":>8s}')
+    for label, stats in sorted(results['endpoints'].items()) + [('total', results['total'])]:
+        print(f'{label:40s} {stats["count"]:7d} {stats["errors"]:5d} {stats["throughput"]:8.1f} '
+              f'{stats["p50_ms"]:7.1f}ms {stats["p95_ms"]:7.1f}ms {stats["p99_ms"]:7.1f}ms')
+
+
+def print_comparison(base, results):
+    print()
+    print(f'对比 {base["meta"].get("commit") or "?"} -> {results["meta"].get("commit") or "?"}')
+    changed = sorted(k for k, v in results['meta']['args'].items()
+                     if k not in ('database', 'seed_only') and base['meta']['args'].get(k) != v)
+    if changed:
+        print(f'注意：两次运行的参数不同（{", ".join(changed)}），结果不可直接比较')
+    print(f'{"endpoint":40s} {"req/s":>16s} {"p95":>20s} {"p99":>20s}')
+    for label in sorted(set(base['endpoints']) | set(results['endpoints'])) + ['total']:
+        old = base['total'] if label == 'total' else base['endpoints'].get(label)
+        new = results['total'] if label == 'total' else results['endpoints'].get(label)
+        if old is None or new is None:
+            print(f'{label:40s} {"仅在一次结果中出现":>16s}')
+            continue
+
+        def change(key):
+            delta = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            return f'{new[key]:8.1f} ({delta:+5.0f}%)'
+        print(f'{label:40s} {change("throughput"):>16s} {change("p95_ms"):>20s} {change("p99_ms"):>20s}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50, help='用户数（同时也是虚拟用户数）')
+    parser.add_argument('--sessions', type=int, default=20, help='每个用户的会话数')
+    parser.add_argument('--messages', type=int, default=20, help='每个会话的消息数')
+    parser.add_argument('--history', type=int, default=50, help='每个用户的聊天记录条数')
+    parser.add_argument('--words', type=int, default=100, help='每条回复的词数')
+    parser.add_argument('--duration', type=float, default=60, help='测试时长（秒）')
+    parser.add_argument('--speedup', type=float, default=1.0, help='所有等待时间除以该值，用来在较短时间内加大负载')
+    parser.add_argument('--ramp', type=float, default=1.0, help='开始时所有用户在这段时间内登录（秒）')
+    parser.add_argument('--turn', type=float, default=20.0, help='两轮对话的平均间隔（秒）')
+    parser.add_argument('--browse', type=float, default=30.0, help='打开会话、翻看记录等操作的平均间隔（秒）')
+    parser.add_argument('--login-burst', type=float, default=30.0, help='登录高峰的间隔（秒）')
+    parser.add_argument('--login-burst-fraction', type=float, default=0.3, help='每次登录高峰中重新登录的用户比例')
+    parser.add_argument('--completions', action='store_true',
+                        help='对话走真实的流式补全接口（进程内模式自动启动模拟 llama-server）')
+    parser.add_argument('--seed', type=int, default=1, help='随机数种子，相同参数生成相同的数据和请求序列')
+    parser.add_argument('--database', help='数据库文件，默认新建临时文件；已有测试数据时不再生成')
+    parser.add_argument('--seed-only', action='store_true', help='只生成数据，配合 --url 使用')
+    parser.add_argument('--url', help='向该地址的服务发送请求，而不是使用进程内的 test client')
+    parser.add_argument('--output', help='结果保存为 JSON')
+    parser.add_argument('--compare', help='与之前保存的 JSON 结果对比')
+    args = parser.parse_args()
+
+    os.environ['DATABASE'] = args.database or os.path.join(tempfile.mkdtemp(), 'load.db')
+    if args.completions and not args.url:
+        from fake_llama_server import serve
+        _, upstream_url = serve(tokens=64, delay=0.005, slots=max(4, args.users))
+        os.environ['MODEL_UPSTREAMS'] = f'QwQ-32B={upstream_url}'
+        os.environ.setdefault('ROUTER_DEFAULT_SLOTS', str(max(4, args.users)))
+
+    seed_seconds = seed(args)
+    if seed_seconds is not None:
+        print(f'生成数据 {args.users} 用户 x {args.sessions} 会话 x {args.messages} 消息，'
+              f'{args.history} 条记录/用户，耗时 {seed_seconds:.1f}s（{os.environ["DATABASE"]}）')
+    if args.seed_only:
+        return
+
+    target = HTTPTarget(args.url) if args.url else TestClientTarget()
+    recorder = Recorder()
+    started = time.monotonic()
+    stop_at = started + args.duration
+    users = [VirtualUser(i, target, args, recorder, started, stop_at) for i in range(args.users)]
+    threads = [threading.Thread(target=user.run, daemon=True) for user in users]
+    # 屏蔽接口自身的 print 输出
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.monotonic() - started
+
+    commit, dirty = git_revision()
+    results = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'target': target.name,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+            'seed_seconds': seed_seconds,
+            'elapsed': elapsed,
+        },
+        'endpoints': {label: summarize(samples, elapsed) for label, samples in recorder.samples.items()},
+        'total': summarize([s for samples in recorder.samples.values() for s in samples], elapsed),
+    }
+    print_report(results)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'结果已保存到 {args.output}')
+
+
+if __name__ == '__main__':
+    main()
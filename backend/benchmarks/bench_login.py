@@ -0,0 +1,118 @@
+"""并发登录压测
+
+模拟一批用户同时登录，同时持续请求一个不涉及密码的接口（/api/agreement），
+对比在请求线程内直接计算 bcrypt 与使用独立进程池时的登录吞吐量、
+普通接口延迟，以及进程池满时被快速拒绝（503）的次数。被拒绝的客户端
+稍后重试，与前端遇到 503 时的行为一致。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_login.py --users 64 --threads 16 --rounds 10
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret-key-0123456789abcdef')
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+
+import database  # noqa: E402
+import passwords  # noqa: E402
+import app as app_module  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def seed(users, rounds):
+    database.init_db()
+    conn = database.connect()
+    hasher = passwords.PasswordHasher(workers=0, rounds=rounds)
+    hashed = hasher.hash('password')
+    conn.executemany('''
+        INSERT OR IGNORE INTO users (username, email, password, is_admin)
+        VALUES (?, ?, ?, 0)
+    ''', [(f'user{i}', f'user{i}@example.com', hashed) for i in range(users)])
+    conn.commit()
+    conn.close()
+
+
+def run(label, hasher, users, threads):
+    app_module.password_hasher = hasher
+    app_module.login_throttle = passwords.LoginThrottle()
+    app = app_module.app
+    local = threading.local()
+    stop = threading.Event()
+    probe_latencies = []
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        return local.client
+
+    def probe():
+        c = app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            c.get('/api/agreement')
+            probe_latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    def login(i):
+        start = time.perf_counter()
+        rejected = 0
+        while True:
+            resp = client().post('/api/login', json={'username': f'user{i}', 'password': 'password'})
+            if resp.status_code != 503:
+                return resp.status_code, time.perf_counter() - start, rejected
+            rejected += 1
+            time.sleep(0.05)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    start = time.perf_counter()
+    # 屏蔽接口自身的 print 输出
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(login, range(users)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    prober.join()
+
+    ok = [t for status, t, _ in results if status == 200]
+    rejected = sum(r for _, _, r in results)
+    print(f'{label:<8} 成功 {len(ok):>4}  拒绝(503) {rejected:>4}  '
+          f'登录 {len(ok) / elapsed:6.1f}/s  '
+          f'登录 p50 {statistics.median(ok) * 1000 if ok else 0:7.1f}ms p95 {percentile(ok, 95) * 1000:7.1f}ms  '
+          f'普通接口 p95 {percentile(probe_latencies, 95) * 1000:6.1f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--max-pending', type=int, default=None)
+    args = parser.parse_args()
+
+    seed(args.users, args.rounds)
+    max_pending = args.max_pending or args.workers * 4
+    run('inline', passwords.PasswordHasher(workers=0, rounds=args.rounds), args.users, args.threads)
+    run('pool', passwords.PasswordHasher(workers=args.workers, max_pending=max_pending,
+                                         rounds=args.rounds), args.users, args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""指标记录开销测试
+
+测量请求钩子和 SQL 计时每次调用的耗时，以及有 N 个 worker 指标文件时
+/metrics 汇总一次的耗时。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_metrics.py --workers 8
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['METRICS_DIR'] = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret-key-0123456789abcdef')
+
+import database  # noqa: E402
+from app import app  # noqa: E402
+import metrics  # noqa: E402
+
+
+def per_call(stmt, number=200000):
+    return min(timeit.repeat(stmt, number=number, repeat=3)) / number * 1e6
+
+
+def fill(_):
+    # 模拟一个 worker：写出自己的指标文件后退出
+    for _ in range(1000):
+        metrics.store.observe_request('/api/user', 'GET', 200, 0.003, None, 512)
+        metrics.store.observe_query('SELECT 1', 0.0002)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+    database.init_db()
+    store = metrics.store
+    print(f'layout: {store.layout.size} values ({store.layout.size * 8 / 1024:.0f} KiB per worker)')
+    print(f'observe_request: {per_call(lambda: store.observe_request("/api/user", "GET", 200, 0.003, 120, 512)):.2f} us')
+    print(f'observe_query:   {per_call(lambda: store.observe_query("SELECT 1", 0.0002)):.2f} us')
+    print(f'inflight +1/-1:  {per_call(lambda: (store.inflight(1), store.inflight(-1))):.2f} us')
+
+    conn = database.connect()
+    plain = database.sqlite3.connect(database.DATABASE)
+    timed = per_call(lambda: conn.execute('SELECT 1').fetchone(), 100000)
+    baseline = per_call(lambda: plain.execute('SELECT 1').fetchone(), 100000)
+    print(f'SELECT 1: {baseline:.2f} us plain, {timed:.2f} us timed')
+
+    with multiprocessing.Pool(args.workers) as pool:
+        pool.map(fill, range(args.workers))
+    started = time.perf_counter()
+    body = store.render()
+    print(f'/metrics with {args.workers + 1} worker files: {(time.perf_counter() - started) * 1000:.1f} ms, '
+          f'{len(body) / 1024:.0f} KiB')
+    client = app.test_client()
+    started = time.perf_counter()
+    for _ in range(2000):
+        client.get('/api/agreement')
+    print(f'GET /api/agreement via test client: {(time.perf_counter() - started) / 2000 * 1e6:.0f} us/request')
+
+
+if __name__ == '__main__':
+    main()
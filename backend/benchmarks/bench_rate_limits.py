@@ -0,0 +1,99 @@
+"""限流与额度检查测试
+
+输出每次令牌桶检查和额度检查（规则已缓存）的耗时，与每次在 SQLite 中读写
+计数的做法对比；再用多个进程同时向同一个用户的桶取令牌、累加同一个用户的
+用量，检查跨进程计数是否准确：允许的请求数应等于桶的容量，累加的用量应等于
+各进程累加之和。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_rate_limits.py --processes 4 --requests 20000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret-key-0123456789abcdef')
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+os.environ['RATE_LIMIT_FILE'] = os.path.join(tempfile.mkdtemp(), 'ratelimit.bin')
+
+import rate_limits  # noqa: E402
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def worker(limits, requests, tokens, results):
+    limiter = rate_limits.RateLimiter(limits)
+    allowed = 0
+    for _ in range(requests):
+        allowed += not limiter.take('completions', 'alice')
+        limiter.consume('alice', 'QwQ-32B', tokens)
+    results.put(allowed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000, help='每个进程的请求数')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--burst', type=int, default=500, help='多进程测试中桶的容量（一小时恢复一次）')
+    args = parser.parse_args()
+
+    import database
+    database.init_db()
+    conn = database.connect()
+    conn.execute("INSERT INTO token_quotas (username, model, daily_tokens) VALUES ('*', 'QwQ-32B', 100000)")
+    conn.commit()
+    cursor = conn.cursor()
+
+    limiter = rate_limits.RateLimiter('completions=1000000/1')
+    users = [f'user{i}' for i in range(args.users)]
+    take = timed(lambda i: limiter.take('completions', users[i % args.users]), args.requests)
+    check = timed(lambda i: limiter.check_quota(cursor, users[i % args.users], 'QwQ-32B'), args.requests)
+
+    # 对照：每次检查在 SQLite 中读写一行计数
+    conn.execute('CREATE TABLE buckets (key TEXT PRIMARY KEY, tokens REAL, updated_at REAL) WITHOUT ROWID')
+
+    def sqlite_take(i):
+        now = time.time()
+        conn.execute('''
+            INSERT INTO buckets (key, tokens, updated_at) VALUES (?, 999, ?)
+            ON CONFLICT (key) DO UPDATE SET tokens = MIN(1000, tokens + (? - updated_at) * 1000) - 1, updated_at = ?
+        ''', (users[i % args.users], now, now, now))
+        conn.commit()
+
+    sqlite = timed(sqlite_take, args.requests)
+    print(f'{args.users} users, {args.requests} checks')
+    print(f'bucket take (shared mmap)   {take:7.2f}us')
+    print(f'quota check (cached rules)  {check:7.2f}us')
+    print(f'bucket take (sqlite upsert) {sqlite:7.2f}us')
+
+    results = multiprocessing.Queue()
+    limits = f'completions={args.burst}/{args.burst * 3600}'
+    started = time.perf_counter()
+    processes = [multiprocessing.Process(target=worker, args=(limits, args.requests, 3, results))
+                 for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    allowed = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    used = limiter.used('alice', 'QwQ-32B')
+    expected = args.processes * args.requests * 3
+    print(f'{args.processes} processes x {args.requests} requests in {elapsed:.2f}s: '
+          f'allowed {allowed} (burst {args.burst}) {"ok" if allowed == args.burst else "WRONG"}, '
+          f'used {used} tokens (expected {expected}) {"ok" if used == expected else "WRONG"}')
+
+
+if __name__ == '__main__':
+    main()
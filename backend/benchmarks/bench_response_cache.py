@@ -0,0 +1,94 @@
+"""确定性补全回复缓存测试
+
+启动本地模拟 llama-server，按 Zipf 分布从一组常见问题（类似课程 FAQ）中抽题，
+以 temperature 0 逐个发起流式补全，每个问题开一个新会话。分别在不缓存和开启
+缓存（memory / sqlite）时输出命中率、模型实际生成的 token 数和命中/未命中
+请求的延迟。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_response_cache.py --requests 300 --questions 50
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret-key-0123456789abcdef')
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+os.environ.setdefault('RATE_LIMITS', '')  # 测的是吞吐，不按用户限流
+
+from fake_llama_server import serve  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--questions', type=int, default=50, help='不同问题的数量')
+    parser.add_argument('--zipf', type=float, default=1.1, help='问题热度的 Zipf 指数')
+    parser.add_argument('--tokens', type=int, default=64, help='每次回复的 token 数')
+    parser.add_argument('--delay', type=float, default=0.005, help='token 间隔（秒）')
+    args = parser.parse_args()
+
+    fake, upstream_url = serve(tokens=args.tokens, delay=args.delay, slots=4)
+    os.environ['MODEL_UPSTREAMS'] = f'QwQ-32B={upstream_url}'
+
+    from flask_jwt_extended import create_access_token
+    import app as backend
+    import database
+    import response_cache
+    from app import app
+
+    database.init_db()
+    conn = database.connect()
+    conn.execute("INSERT INTO users (username, email, password) VALUES ('bench', 'bench@example.com', 'x')")
+    conn.commit()
+    with app.app_context():
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity='bench')}
+    client = app.test_client()
+
+    questions = [f'课程常见问题 {i}：第 {i} 次作业的提交方式和截止时间是什么？' for i in range(args.questions)]
+    weights = [1 / (rank + 1) ** args.zipf for rank in range(args.questions)]
+    rng = random.Random(1)
+    picks = rng.choices(range(args.questions), weights, k=args.requests)
+
+    print(f'{args.requests} requests over {args.questions} questions (zipf {args.zipf}), {args.tokens} tokens per reply')
+    print(f'{"mode":7s} {"hit rate":>8s} {"model tokens":>12s} {"p50 miss":>9s} {"p50 hit":>9s} {"total":>8s}')
+    for mode in ('off', 'memory', 'sqlite'):
+        cache = backend.response_cache = response_cache.ResponseCache(mode)
+        conn.execute('DELETE FROM response_cache')
+        conn.commit()
+        latencies = {False: [], True: []}
+        model_tokens = 0
+        started = time.perf_counter()
+        for pick in picks:
+            session_id = client.post('/api/chat/sessions', headers=headers,
+                                     json={'title': 'faq', 'messages': []}).json['id']
+            request_started = time.perf_counter()
+            response = client.post('/api/chat/completions', headers=headers, json={
+                'session_id': session_id, 'model': 'QwQ', 'temperature': 0,
+                'messages': [{'role': 'user', 'content': questions[pick]}]
+            })
+            body = response.get_data()
+            assert response.status_code == 200, body
+            hit = b'"cached": true' in body
+            latencies[hit].append(time.perf_counter() - request_started)
+            if not hit:
+                model_tokens += args.tokens
+        total = time.perf_counter() - started
+        stats = cache.snapshot()
+        print(f'{mode:7s} {stats["hit_rate"]:8.1%} {model_tokens:12d} {percentile(latencies[False], 50) * 1000:7.1f}ms '
+              f'{percentile(latencies[True], 50) * 1000:7.1f}ms {total:7.2f}s')
+    fake.shutdown()
+
+
+if __name__ == '__main__':
+    main()
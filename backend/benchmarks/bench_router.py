@@ -0,0 +1,116 @@
+"""副本路由压测
+
+启动两个模拟 llama-server（各 4 个 slot，对应 -np 4），另外配置一个无法连接的
+副本，用多个并发客户端循环发起流式补全，对比三种分配方式：
+- single: 所有请求发往同一个地址（原来前端按模型名取固定 api 的方式）
+- random: 在存活副本之间随机选择，不考虑负载
+- router: upstream_router 按负载选择，包含无法连接的副本
+
+输出每种方式的总吞吐（tokens/s）、请求耗时 p50/p95/p99 和错误数。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_router.py --clients 8 --requests 8
+"""
+import argparse
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('ROUTER_POLL_INTERVAL', '0.5')
+
+from completions import upstream_pool, build_payload, StreamParser, UpstreamError  # noqa: E402
+from router import upstream_router  # noqa: E402
+from fake_llama_server import serve  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def read_stream(resp):
+    parser = StreamParser()
+    try:
+        for chunk in resp.iter_content(chunk_size=None):
+            parser.feed(chunk)
+    finally:
+        resp.close()
+    return parser.result()[2]
+
+
+def run_mode(name, open_stream, clients, requests_per_client, tokens):
+    latencies, errors, total_tokens = [], [], [0]
+    lock = threading.Lock()
+    payload = build_payload('bench', [{'role': 'user', 'content': 'hello'}], {'max_tokens': tokens})
+
+    def client():
+        for _ in range(requests_per_client):
+            started = time.perf_counter()
+            try:
+                generated = open_stream(payload)
+            except UpstreamError as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                total_tokens[0] += generated
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    print(f'{name:7s} {total_tokens[0] / elapsed:8.0f} tokens/s  '
+          f'p50 {percentile(latencies, 50) * 1000:6.0f}ms  p95 {percentile(latencies, 95) * 1000:6.0f}ms  '
+          f'p99 {percentile(latencies, 99) * 1000:6.0f}ms  errors {len(errors)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8, help='并发客户端数，默认等于两个副本的 slot 总数')
+    parser.add_argument('--requests', type=int, default=8, help='每个客户端的请求数')
+    parser.add_argument('--tokens', type=int, default=32)
+    args = parser.parse_args()
+
+    first, first_url = serve(delay=0.01, first_token_delay=0.05, slots=4)
+    second, second_url = serve(delay=0.01, first_token_delay=0.05, slots=4)
+    dead_url = f'http://127.0.0.1:{closed_port()}'
+    live = [first_url, second_url]
+    print(f'clients {args.clients}, requests/client {args.requests}, tokens/request {args.tokens}')
+
+    def single(payload):
+        return read_stream(upstream_pool.open_stream(first_url, payload))
+
+    def pick_random(payload):
+        return read_stream(upstream_pool.open_stream(random.choice(live), payload))
+
+    def routed(payload):
+        lease, resp = upstream_router.open_stream([dead_url, first_url, second_url], payload)
+        try:
+            return read_stream(resp)
+        finally:
+            upstream_router.end(lease)
+
+    run_mode('single', single, args.clients, args.requests, args.tokens)
+    run_mode('random', pick_random, args.clients, args.requests, args.tokens)
+    run_mode('router', routed, args.clients, args.requests, args.tokens)
+    print('replicas:', upstream_router.snapshot())
+    first.shutdown()
+    second.shutdown()
+
+
+if __name__ == '__main__':
+    main()
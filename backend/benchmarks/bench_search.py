@@ -0,0 +1,157 @@
+"""全文搜索压测
+
+生成数百万条会话消息（中英文混合，按用户分布），用 search.py 建立索引，
+然后按不同类型的搜索词统计 /api/search 使用的查询耗时（第一页和第二页），
+以及追加消息时同步更新索引的耗时。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_search.py --messages 2000000 --users 1000
+    python benchmarks/bench_search.py --db /tmp/search.db   # 复用已经生成的库
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+
+CHINESE = ('模型 代码 数据 训练 问题 回答 函数 服务器 部署 显卡 推理 文档 测试 错误 日志 配置 参数 网络 '
+           '学习 论文 实验 结果 方法 分析 环境 安装 版本 内存 节点 作业 队列 的 是 了 我 你 这个 怎么 可以 需要').split()
+ENGLISH = ('python model error deploy slurm gpu server token cache memory function request database index '
+           'query llama cuda tensor batch kernel thread socket').split()
+MESSAGES_PER_SESSION = 20
+
+# (类别, 搜索词生成函数)
+QUERIES = [
+    ('common zh', lambda rng: rng.choice(CHINESE[:20])),
+    ('zh phrase', lambda rng: rng.choice(CHINESE[:20]) + rng.choice(CHINESE[:20])),
+    ('english', lambda rng: rng.choice(ENGLISH)),
+    ('two terms', lambda rng: f'{rng.choice(ENGLISH)} {rng.choice(CHINESE[:20])}'),
+    ('rare', lambda rng: f'x{rng.randrange(100000)}'),
+    ('single zh', lambda rng: rng.choice('模数服显推')),
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def make_text(rng):
+    parts = []
+    for _ in range(rng.randint(5, 60)):
+        r = rng.random()
+        if r < 0.55:
+            parts.append(rng.choice(CHINESE))
+        elif r < 0.9:
+            parts.append(rng.choice(ENGLISH))
+        else:
+            parts.append(f'x{rng.randrange(100000)}')
+    # 中文通常不带空格，英文之间有空格
+    return ''.join(p if not p.isascii() else f' {p} ' for p in parts).strip()
+
+
+def generate(conn, messages, users, rng):
+    from search import search_index
+    sessions = messages // MESSAGES_PER_SESSION
+    started = time.perf_counter()
+    conn.executemany("INSERT INTO users (username, email, password) VALUES (?, '', 'x')",
+                     [(f'user{i}',) for i in range(users)])
+    batch = []
+    for session_id in range(1, sessions + 1):
+        conn.execute('''
+            INSERT INTO chat_sessions (id, username, title, messages, createdAt, updatedAt, message_count)
+            VALUES (?, ?, ?, '[]', datetime('now'), datetime('now'), ?)
+        ''', (session_id, f'user{rng.randrange(users)}', make_text(rng)[:20], MESSAGES_PER_SESSION))
+        for seq in range(MESSAGES_PER_SESSION):
+            batch.append((session_id, seq, 'user' if seq % 2 == 0 else 'assistant', make_text(rng)))
+        if len(batch) >= 50000:
+            conn.executemany('''
+                INSERT INTO session_messages (session_id, seq, role, content, message_json)
+                VALUES (?1, ?2, ?3, ?4, json_object('role', ?3, 'content', ?4))
+            ''', batch)
+            batch = []
+    conn.executemany('''
+        INSERT INTO session_messages (session_id, seq, role, content, message_json)
+        VALUES (?1, ?2, ?3, ?4, json_object('role', ?3, 'content', ?4))
+    ''', batch)
+    conn.commit()
+    generated = time.perf_counter()
+    print(f'generated {sessions * MESSAGES_PER_SESSION} messages in {sessions} sessions '
+          f'for {users} users: {generated - started:.0f}s')
+    search_index.rebuild(conn)
+    conn.commit()
+    print(f'indexed: {time.perf_counter() - generated:.0f}s')
+
+
+def index_size(conn):
+    try:
+        return conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'search_index%'").fetchone()[0]
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=200, help='每类搜索词的查询次数')
+    parser.add_argument('--db', help='数据库路径，已存在时直接使用')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'search.db')
+    existing = os.path.exists(path)
+    os.environ['DATABASE'] = path
+    import database
+    from search import search_index
+    database.init_db()
+    conn = database.connect()
+    rng = random.Random(42)
+    if not existing:
+        generate(conn, args.messages, args.users, rng)
+
+    total = conn.execute('SELECT COUNT(*) FROM session_messages').fetchone()[0]
+    users = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    size = os.path.getsize(path)
+    index = index_size(conn)
+    print(f'{total} messages, {users} users, db {size / 1e6:.0f}MB'
+          + (f', search index {index / 1e6:.0f}MB' if index else ''))
+
+    cursor = conn.cursor()
+    print(f'{"query":10s} {"hits":>6s} {"p50":>8s} {"p95":>8s} {"p99":>8s} {"max":>8s}   page 2 p95')
+    for name, make_query in QUERIES:
+        first, second, hits = [], [], 0
+        for _ in range(args.queries):
+            username, q = f'user{rng.randrange(users)}', make_query(rng)
+            started = time.perf_counter()
+            results, has_more = search_index.search(cursor, username, q, 20)
+            first.append(time.perf_counter() - started)
+            hits += len(results)
+            started = time.perf_counter()
+            search_index.search(cursor, username, q, 20, 20)
+            second.append(time.perf_counter() - started)
+        print(f'{name:10s} {hits / args.queries:6.1f} {percentile(first, 50) * 1000:6.1f}ms '
+              f'{percentile(first, 95) * 1000:6.1f}ms {percentile(first, 99) * 1000:6.1f}ms '
+              f'{max(first) * 1000:6.1f}ms   {percentile(second, 95) * 1000:6.1f}ms')
+
+    # 追加一轮对话时索引的增量更新，与 write_session_messages 在同一事务中
+    from app import write_session_messages
+    sessions = conn.execute('SELECT id, username, message_count FROM chat_sessions ORDER BY random() LIMIT 200').fetchall()
+    timings = []
+    for session_id, username, count in sessions:
+        started = time.perf_counter()
+        write_session_messages(cursor, username, session_id, count, [
+            {'role': 'user', 'content': make_text(rng)}, {'role': 'assistant', 'content': make_text(rng)}
+        ])
+        conn.commit()
+        timings.append(time.perf_counter() - started)
+    print(f'append 2 messages with index update: p50 {percentile(timings, 50) * 1000:.1f}ms  '
+          f'p95 {percentile(timings, 95) * 1000:.1f}ms')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
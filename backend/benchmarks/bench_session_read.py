@@ -0,0 +1,86 @@
+"""大会话读取压测
+
+对比读取一个很长的会话时两种序列化方式的耗时、峰值内存和响应大小：
+- decode: 旧实现，逐条读出 role/content 组装成字典列表，再由 jsonify 编码
+- passthrough: 现在的 GET /api/chat/sessions/<id>，直接拼接写入时生成的 message_json
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_session_read.py --messages 2000 --chars 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret-key-0123456789abcdef')
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+os.environ.setdefault('RATE_LIMITS', '')  # 测的是吞吐，不按用户限流
+
+import database  # noqa: E402
+from app import app  # noqa: E402
+from flask import jsonify  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+
+def legacy_read(session_id):
+    """旧实现：解码为 Python 对象后再编码"""
+    with app.test_request_context():
+        cursor = database.get_db().cursor()
+        cursor.execute('SELECT role, content FROM session_messages WHERE session_id = ? ORDER BY seq', (session_id,))
+        messages = [{'role': row['role'], 'content': row['content']} for row in cursor.fetchall()]
+        return jsonify({'id': session_id, 'title': 'bench', 'messages': messages}).get_data()
+
+
+def measure(fn, repeat):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = fn()
+    elapsed = (time.perf_counter() - started) / repeat
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--chars', type=int, default=2000, help='每条消息的字符数')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    database.init_db()
+    conn = database.connect()
+    conn.execute("INSERT INTO users (username, email, password) VALUES ('bench', '', 'x')")
+    conn.commit()
+    conn.close()
+    rng = random.Random(1)
+    alphabet = '模型推理部署显卡数据代码 abcdefghij\n"{}'
+    messages = [{'role': 'user' if i % 2 == 0 else 'assistant',
+                 'content': ''.join(rng.choice(alphabet) for _ in range(args.chars))}
+                for i in range(args.messages)]
+    with app.app_context():
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity='bench')}
+    client = app.test_client()
+    session_id = client.post('/api/chat/sessions', headers=headers,
+                             json={'title': 'bench', 'messages': messages}).json['id']
+
+    def passthrough():
+        return client.get(f'/api/chat/sessions/{session_id}', headers=headers).get_data()
+
+    assert client.get(f'/api/chat/sessions/{session_id}', headers=headers).json['messages'] == messages
+    print(f'{args.messages} messages x {args.chars} chars')
+    for name, fn in (('decode', lambda: legacy_read(session_id)), ('passthrough', passthrough)):
+        elapsed, peak, size = measure(fn, args.repeat)
+        print(f'{name:12s} {elapsed * 1000:7.1f} ms  peak {peak / 1e6:6.1f} MB  response {size / 1e6:5.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""流式补全代理测试
+
+启动本地模拟 llama-server 和后端，并发发起流式补全，统计客户端看到的首 token
+延迟和吞吐，并检查回复是否只在服务端保存了一次。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_stream.py --streams 32 --tokens 64
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret-key-0123456789abcdef')
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+os.environ.setdefault('RATE_LIMITS', '')  # 测的是吞吐，不按用户限流
+
+from fake_llama_server import serve  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streams', type=int, default=32)
+    parser.add_argument('--tokens', type=int, default=64)
+    parser.add_argument('--delay', type=float, default=0.005)
+    args = parser.parse_args()
+
+    # 每个流占一个 slot，测的是代理本身的开销，不让请求在准入控制中排队
+    fake, upstream_url = serve(tokens=args.tokens, delay=args.delay, slots=args.streams)
+    os.environ['MODEL_UPSTREAMS'] = f'QwQ-32B={upstream_url}'
+    os.environ['ROUTER_DEFAULT_SLOTS'] = str(args.streams)
+
+    import requests
+    from werkzeug.serving import make_server
+    from flask_jwt_extended import create_access_token
+    import database
+    from app import app
+    from completions import completion_stats
+
+    database.init_db()
+    conn = database.connect()
+    conn.execute("INSERT INTO users (username, email, password) VALUES ('bench', 'bench@example.com', 'x')")
+    for i in range(args.streams):
+        conn.execute('''
+            INSERT INTO chat_sessions (username, title, messages, createdAt, updatedAt)
+            VALUES ('bench', ?, '[]', datetime('now'), datetime('now'))
+        ''', (f'session {i}',))
+    conn.commit()
+    session_ids = [row[0] for row in conn.execute('SELECT id FROM chat_sessions ORDER BY id')]
+    conn.close()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    with app.app_context():
+        token = create_access_token(identity='bench')
+
+    ttfts, durations, errors = [], [], []
+
+    def run(session_id):
+        started = time.perf_counter()
+        first = None
+        try:
+            resp = requests.post(f'{base_url}/api/chat/completions', stream=True, headers={
+                'Authorization': f'Bearer {token}'
+            }, json={
+                'session_id': session_id,
+                'model': 'QwQ',
+                'messages': [{'role': 'user', 'content': f'hello {session_id}'}]
+            })
+            if resp.status_code != 200:
+                errors.append(resp.status_code)
+                return
+            for line in resp.iter_lines():
+                if first is None and line.startswith(b'data:') and b'"content"' in line:
+                    first = time.perf_counter()
+            ttfts.append(first - started)
+            durations.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(str(e))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=run, args=(sid,)) for sid in session_ids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    time.sleep(0.2)  # 等待最后的保存完成
+
+    conn = database.connect()
+    saved = conn.execute('''
+        SELECT COUNT(*) FROM session_messages WHERE role = 'assistant'
+    ''').fetchone()[0]
+    counts = [row[0] for row in conn.execute('SELECT message_count FROM chat_sessions')]
+    conn.close()
+    server.shutdown()
+    fake.shutdown()
+
+    print(f'streams: {args.streams}, tokens/stream: {args.tokens}, errors: {len(errors)}')
+    if ttfts:
+        print(f'client ttft  p50 {percentile(ttfts, 50) * 1000:.1f}ms  p95 {percentile(ttfts, 95) * 1000:.1f}ms')
+        print(f'stream time  mean {statistics.mean(durations) * 1000:.1f}ms')
+    print(f'throughput   {args.streams * args.tokens / elapsed:.0f} tokens/s')
+    print(f'server stats {json.dumps(completion_stats.snapshot())}')
+    print(f'assistant messages saved: {saved}, message counts: {sorted(set(counts))}')
+    ok = not errors and saved == args.streams and set(counts) == {2}
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""模型使用统计写入压测
+
+多个进程（模拟 gunicorn worker）同时执行 /api/chat 的写事务，对比：
+- hot-row: 旧实现，每次对话在请求事务中 UPDATE model_stats 的同一行
+- batched: 在进程内累加，由 usage_stats 的后台线程批量写入汇总表
+
+输出每秒完成的对话数和单次事务耗时，最后核对汇总表中的对话数与实际对话数一致。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_usage.py --workers 4 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+os.environ.setdefault('USAGE_FLUSH_INTERVAL', '1')
+
+MODELS = ['DS-R1', 'Qwen2.5-32B', 'QwQ-32B']
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def worker(path, mode, duration, index, results):
+    os.environ['DATABASE'] = path
+    import database
+    from usage_stats import usage_stats
+    database.DATABASE = path
+    conn = database.connect()
+    rng = random.Random(index)
+    timings = []
+    stop_at = time.monotonic() + duration
+    while time.monotonic() < stop_at:
+        model, user = rng.choice(MODELS), f'user{rng.randrange(200)}'
+        started = time.perf_counter()
+        conn.execute('''
+            INSERT INTO chat_history (username, user, ai, model, timestamp) VALUES (?, 'hi', 'hello', ?, ?)
+        ''', (user, model, time.time()))
+        if mode == 'hot-row':
+            conn.execute('UPDATE model_stats SET total_chats = total_chats + 1 WHERE model_name = ?', (model,))
+        conn.commit()
+        if mode == 'batched':
+            usage_stats.record(model, user, 100, 50, rng.uniform(0.1, 0.5), 1.0)
+        timings.append(time.perf_counter() - started)
+    usage_stats.flush()
+    conn.close()
+    results.put(timings)
+
+
+def run_mode(mode, args):
+    path = os.path.join(tempfile.mkdtemp(), 'usage.db')
+    os.environ['DATABASE'] = path
+    import database
+    database.DATABASE = path
+    database.init_db()
+    conn = database.connect()
+    conn.execute('CREATE TABLE model_stats (model_name TEXT PRIMARY KEY, total_chats INTEGER DEFAULT 0)')
+    conn.executemany('INSERT INTO model_stats (model_name) VALUES (?)', [(m,) for m in MODELS])
+    conn.commit()
+
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(path, mode, args.duration, i, results))
+             for i in range(args.workers)]
+    for p in procs:
+        p.start()
+    timings = []
+    for _ in procs:
+        timings += results.get()
+    for p in procs:
+        p.join()
+
+    chats = conn.execute('SELECT COUNT(*) FROM chat_history').fetchone()[0]
+    if mode == 'batched':
+        recorded = conn.execute('SELECT COALESCE(SUM(chats), 0) FROM model_usage').fetchone()[0]
+    else:
+        recorded = conn.execute('SELECT SUM(total_chats) FROM model_stats').fetchone()[0]
+    conn.close()
+    print(f'{mode:8s} {chats / args.duration:8.0f} chats/s  p50 {percentile(timings, 50) * 1000:.2f}ms  '
+          f'p95 {percentile(timings, 95) * 1000:.2f}ms  p99 {percentile(timings, 99) * 1000:.2f}ms  '
+          f'recorded {recorded}/{chats}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+    print(f'{args.workers} workers, {args.duration:.0f}s per mode')
+    run_mode('hot-row', args)
+    run_mode('batched', args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""热点接口的查询计划检查
+
+在一个新建的数据库上依次调用用户日常使用的接口（登录、聊天、历史分页、会话
+的列表 / 读取 / 创建 / 修改 / 增量保存 / 删除、搜索、流式补全和回复缓存）
+以及后台任务（使用统计写入、冷会话归档），记录期间执行的每一条 SQL，逐条
+EXPLAIN QUERY PLAN。出现对普通表的全表扫描（SCAN，包括按顺序扫描整个索引）
+时列出语句和计划并以状态码 1 退出，可以放在 CI 中运行；加 --verbose 输出
+所有语句的计划。ALLOWED 中是有意保留的扫描，扫描的数据量有固定的上限。
+
+用法（在 backend 目录下）:
+    python benchmarks/check_query_plans.py
+    python benchmarks/check_query_plans.py --verbose
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'plans.db'))
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-only-secret-key-0123456789abcdef')
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp())
+os.environ.setdefault('RATE_LIMITS', '')
+os.environ.setdefault('RESPONSE_CACHE', 'sqlite')
+os.environ.setdefault('ARCHIVE_AFTER_DAYS', '0.000001')
+
+from fake_llama_server import serve  # noqa: E402
+
+import database  # noqa: E402
+
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+CHECKED = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+# 语句片段 -> 允许扫描的原因
+ALLOWED = {
+    'FROM announcements': '公告按生效时间缓存，只在缓存失效时查询，表中只有管理员发布的公告',
+    'FROM token_quotas': '额度规则按版本号缓存，只在管理员修改后重新读取整张规则表',
+    'SELECT created_at FROM response_cache ORDER BY created_at DESC LIMIT': '在 created_at 索引上最多跳过 RESPONSE_CACHE_ENTRIES 条',
+}
+
+current_route = None
+statements = {}  # 去掉字面量后的语句 -> (一条实际执行的语句, {接口})
+
+
+def trace(sql):
+    text = ' '.join(sql.split())
+    if current_route is None or not text.upper().startswith(CHECKED):
+        return
+    template = LITERAL.sub('?', text)
+    example, routes = statements.setdefault(template, (text, set()))
+    routes.add(current_route)
+
+
+def traced_connect(path=None, _connect=database.connect):
+    conn = _connect(path)
+    conn.set_trace_callback(trace)
+    return conn
+
+
+def exercise():
+    """调用各个接口，current_route 标明正在执行的接口"""
+    global current_route
+    from flask_jwt_extended import create_access_token
+    from app import app
+    from archive import session_archive
+    from usage_stats import usage_stats
+
+    client = app.test_client()
+
+    def call(route, method, url, **kwargs):
+        global current_route
+        current_route = route
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()
+        assert response.status_code < 400, (route, response.status_code, response.get_data()[:200])
+        current_route = None
+        return response
+
+    for username in ('alice', 'bob'):
+        call('POST /api/register', 'POST', '/api/register', json={
+            'username': username, 'email': f'{username}@example.com',
+            'password': 'password123', 'confirmPassword': 'password123'
+        })
+    call('POST /api/login', 'POST', '/api/login', json={'username': 'alice', 'password': 'password123'})
+    with app.app_context():
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity='alice')}
+
+    call('GET /api/user', 'GET', '/api/user', headers=headers)
+    for i in range(5):
+        call('POST /api/chat', 'POST', '/api/chat', headers=headers, json={'message': f'第 {i} 个问题', 'model': 'gpt-4'})
+    page = call('GET /api/history', 'GET', '/api/history?limit=2', headers=headers).json
+    call('GET /api/history', 'GET', f'/api/history?limit=2&before={page["next_cursor"]}', headers=headers)
+    call('GET /api/history', 'GET', f'/api/history?limit=2&since={page["next_cursor"]}', headers=headers)
+
+    messages = [{'role': 'user', 'content': '你好'}, {'role': 'assistant', 'content': '你好，有什么可以帮你？'}]
+    ids = [call('POST /api/chat/sessions', 'POST', '/api/chat/sessions', headers=headers,
+                json={'title': f'会话 {i}', 'messages': messages}).json['id'] for i in range(4)]
+    page = call('GET /api/chat/sessions', 'GET', '/api/chat/sessions?limit=2', headers=headers).json
+    call('GET /api/chat/sessions', 'GET', f'/api/chat/sessions?limit=2&cursor={page["next_cursor"]}', headers=headers)
+    call('GET /api/chat/sessions/<id>', 'GET', f'/api/chat/sessions/{ids[0]}', headers=headers)
+    call('PUT /api/chat/sessions/<id>', 'PUT', f'/api/chat/sessions/{ids[0]}', headers=headers,
+         json={'title': '改过的标题', 'messages': messages + [{'role': 'user', 'content': '再问一个'}]})
+    call('PATCH /api/chat/sessions/<id>/messages', 'PATCH', f'/api/chat/sessions/{ids[1]}/messages', headers=headers,
+         json={'start': 2, 'messages': [{'role': 'user', 'content': '继续'}]})
+    call('GET /api/search', 'GET', '/api/search?q=问题', headers=headers)
+
+    for _ in range(2):
+        call('POST /api/chat/completions', 'POST', '/api/chat/completions', headers=headers, json={
+            'session_id': ids[2], 'model': 'QwQ', 'temperature': 0,
+            'messages': messages + [{'role': 'user', 'content': '讲个笑话'}]
+        })
+    call('DELETE /api/chat/sessions/<id>', 'DELETE', f'/api/chat/sessions/{ids[3]}', headers=headers)
+    call('GET /api/announcement', 'GET', '/api/admin/announcement', headers=headers)
+
+    current_route = 'usage_stats.flush'
+    usage_stats.flush()
+    current_route = 'session_archive.run_once'
+    session_archive.run_once()
+    current_route = 'GET /api/chat/sessions/<id> (archived)'
+    call('GET /api/chat/sessions/<id> (archived)', 'GET', f'/api/chat/sessions/{ids[1]}', headers=headers)
+
+
+def full_scans(plan, tables):
+    """计划中对普通表的 SCAN（虚拟表、子查询和常量行除外）"""
+    scans = []
+    for detail in plan:
+        match = re.match(r'SCAN (\w+)', detail)
+        if match and match.group(1) in tables:
+            scans.append(detail)
+    return scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--verbose', action='store_true', help='输出所有语句的查询计划')
+    args = parser.parse_args()
+
+    fake, upstream_url = serve(tokens=8, delay=0, first_token_delay=0, slots=2)
+    os.environ['MODEL_UPSTREAMS'] = f'QwQ-32B={upstream_url}'
+    database.connect = traced_connect
+    try:
+        exercise()
+    finally:
+        fake.shutdown()
+
+    conn = database.connect()
+    conn.set_trace_callback(None)
+    tables = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND sql NOT LIKE 'CREATE VIRTUAL TABLE%'")}
+    failures = 0
+    for template, (example, routes) in sorted(statements.items(), key=lambda item: sorted(item[1][1])):
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + example)]
+        scans = full_scans(plan, tables)
+        reason = next((reason for fragment, reason in ALLOWED.items() if fragment in template), None)
+        failures += bool(scans) and reason is None
+        if scans or args.verbose:
+            label = 'ok  ' if not scans else 'SCAN' if reason is None else 'allowed'
+            print(f'{label} {", ".join(sorted(routes))}\n     {template}')
+            if scans and reason:
+                print(f'     ({reason})')
+            for detail in plan:
+                print(f'       {detail}')
+    print(f'{len(statements)} statements checked, {failures} with unexpected full table scans')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""模拟 llama-server 的本地服务，用于离线测试流式代理
+
+实现 /health、/slots 和流式 /v1/chat/completions，按固定间隔逐个输出 token，
+最后一个数据块带 timings 和 usage，与 llama-server 的格式一致。
+
+- 同时处理的请求数不超过 slot 数（对应 llama-server -np），多出的请求排队等待
+- 每个 slot 记住上一次的提示词和回复；cache_prompt 时只预填充与之不同的部分，
+  预填充耗时与需要处理的 token 数成正比
+- 指定 id_slot 时等待该 slot，否则选择前缀最相似的空闲 slot
+- --header-delay 模拟返回响应头之前的耗时，用于测试连接上游期间客户端断开
+
+    python benchmarks/fake_llama_server.py --port 8080 --tokens 64 --delay 0.02
+    MODEL_UPSTREAMS="QwQ-32B=http://127.0.0.1:8080" python app.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def tokenize(messages):
+    """按空白切分近似 token，角色也算一个 token"""
+    tokens = []
+    for msg in messages:
+        tokens.append(f"<{msg.get('role')}>")
+        tokens.extend(str(msg.get('content', '')).split())
+    return tokens
+
+
+def common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class SlotPool:
+    """llama-server 的并行 slot 及其中缓存的 token"""
+
+    def __init__(self, slots):
+        self.cond = threading.Condition()
+        self.busy = [False] * slots
+        self.cache = [[] for _ in range(slots)]
+
+    def acquire(self, prompt, id_slot=None):
+        with self.cond:
+            while True:
+                if id_slot is not None and 0 <= id_slot < len(self.busy):
+                    if not self.busy[id_slot]:
+                        slot = id_slot
+                        break
+                else:
+                    free = [i for i, busy in enumerate(self.busy) if not busy]
+                    if free:
+                        slot = max(free, key=lambda i: common_prefix(self.cache[i], prompt))
+                        break
+                self.cond.wait()
+            self.busy[slot] = True
+            return slot, self.cache[slot]
+
+    def release(self, slot, cached):
+        with self.cond:
+            self.busy[slot] = False
+            self.cache[slot] = cached
+            self.cond.notify_all()
+
+    def states(self):
+        with self.cond:
+            return [{'id': i, 'is_processing': busy} for i, busy in enumerate(self.busy)]
+
+
+class FakeLlamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    tokens = 32
+    delay = 0.01
+    first_token_delay = 0.05
+    prefill_delay = 0.0002  # 每个需要预填充的 token 的耗时（秒）
+    header_delay = 0.0      # 收到请求后多久返回响应头（秒）
+    pool = SlotPool(4)
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        elif self.path == '/slots':
+            self.send_json(200, self.pool.states())
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_json(400, {'error': 'invalid json'})
+            return
+        if self.path != '/v1/chat/completions':
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        tokens = int(request.get('max_tokens') or self.tokens)
+        prompt = tokenize(request.get('messages') or [])
+        time.sleep(self.header_delay)
+        slot, cached = self.pool.acquire(prompt, request.get('id_slot'))
+        reused = common_prefix(cached, prompt) if request.get('cache_prompt', True) else 0
+        generated = []
+        try:
+            self.stream(request, tokens, len(prompt), reused, generated)
+        finally:
+            self.pool.release(slot, prompt + generated)
+
+    def stream(self, request, tokens, prompt_tokens, reused, generated):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send_event(payload):
+            data = b'data: ' + payload + b'\n\n'
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+
+        try:
+            prompt_n = prompt_tokens - reused
+            time.sleep(self.first_token_delay + prompt_n * self.prefill_delay)
+            for i in range(tokens):
+                chunk = {
+                    'object': 'chat.completion.chunk',
+                    'model': request.get('model'),
+                    'choices': [{'index': 0, 'delta': {'content': f'tok{i} '}, 'finish_reason': None}]
+                }
+                send_event(json.dumps(chunk).encode('utf-8'))
+                generated.append(f'tok{i}')
+                time.sleep(self.delay)
+            send_event(json.dumps({
+                'object': 'chat.completion.chunk',
+                'model': request.get('model'),
+                'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': tokens},
+                'timings': {'cache_n': reused, 'prompt_n': prompt_n, 'predicted_n': tokens}
+            }).encode('utf-8'))
+            send_event(b'[DONE]')
+            self.wfile.write(b'0\r\n\r\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+class FakeLlamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # 压测时会同时建立大量连接
+
+
+def serve(port=0, tokens=32, delay=0.01, first_token_delay=0.05, slots=4, prefill_delay=0.0002, header_delay=0.0):
+    """在后台线程启动服务，返回 (server, base_url)"""
+    handler = type('Handler', (FakeLlamaHandler,), {
+        'tokens': tokens, 'delay': delay, 'first_token_delay': first_token_delay,
+        'prefill_delay': prefill_delay, 'header_delay': header_delay, 'pool': SlotPool(slots)
+    })
+    server = FakeLlamaServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--tokens', type=int, default=32)
+    parser.add_argument('--delay', type=float, default=0.01, help='token 间隔（秒）')
+    parser.add_argument('--first-token-delay', type=float, default=0.05, help='首 token 延迟（秒）')
+    parser.add_argument('--prefill-delay', type=float, default=0.0002, help='每个预填充 token 的耗时（秒）')
+    parser.add_argument('--header-delay', type=float, default=0.0, help='返回响应头之前的耗时（秒）')
+    parser.add_argument('--slots', type=int, default=4)
+    args = parser.parse_args()
+
+    server, base_url = serve(args.port, args.tokens, args.delay, args.first_token_delay, args.slots,
+                             args.prefill_delay, args.header_delay)
+    print(f'fake llama-server listening on {base_url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# llama-server 上游连接配置
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', '32'))              # 每个上游保持的 keep-alive 连接数
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '5'))  # 秒
+UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', '300'))      # 两个数据块之间的最长等待（秒）
+
+# 允许透传给 llama-server 的采样参数
+SAMPLING_PARAMS = (
+    'temperature', 'top_p', 'top_k', 'min_p', 'max_tokens', 'stop', 'seed',
+    'repeat_penalty', 'presence_penalty', 'frequency_penalty'
+)
+
+
+class UpstreamError(Exception):
+    """上游 llama-server 连接失败或返回错误状态"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class UpstreamPool:
+    """复用到 llama-server 的 HTTP 连接，按进程创建"""
+
+    def __init__(self, size=UPSTREAM_POOL_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    def session(self):
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=self.size, max_retries=0)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def open_stream(self, base_url, payload):
+        """发起流式补全请求，返回尚未读取响应体的 Response"""
+        try:
+            resp = self.session().post(
+                f'{base_url}/v1/chat/completions',
+                json=payload,
+                headers={'Accept': 'text/event-stream'},
+                stream=True,
+                timeout=(UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT)
+            )
+        except requests.RequestException as e:
+            raise UpstreamError(str(e))
+        if resp.status_code != 200:
+            resp.close()
+            raise UpstreamError(f'upstream returned {resp.status_code}', resp.status_code)
+        return resp
+
+
+class CompletionStats:
+    """按模型累计首 token 延迟和生成速度"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def record(self, model, ttft, tokens, generation_seconds):
+        with self._lock:
+            stats = self._models.setdefault(model, {
+                'completions': 0, 'ttft_total': 0.0, 'tokens': 0, 'generation_seconds': 0.0
+            })
+            stats['completions'] += 1
+            stats['ttft_total'] += ttft
+            stats['tokens'] += tokens
+            stats['generation_seconds'] += generation_seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                model: {
+                    'completions': s['completions'],
+                    'avg_ttft': s['ttft_total'] / s['completions'],
+                    'tokens': s['tokens'],
+                    'tokens_per_second': s['tokens'] / s['generation_seconds'] if s['generation_seconds'] else 0.0
+                }
+                for model, s in self._models.items()
+            }
+
+
+def build_payload(model, messages, options):
+    payload = {
+        'model': model,
+        'messages': messages,
+        'stream': True
+    }
+    for name in SAMPLING_PARAMS:
+        if name in options:
+            payload[name] = options[name]
+    return payload
+
+
+class StreamParser:
+    """从上游的 SSE 数据块中解析回复内容、首 token 延迟和生成的 token 数
+
+    数据块可能在任意位置被切断，不完整的行留到下一块再解析。
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_token_at = None
+        self.parts = []
+        self.tokens = 0
+        self.predicted_n = None
+        self.prompt_tokens = None     # 提示词总 token 数（usage.prompt_tokens）
+        self.prompt_processed = None  # 实际预填充的 token 数（timings.prompt_n），其余来自 KV 缓存
+        self.cache_n = None
+        self.finish_reason = None     # stop 表示正常结束，length 表示达到 max_tokens，中途断开时为 None
+        self._buffer = b''
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        lines = self._buffer.split(b'\n')
+        self._buffer = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if not line.startswith(b'data:'):
+                continue
+            data = line[5:].strip()
+            if data == b'[DONE]':
+                continue
+            try:
+                parsed = json.loads(data)
+            except ValueError:
+                continue
+            # llama-server 在最后一个数据块里给出实际生成的 token 数
+            timings = parsed.get('timings')
+            if timings:
+                self.predicted_n = timings.get('predicted_n', self.predicted_n)
+                self.prompt_processed = timings.get('prompt_n', self.prompt_processed)
+                self.cache_n = timings.get('cache_n', self.cache_n)
+            usage = parsed.get('usage')
+            if usage and 'prompt_tokens' in usage:
+                self.prompt_tokens = usage['prompt_tokens']
+            for choice in parsed.get('choices') or []:
+                if choice.get('finish_reason'):
+                    self.finish_reason = choice['finish_reason']
+                delta = (choice.get('delta') or {}).get('content')
+                if delta:
+                    if self.first_token_at is None:
+                        self.first_token_at = time.monotonic()
+                    self.tokens += 1
+                    self.parts.append(delta)
+
+    @property
+    def cached_tokens(self):
+        """命中 KV 缓存、不需要重新预填充的提示词 token 数，未知时为 None"""
+        if self.cache_n is not None:
+            return self.cache_n
+        if self.prompt_tokens is not None and self.prompt_processed is not None:
+            return max(0, self.prompt_tokens - self.prompt_processed)
+        return None
+
+    def result(self):
+        """返回 (content, ttft, tokens, generation_seconds)，ttft 为 None 表示没有收到任何 token"""
+        if self.first_token_at is None:
+            return ''.join(self.parts), None, 0, 0.0
+        return (
+            ''.join(self.parts),
+            self.first_token_at - self.started,
+            self.predicted_n if self.predicted_n is not None else self.tokens,
+            time.monotonic() - self.first_token_at
+        )
+
+
+def sse_event(payload):
+    """后端自己插入到补全流中的数据块，如 {'queue': ...} 或 {'error': ...}"""
+    return b'data: ' + json.dumps(payload, ensure_ascii=False).encode('utf-8') + b'\n\n'
+
+
+def relay(resp, on_finish):
+    """边读边转发上游的 SSE 数据块，同时解析出回复内容
+
+    数据块收到后立即 yield，不等待整行。流结束（包括客户端中途断开）时
+    调用 on_finish(parser)。
+    """
+    parser = StreamParser()
+    try:
+        for chunk in resp.iter_content(chunk_size=None):
+            if not chunk:
+                continue
+            yield chunk
+            parser.feed(chunk)
+    finally:
+        resp.close()
+        on_finish(parser)
+
+
+upstream_pool = UpstreamPool()
+completion_stats = CompletionStats()
@@ -0,0 +1,157 @@
+import os
+import re
+import threading
+
+from model_registry import model_registry
+
+# 上下文窗口配置
+CONTEXT_DEFAULT_WINDOW = int(os.getenv('CONTEXT_DEFAULT_WINDOW', '10240'))  # 快照和 MODEL_CONTEXT 都没有给出时每个请求的上下文长度（-c 40960 -np 4）
+CONTEXT_REPLY_TOKENS = int(os.getenv('CONTEXT_REPLY_TOKENS', '4096'))       # 请求没有 max_tokens 时为回复（含思考过程）预留的 token 数
+CONTEXT_LOW_WATER = float(os.getenv('CONTEXT_LOW_WATER', '0.6'))            # 超出预算时一次裁剪到预算的该比例，之后窗口起点保持不变
+CONTEXT_CALIBRATION = float(os.getenv('CONTEXT_CALIBRATION', '0.2'))        # 按上游返回的实际 prompt_tokens 校准估算值的平滑系数
+
+MESSAGE_OVERHEAD = 4  # 聊天模板给每条消息加的标记：<|im_start|>、角色、换行、<|im_end|>
+PROMPT_OVERHEAD = 3   # 模板末尾引导回复的 <|im_start|>assistant
+
+# 中日韩文字和全角符号各算一个 token，连续字母每四个算一个，数字逐位，其余标点和换行各算一个
+TOKEN_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]|[A-Za-z]{1,4}|\d|\n+|[^\sA-Za-z\d]')
+
+
+def count_tokens(text):
+    """估算文本的 token 数，写入消息时计算一次并保存在 session_messages.tokens
+
+    没有加载模型的分词器，按 Qwen / DeepSeek 这类大词表 BPE 的平均切分粗略
+    估算，偏差由 ContextWindow 按上游返回的实际 token 数校准。
+    """
+    return len(TOKEN_PATTERN.findall(text))
+
+
+class ContextTooLong(Exception):
+    """系统提示和最新一条消息本身就超出了模型的上下文预算"""
+
+
+class PromptWindow:
+    """一次补全实际发送给上游的消息"""
+
+    def __init__(self, messages, start, estimated, dropped, backfill):
+        self.messages = messages    # 开头的系统提示 + 完整消息列表中从 start 开始的部分
+        self.start = start          # 窗口起点，保存回复时记入会话，下一轮沿用
+        self.estimated = estimated  # 未经校准的估算 token 数
+        self.dropped = dropped      # 裁掉的消息数
+        self.backfill = backfill    # [(seq, tokens)] 已保存但还没有 token 数的消息，保存回复时一并写入
+
+
+class ContextWindow:
+    """在服务端组装发送给模型的提示词
+
+    前端每次发送完整的聊天记录。每条消息的 token 数在写入时计算一次，组装
+    时直接读取；只有内容与保存的不一致（尚未保存或被编辑）的消息才重新计算。
+    预算为模型每个请求的上下文长度减去为回复预留的 token 数。
+
+    开头的系统提示和最新的用户消息总是保留，超出预算时从最早的一轮开始整轮
+    裁掉，一次裁到预算的 CONTEXT_LOW_WATER，窗口起点保存在会话中。之后的
+    几轮沿用同一个起点，提示词前缀不变，llama-server 可以复用 KV 缓存，
+    每轮只需要预填充新增的消息；直到再次超出预算才整体后移一次。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ratio = {}  # 模型 -> 实际 token 数 / 估算值
+        self._stats = {}
+
+    def window_size(self, model_name):
+        return model_registry.context_window(model_name) or CONTEXT_DEFAULT_WINDOW
+
+    def budget(self, model_name, options):
+        reply = options.get('max_tokens')
+        if not isinstance(reply, int) or isinstance(reply, bool) or reply <= 0:
+            reply = CONTEXT_REPLY_TOKENS
+        return self.window_size(model_name) - reply
+
+    def ratio(self, model_name):
+        return self._ratio.get(model_name, 1.0)
+
+    def assemble(self, cursor, session_id, model_name, messages, options):
+        """返回 PromptWindow；最新的消息放不下时抛出 ContextTooLong"""
+        cursor.execute('SELECT seq, content, tokens FROM session_messages WHERE session_id = ? AND seq < ?',
+                       (session_id, len(messages)))
+        stored = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        cursor.execute('SELECT context_start FROM chat_sessions WHERE id = ?', (session_id,))
+        row = cursor.fetchone()
+        saved_start = row[0] if row else 0
+
+        counts = []
+        backfill = []
+        for seq, msg in enumerate(messages):
+            content, tokens = stored.get(seq, (None, None))
+            if content != msg['content']:
+                tokens = count_tokens(msg['content'])
+            elif tokens is None:
+                tokens = count_tokens(msg['content'])
+                backfill.append((seq, tokens))
+            counts.append(tokens + MESSAGE_OVERHEAD)
+
+        head = 0
+        while head < len(messages) - 1 and messages[head]['role'] == 'system':
+            head += 1
+        # 窗口只从用户消息开始，裁掉的总是完整的几轮对话
+        starts = [head] + [i for i in range(head + 1, len(messages)) if messages[i]['role'] == 'user']
+        suffix = [0] * (len(messages) + 1)
+        for i in range(len(messages) - 1, -1, -1):
+            suffix[i] = suffix[i + 1] + counts[i]
+        fixed = sum(counts[:head]) + PROMPT_OVERHEAD
+        ratio = self.ratio(model_name)
+        budget = self.budget(model_name, options)
+
+        def cost(start):
+            return (fixed + suffix[start]) * ratio
+
+        # 消息比上次的起点还少说明会话被改短了，重新从头计算
+        if saved_start >= len(messages):
+            saved_start = 0
+        start = next(s for s in starts if s >= saved_start or s == starts[-1])
+        slid = False
+        if cost(start) > budget:
+            fitting = [s for s in starts if s >= start and cost(s) <= budget]
+            if not fitting:
+                raise ContextTooLong()
+            start = next((s for s in fitting if cost(s) <= budget * CONTEXT_LOW_WATER), fitting[0])
+            slid = True
+
+        estimated = fixed + suffix[start]
+        with self._lock:
+            stats = self._stats.setdefault(model_name, {'requests': 0, 'slides': 0, 'prompt_tokens': 0})
+            stats['requests'] += 1
+            stats['slides'] += slid
+            stats['prompt_tokens'] += estimated
+        return PromptWindow(messages[:head] + messages[start:], start, estimated, start - head, backfill)
+
+    def calibrate(self, model_name, estimated, actual):
+        """用上游返回的实际 prompt_tokens 修正估算比例，限制在 0.5 到 2 之间"""
+        if not estimated or not actual:
+            return
+        sample = min(max(actual / estimated, 0.5), 2.0)
+        with self._lock:
+            ratio = self._ratio.get(model_name, 1.0)
+            self._ratio[model_name] = ratio + CONTEXT_CALIBRATION * (sample - ratio)
+
+    def save(self, cursor, session_id, window):
+        """保存回复时记录窗口起点，补写旧消息的 token 数"""
+        cursor.execute('UPDATE chat_sessions SET context_start = ? WHERE id = ? AND context_start != ?',
+                       (window.start, session_id, window.start))
+        cursor.executemany('''
+            UPDATE session_messages SET tokens = ? WHERE session_id = ? AND seq = ? AND tokens IS NULL
+        ''', [(tokens, session_id, seq) for seq, tokens in window.backfill])
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                model: dict(stats,
+                            window=self.window_size(model),
+                            ratio=round(self.ratio(model), 3),
+                            avg_prompt_tokens=stats['prompt_tokens'] / stats['requests'])
+                for model, stats in self._stats.items()
+            }
+
+
+context_window = ContextWindow()
@@ -0,0 +1,72 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, request
+from flask_jwt_extended import get_jwt_identity
+
+from database import get_db
+
+
+class DataVersions:
+    """每个用户的聊天数据版本号
+
+    用户的会话或聊天记录每次修改时，在同一个事务里把 user_data_versions 中
+    该用户的版本号加一并记下修改时间。列表接口用版本号生成 ETag、用修改时间
+    作为 Last-Modified，客户端带着 If-None-Match / If-Modified-Since 来问时
+    只按主键查一行，数据没变就直接返回 304，不查询会话和消息表。
+    """
+
+    def bump(self, cursor, username):
+        cursor.execute('''
+            INSERT INTO user_data_versions (username, version, updated_at)
+            VALUES (?, 1, CAST(strftime('%s', 'now') AS INTEGER))
+            ON CONFLICT (username) DO UPDATE SET
+                version = version + 1, updated_at = excluded.updated_at
+        ''', (username,))
+
+    def get(self, cursor, username):
+        """返回 (version, updated_at)，从未修改过时为 (0, None)"""
+        cursor.execute('SELECT version, updated_at FROM user_data_versions WHERE username = ?', (username,))
+        row = cursor.fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def etag(self, username, version):
+        # 弱 ETag：压缩前后的响应视为同一版本
+        return hashlib.blake2b(f'{username}:{version}'.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def versioned(view):
+    """按当前用户的数据版本处理条件 GET，放在 jwt_required 之后
+
+    版本未变时返回 304；否则执行视图，并给成功的响应加上 ETag 和
+    Last-Modified。Cache-Control 为 private, no-cache，浏览器每次都会带
+    条件头来验证。
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        username = get_jwt_identity()
+        version, updated_at = data_versions.get(get_db().cursor(), username)
+        etag = data_versions.etag(username, version)
+        last_modified = datetime.fromtimestamp(int(updated_at), timezone.utc) if updated_at else None
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = (last_modified is not None and request.if_modified_since is not None
+                            and last_modified <= request.if_modified_since)
+        if not_modified:
+            response = current_app.response_class(status=304)
+        else:
+            response = view(*args, **kwargs)
+            if isinstance(response, tuple) or response.status_code != 200:
+                return response
+        response.set_etag(etag, weak=True)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
+
+
+data_versions = DataVersions()
@@ -0,0 +1,124 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from flask import g
+
+from metrics import TimedConnection
+
+# 数据库配置（均可通过环境变量覆盖）
+DATABASE = os.getenv('DATABASE', 'users.db')
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', '-16000'))       # 负数表示 KiB，约 16MB
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(64 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))     # 毫秒
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', '256'))
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', '8'))              # 0 表示每个请求新建连接
+# 只对新建的数据库生效（必须在写入任何数据之前设置），已有数据库需执行 migrate_auto_vacuum.sql
+SQLITE_AUTO_VACUUM = os.getenv('SQLITE_AUTO_VACUUM', 'INCREMENTAL')
+
+
+def connect(path=None):
+    """创建一个按配置调优过的连接"""
+    conn = sqlite3.connect(
+        path or DATABASE,
+        timeout=SQLITE_BUSY_TIMEOUT / 1000,
+        cached_statements=SQLITE_STATEMENT_CACHE,
+        check_same_thread=False,  # 连接会在池中被不同线程复用，但同一时刻只属于一个请求
+        factory=TimedConnection   # 按语句类型记录执行耗时，见 metrics.py
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA auto_vacuum = {SQLITE_AUTO_VACUUM}')
+    conn.execute(f'PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}')
+    conn.execute(f'PRAGMA synchronous = {SQLITE_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA cache_size = {SQLITE_CACHE_SIZE}')
+    conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+    conn.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}')
+    return conn
+
+
+class ConnectionPool:
+    """按进程划分的连接池
+
+    连接在请求结束时归还而不是关闭，这样 sqlite3 的预编译语句缓存
+    (cached_statements) 可以在请求之间复用。gunicorn fork 出的子进程
+    不会继承父进程的连接。
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._idle = queue.LifoQueue()
+                    self._pid = os.getpid()
+
+    def acquire(self):
+        self._check_fork()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect()
+
+    def release(self, conn):
+        self._check_fork()
+        # 丢弃请求中未提交的修改，保证下一个使用者拿到干净的连接
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() < self.size:
+            self._idle.put_nowait(conn)
+        else:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+pool = ConnectionPool(SQLITE_POOL_SIZE)
+
+
+def get_db():
+    """获取当前应用上下文绑定的连接，同一请求内多次调用返回同一个连接"""
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+@contextmanager
+def connection():
+    """在请求上下文之外（如流式响应结束时）借用连接池中的连接"""
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+def close_db(exc=None):
+    db = g.pop('db', None)
+    if db is not None:
+        pool.release(db)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
+
+
+def init_db():
+    """创建数据库或升级到最新结构，见 migrate.py"""
+    from migrate import migrate
+    return migrate()
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import database
+from announcement_cache import announcement_cache
+from model_registry import model_registry
+
+# SSE 推送配置
+SSE_HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_INTERVAL', '15'))   # 心跳间隔（秒）
+SSE_POLL_INTERVAL = float(os.getenv('SSE_POLL_INTERVAL', '1'))             # 后台检查状态变化的间隔（秒）
+SSE_MAX_DURATION = float(os.getenv('SSE_MAX_DURATION', '1800'))            # 单个连接最长时间，到期后客户端自动重连
+SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', '3000'))                      # 建议客户端的重连间隔
+
+# 推送的频道，顺序决定事件 id 中各段的位置
+CHANNELS = ('announcement', 'models')
+
+
+def _digest(body):
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
+
+
+class EventHub:
+    """进程内的推送状态
+
+    推送的内容都是“当前状态”而不是事件流水，所以每个频道只保存最新一份
+    数据和它的摘要。事件 id 由各频道摘要拼接而成，重连时根据 Last-Event-ID
+    只补发发生变化的频道，即使重连到另一个 worker 也成立；每个连接只需
+    记住自己最后发送的摘要。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._state = {}  # channel -> (digest, body)
+        self._watcher = None
+        self._listeners = []
+
+    def publish(self, channel, payload):
+        body = json.dumps(payload, ensure_ascii=False)
+        digest = _digest(body)
+        with self._cond:
+            current = self._state.get(channel)
+            if current and current[0] == digest:
+                return
+            self._state[channel] = (digest, body)
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def add_listener(self, callback):
+        """注册状态变化回调，在发布线程中调用，用于唤醒异步网关中的连接"""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self._state)
+
+    def wait(self, known, timeout):
+        """等待直到有频道的摘要与 known 不同或超时，返回当前状态"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if any(self._state[c][0] != known.get(c) for c in self._state):
+                    return dict(self._state)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return dict(self._state)
+                self._cond.wait(remaining)
+
+    def wake_watcher(self):
+        if self._watcher is not None:
+            self._watcher.wake()
+
+    def ensure_watcher(self):
+        if self._watcher is None or not self._watcher.is_alive():
+            with self._cond:
+                if self._watcher is None or not self._watcher.is_alive():
+                    self._watcher = StateWatcher(self)
+                    self._watcher.start()
+        return self._watcher
+
+
+class StateWatcher(threading.Thread):
+    """后台线程：发现公告或模型状态变化时发布到 EventHub
+
+    通过 PRAGMA data_version 感知其他连接（包括其他 worker）提交的修改，
+    通过文件修改时间感知模型状态快照的变化，检查本身不写数据库。
+    """
+
+    def __init__(self, hub):
+        super().__init__(name='sse-state-watcher', daemon=True)
+        self.hub = hub
+        self._wake = threading.Event()
+        self._data_version = None
+        self._model_mtime = None
+
+    def wake(self):
+        self._wake.set()
+
+    def run(self):
+        conn = database.connect()
+        while True:
+            try:
+                self.check_announcement(conn)
+                self.check_models()
+            except Exception as e:
+                print(f"Error in state watcher: {str(e)}")
+            self._wake.wait(SSE_POLL_INTERVAL)
+            self._wake.clear()
+
+    def check_announcement(self, conn):
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != self._data_version:
+            self._data_version = data_version
+            announcement_cache.invalidate()
+        payload, _, _ = announcement_cache.get(conn)
+        self.hub.publish('announcement', payload)
+
+    def check_models(self):
+        mtime, states = model_registry.states()
+        if mtime is None or mtime == self._model_mtime:
+            return
+        self._model_mtime = mtime
+        self.hub.publish('models', {
+            'services': [{
+                'model': model_name,
+                'api': state.get('api'),
+                'node': state.get('node_name'),
+                'replicas': len(state.get('replicas') or [state]),
+                'status': 'running'
+            } for model_name, state in states.items() if state.get('is_available')]
+        })
+
+
+event_hub = EventHub()
+
+
+def announcement_changed():
+    """公告被增删改后调用：让缓存失效并立即推送"""
+    announcement_cache.invalidate()
+    event_hub.wake_watcher()
+
+
+def parse_event_id(event_id):
+    """把 Last-Event-ID 拆成各频道的摘要"""
+    parts = (event_id or '').split('.')
+    if len(parts) != len(CHANNELS):
+        return {}
+    return dict(zip(CHANNELS, parts))
+
+
+def format_event_id(state):
+    return '.'.join(state[c][0] if c in state else '' for c in CHANNELS)
+
+
+def render_changes(state, known):
+    """返回 state 中相对 known 发生变化的频道的 SSE 文本并更新 known，没有变化时返回 None"""
+    changed = [c for c in CHANNELS if c in state and state[c][0] != known.get(c)]
+    if not changed:
+        return None
+    for channel in changed:
+        known[channel] = state[channel][0]
+    event_id = format_event_id(state)
+    return ''.join(f'id: {event_id}\nevent: {channel}\ndata: {state[channel][1]}\n\n' for channel in changed)
+
+
+HEARTBEAT = ': heartbeat\n\n'
+
+
+def stream(last_event_id=None):
+    """生成 SSE 文本流；每个连接只保存各频道最后发送的摘要"""
+    event_hub.ensure_watcher()
+    known = parse_event_id(last_event_id)
+    started = time.monotonic()
+
+    yield f'retry: {SSE_RETRY_MS}\n\n'
+    while time.monotonic() - started < SSE_MAX_DURATION:
+        state = event_hub.wait(known, SSE_HEARTBEAT_INTERVAL)
+        yield render_changes(state, known) or HEARTBEAT
@@ -0,0 +1,342 @@
+"""异步网关
+
+在一个事件循环里承载流式补全和 SSE 推送这类长连接，单个进程可以同时保持
+数千个连接，不会像 gunicorn 同步 worker 那样一个连接占住一个 worker。
+鉴权、会话校验和回复保存与 app.py 共用同一套代码，阻塞的数据库操作放到
+线程池中执行；密码校验等其他接口仍由 app.py 处理。
+
+部署时由反向代理把 /api/chat/completions 和 /api/events 转发到网关：
+
+    python gateway.py
+    gunicorn gateway:create_app --worker-class aiohttp.GunicornWebWorker --bind 0.0.0.0:50001
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+from flask_jwt_extended import decode_token
+
+from app import app as flask_app, validate_messages, session_belongs_to, finish_completion
+from admission import admission, AdmissionRejected, ADMISSION_UPDATE_INTERVAL
+from completions import build_payload, sse_event, StreamParser, UpstreamError, UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT
+from context_window import context_window, ContextTooLong
+from database import connection
+from events import event_hub, parse_event_id, render_changes, HEARTBEAT, SSE_HEARTBEAT_INTERVAL, SSE_MAX_DURATION, SSE_RETRY_MS
+from model_registry import model_registry
+from rate_limits import rate_limiter, retry_after_header, QuotaExceeded
+from response_cache import response_cache, replay
+from router import upstream_router
+
+# 网关配置
+GATEWAY_HOST = os.getenv('GATEWAY_HOST', '0.0.0.0')
+GATEWAY_PORT = int(os.getenv('GATEWAY_PORT', '50001'))
+GATEWAY_BACKLOG = int(os.getenv('GATEWAY_BACKLOG', '1024'))               # 同时建立大量连接时的监听队列长度
+GATEWAY_DB_THREADS = int(os.getenv('GATEWAY_DB_THREADS', '8'))            # 执行数据库操作的线程数
+GATEWAY_UPSTREAM_LIMIT = int(os.getenv('GATEWAY_UPSTREAM_LIMIT', '0'))    # 到 llama-server 的最大连接数，0 表示不限
+
+STREAM_HEADERS = {
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
+
+
+def json_error(status, message):
+    return web.json_response({'error': message}, status=status)
+
+
+def too_many_requests(message, retry_after):
+    return web.json_response({'error': message}, status=429, headers={'Retry-After': retry_after_header(retry_after)})
+
+
+class Unauthorized(web.HTTPUnauthorized):
+    def __init__(self, message):
+        super().__init__(text=f'{{"msg": "{message}"}}', content_type='application/json')
+
+
+def authenticate(request, stream=False):
+    """按 app.py 的 JWT 配置校验 access token，返回用户名
+
+    stream 为 True 时（/api/events）还接受查询参数中的推送专用 token（带 stream
+    声明），其他接口不接受推送专用 token。
+    """
+    header = request.headers.get('Authorization', '')
+    token = header[7:] if header.startswith('Bearer ') else None
+    from_query = token is None and stream
+    if from_query:
+        token = request.query.get(flask_app.config['JWT_QUERY_STRING_NAME'])
+    if not token:
+        raise Unauthorized('Missing Authorization Header')
+    try:
+        with flask_app.app_context():
+            claims = decode_token(token)
+    except Exception:
+        raise Unauthorized('Invalid or expired token')
+    if claims.get('type') != 'access':
+        raise Unauthorized('Only access tokens are allowed')
+    if claims.get('stream') and not stream:
+        raise Unauthorized('Stream tokens are only accepted by /api/events')
+    if from_query and not claims.get('stream'):
+        raise Unauthorized('Only stream tokens are allowed in the query string')
+    return claims[flask_app.config.get('JWT_IDENTITY_CLAIM', 'sub')]
+
+
+def check_session(session_id, username):
+    with connection() as conn:
+        return session_belongs_to(conn.cursor(), session_id, username)
+
+
+def load_context(username, session_id, model_name, messages, options):
+    """检查额度，组装发送给上游的消息并查找回复缓存，返回 (window, cache_key, cached)"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        rate_limiter.check_quota(cursor, username, model_name)
+        window = context_window.assemble(cursor, session_id, model_name, messages, options)
+        cache_key = response_cache.prepare(model_name, window.messages, options)
+        return window, cache_key, cache_key and response_cache.lookup(cursor, cache_key)
+
+
+class Gateway:
+    def __init__(self):
+        self.db_executor = ThreadPoolExecutor(GATEWAY_DB_THREADS, thread_name_prefix='gateway-db')
+        self.http = None
+        self.loop = None
+        self.state_changed = None
+
+    async def startup(self, app):
+        self.loop = asyncio.get_running_loop()
+        self.state_changed = asyncio.Event()
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=GATEWAY_UPSTREAM_LIMIT, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(
+                total=None, sock_connect=UPSTREAM_CONNECT_TIMEOUT, sock_read=UPSTREAM_READ_TIMEOUT
+            )
+        )
+        event_hub.add_listener(self.notify_state_changed)
+        event_hub.ensure_watcher()
+
+    async def cleanup(self, app):
+        await self.http.close()
+        self.db_executor.shutdown(wait=True)
+
+    def run_db(self, fn, *args):
+        return self.loop.run_in_executor(self.db_executor, fn, *args)
+
+    def notify_state_changed(self):
+        """EventHub 发布线程中调用：唤醒所有等待中的 SSE 连接"""
+        self.loop.call_soon_threadsafe(self._wake_streams)
+
+    def _wake_streams(self):
+        changed, self.state_changed = self.state_changed, asyncio.Event()
+        changed.set()
+
+    async def open_upstream(self, urls, payload, session_key=None):
+        """与 upstream_router.open_stream 相同的选择和重试规则，返回 (lease, resp)"""
+        error = UpstreamError('no upstream available')
+        for lease in upstream_router.candidates(urls, session_key):
+            upstream_router.begin(lease)
+            try:
+                resp = await self.http.post(
+                    f'{lease.url}/v1/chat/completions',
+                    json=lease.apply(payload),
+                    headers={'Accept': 'text/event-stream'}
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                upstream_router.failed(lease)
+                error = UpstreamError(str(e))
+                continue
+            except BaseException:
+                # 客户端断开，协程在连接上游时被取消：结束在途计数，副本本身没有问题
+                upstream_router.end(lease)
+                raise
+            if resp.status != 200:
+                resp.release()
+                error = UpstreamError(f'upstream returned {resp.status}', resp.status)
+                if resp.status < 500:
+                    upstream_router.end(lease)
+                    raise error
+                upstream_router.failed(lease)
+                continue
+            upstream_router.succeeded(lease)
+            return lease, resp
+        raise error
+
+    async def completions(self, request):
+        current_user = authenticate(request)
+        retry_after = rate_limiter.take('completions', current_user)
+        if retry_after:
+            return too_many_requests('请求过于频繁，请稍后再试', retry_after)
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return json_error(400, '消息格式错误')
+        session_id = data.get('session_id')
+        model = data.get('model')
+        messages = validate_messages(data.get('messages'))
+        if not model or not messages or messages[-1]['role'] != 'user':
+            return json_error(400, '消息格式错误')
+
+        if not await self.run_db(check_session, session_id, current_user):
+            return json_error(404, '会话不存在')
+
+        model_name = model_registry.resolve(model)
+        urls = model_registry.upstreams(model)
+        if not urls:
+            return json_error(503, '模型当前不可用')
+
+        try:
+            window, cache_key, cached = await self.run_db(load_context, current_user, session_id, model_name,
+                                                          messages, data)
+        except QuotaExceeded as e:
+            return too_many_requests(e.message, e.retry_after)
+        except ContextTooLong:
+            return json_error(400, '消息超出模型的上下文长度')
+        if cached:
+            return await self.replay_cached(request, current_user, session_id, messages, model_name, cached, window)
+
+        try:
+            ticket = admission.acquire(model_name, current_user, lambda: upstream_router.capacity(urls))
+        except AdmissionRejected as e:
+            headers = {'Retry-After': str(e.retry_after)} if e.retry_after else None
+            return web.json_response({'error': e.message}, status=e.status, headers=headers)
+
+        response = web.StreamResponse(headers=STREAM_HEADERS)
+        payload = build_payload(model_name, window.messages, data)
+        relaying = False
+        try:
+            if not ticket.granted:
+                await response.prepare(request)
+                if not await self.wait_turn(ticket, response):
+                    return response
+            try:
+                lease, upstream = await self.open_upstream(urls, payload, session_key=session_id)
+            except UpstreamError as e:
+                print(f"Error in gateway completions: {str(e)}")
+                if not response.prepared:
+                    return json_error(502, '模型服务请求失败')
+                await response.write(sse_event({'error': '模型服务请求失败'}))
+                return response
+            relaying = True
+        finally:
+            # 没有开始转发就结束（排队或连接上游时客户端断开，协程在 await 处被
+            # 取消；排队超时；上游出错）时释放票据，无论是否已经放行
+            if not relaying:
+                ticket.close()
+
+        parser = StreamParser()
+        try:
+            if not response.prepared:
+                await response.prepare(request)
+            async for chunk in upstream.content.iter_any():
+                await response.write(chunk)
+                parser.feed(chunk)
+        except ConnectionResetError:
+            pass
+        finally:
+            upstream.release()
+            ticket.close()
+            upstream_router.end(lease, parser.prompt_tokens, parser.cached_tokens)
+            # 客户端断开时协程可能被取消，保存直接提交到线程池，不依赖后续的 await
+            saved = self.run_db(finish_completion, current_user, session_id, messages, model_name, *parser.result(),
+                                parser.prompt_tokens, window)
+            if cache_key:
+                self.run_db(response_cache.store, cache_key, parser)
+        await saved
+        return response
+
+    async def replay_cached(self, request, current_user, session_id, messages, model_name, cached, window):
+        """命中回复缓存时不占用模型 slot，直接回放，结束后和正常补全一样保存本轮消息"""
+        response = web.StreamResponse(headers=STREAM_HEADERS)
+        try:
+            await response.prepare(request)
+            await response.write(b''.join(replay(model_name, cached.content)))
+        except ConnectionResetError:
+            pass
+        finally:
+            saved = self.run_db(finish_completion, current_user, session_id, messages, model_name, cached.content,
+                                None, 0, 0.0, None, window)
+        await saved
+        return response
+
+    async def wait_turn(self, ticket, response):
+        """排队期间推送排队位置，轮到时返回 True；超时或客户端断开时返回 False"""
+        granted = asyncio.Event()
+        ticket.on_grant = lambda: self.loop.call_soon_threadsafe(granted.set)
+        try:
+            while True:
+                status = ticket.status()
+                if status is None:
+                    return True
+                await response.write(sse_event({'queue': status}))
+                try:
+                    await asyncio.wait_for(granted.wait(), ADMISSION_UPDATE_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        except AdmissionRejected as e:
+            await response.write(sse_event({'error': e.message}))
+        except ConnectionResetError:
+            pass
+        return False
+
+    async def events(self, request):
+        authenticate(request, stream=True)
+        known = parse_event_id(request.headers.get('Last-Event-ID') or request.query.get('last_event_id'))
+        response = web.StreamResponse(headers=STREAM_HEADERS)
+        await response.prepare(request)
+
+        started = self.loop.time()
+        try:
+            await response.write(f'retry: {SSE_RETRY_MS}\n\n'.encode('utf-8'))
+            while self.loop.time() - started < SSE_MAX_DURATION:
+                # 先取出事件再读状态，读完之后发生的变化一定会唤醒这次等待
+                changed = self.state_changed
+                frame = render_changes(event_hub.snapshot(), known)
+                if frame is None:
+                    try:
+                        await asyncio.wait_for(changed.wait(), SSE_HEARTBEAT_INTERVAL)
+                        continue
+                    except asyncio.TimeoutError:
+                        frame = HEARTBEAT
+                await response.write(frame.encode('utf-8'))
+        except ConnectionResetError:
+            pass
+        return response
+
+
+async def preflight(request):
+    return web.Response(headers={
+        'Access-Control-Allow-Methods': request.headers.get('Access-Control-Request-Method', 'GET, POST'),
+        'Access-Control-Allow-Headers': request.headers.get('Access-Control-Request-Headers', '')
+    })
+
+
+async def add_cors_headers(request, response):
+    # 与 app.py 中 CORS(app, supports_credentials=True) 的行为一致
+    origin = request.headers.get('Origin')
+    if origin:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Credentials'] = 'true'
+        response.headers['Vary'] = 'Origin'
+
+
+async def create_app():
+    gateway = Gateway()
+    app = web.Application()
+    app.on_startup.append(gateway.startup)
+    app.on_cleanup.append(gateway.cleanup)
+    app.on_response_prepare.append(add_cors_headers)
+    app.router.add_post('/api/chat/completions', gateway.completions)
+    app.router.add_get('/api/events', gateway.events)
+    app.router.add_route('OPTIONS', '/api/chat/completions', preflight)
+    app.router.add_route('OPTIONS', '/api/events', preflight)
+    return app
+
+
+if __name__ == '__main__':
+    # 客户端断开时取消处理协程，排队或连接上游期间断开的请求立即释放占用的票据和副本
+    web.run_app(create_app(), host=GATEWAY_HOST, port=GATEWAY_PORT, backlog=GATEWAY_BACKLOG,
+                handler_cancellation=True)
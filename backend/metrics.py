@@ -0,0 +1,531 @@
+"""Prometheus 格式的运行指标
+
+每个进程把计数写在 METRICS_DIR 下自己的一块共享内存文件里（一个预先分配好
+的 double 数组），/metrics 读取目录下所有进程的文件求和，所以多个 gunicorn
+worker（以及同一目录下的异步网关）的数据可以正确汇总。数组布局按 init_app
+时已注册的路由一次性分配，同名的 .json 文件记录每个位置对应的指标和标签；
+记录时只在锁内给数组的几项加上数值，不分配新对象。
+
+已退出进程的计数器保留在汇总中，进行中的请求数只统计仍存活的进程：汇总时
+把已退出进程的文件按布局合并进 aggregate-<布局摘要> 文件后删除，目录中的文件
+数不随进程重启增长。init_app 分配布局之前（如导入时执行数据库迁移）的计数先
+记在进程内存中，分配后转入文件。部署时在启动前清空 METRICS_DIR，避免把上一次
+运行的计数加进来。
+"""
+import atexit
+import bisect
+import fcntl
+import hashlib
+import json
+import mmap
+import operator
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+from flask import g, request
+
+# 指标配置
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'webui-metrics'))  # 各进程指标文件所在目录
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # 设置后 /metrics 需要 Authorization: Bearer <token>
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)            # 秒
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)  # 秒
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)                           # 字节
+
+# 单独计数的状态码，其他状态码记为 other
+STATUS_CODES = (200, 201, 204, 304, 400, 401, 403, 404, 405, 409, 413, 415, 422, 429, 500, 502, 503, 504)
+# SQL 语句类型按第一个关键字划分，commit 为提交事务的耗时
+STATEMENT_TYPES = ('select', 'insert', 'update', 'delete', 'pragma', 'begin', 'commit', 'rollback', 'create', 'other')
+UNMATCHED_ROUTE = '<unmatched>'
+COMPRESSION_ENCODINGS = ('gzip', 'br')
+RESPONSE_CACHE_EVICTIONS = ('lru', 'ttl', 'invalidated')
+MAX_CACHED_STATEMENTS = 4096
+AGGREGATE_PREFIX = 'aggregate'  # 已退出进程合并后的文件名前缀，其他文件以进程号开头
+
+
+class Layout:
+    """指标在数组中的位置
+
+    series 为 (名称, 类型, 标签, 偏移, 桶)，直方图占 len(桶) + 2 个位置：各桶
+    （非累积，最后一个为 +Inf）和总和。
+    """
+
+    def __init__(self, routes):
+        self.series = []
+        self.size = 0
+        self.requests = {}    # (route, method) -> 各状态码计数的起始位置
+        self.latency = {}     # (route, method) -> 直方图起始位置
+        self.request_size = {}
+        self.response_size = {}
+        for route, methods in routes + [(UNMATCHED_ROUTE, ('GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))]:
+            for method in methods:
+                labels = {'route': route, 'method': method}
+                key = (route, method)
+                self.requests[key] = self.size
+                for status in STATUS_CODES + ('other',):
+                    self._add('webui_http_requests_total', 'counter', dict(labels, status=str(status)))
+                self.latency[key] = self._add('webui_http_request_duration_seconds', 'histogram', labels,
+                                              LATENCY_BUCKETS)
+                self.request_size[key] = self._add('webui_http_request_size_bytes', 'histogram', labels,
+                                                   SIZE_BUCKETS)
+                self.response_size[key] = self._add('webui_http_response_size_bytes', 'histogram', labels,
+                                                    SIZE_BUCKETS)
+        self.queries = {
+            statement: self._add('webui_db_query_duration_seconds', 'histogram', {'statement': statement},
+                                 QUERY_BUCKETS)
+            for statement in STATEMENT_TYPES
+        }
+        self.query_errors = self._add('webui_db_query_errors_total', 'counter', {})
+        self.compression = {
+            encoding: (self._add('webui_http_compression_input_bytes_total', 'counter', {'encoding': encoding}),
+                       self._add('webui_http_compression_output_bytes_total', 'counter', {'encoding': encoding}),
+                       self._add('webui_http_compression_cpu_seconds_total', 'counter', {'encoding': encoding}))
+            for encoding in COMPRESSION_ENCODINGS
+        }
+        self.response_cache = {
+            'hit': self._add('webui_response_cache_lookups_total', 'counter', {'result': 'hit'}),
+            'miss': self._add('webui_response_cache_lookups_total', 'counter', {'result': 'miss'}),
+            'store': self._add('webui_response_cache_stores_total', 'counter', {}),
+            'saved_tokens': self._add('webui_response_cache_saved_tokens_total', 'counter', {}),
+        }
+        for reason in RESPONSE_CACHE_EVICTIONS:
+            self.response_cache[reason] = self._add('webui_response_cache_evictions_total', 'counter',
+                                                    {'reason': reason})
+        self.inflight = self._add('webui_http_requests_in_flight', 'gauge', {})
+        self.status_index = {status: i for i, status in enumerate(STATUS_CODES)}
+
+    def _add(self, name, kind, labels, buckets=None):
+        offset = self.size
+        self.series.append((name, kind, labels, offset, buckets))
+        self.size += 1 if buckets is None else len(buckets) + 2
+        return offset
+
+
+class MetricsStore:
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.routes = None  # set_routes 之前不创建文件
+        self._lock = threading.Lock()
+        self._layout = None
+        self._values = None
+        self._path = None
+        self._statements = {}
+        self._layout_files = {}  # 其他进程的布局文件内容，文件创建后不再变化
+        self._aggregates = {}    # 布局文本 -> (aggregate 文件路径, 数组长度, gauge 的位置)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # 子进程使用自己的文件，父进程 fork 前的计数留在父进程的文件中
+        self._lock = threading.Lock()
+        self._values = None
+        self._path = None
+
+    def set_routes(self, routes):
+        """按新的路由列表重新分配布局
+
+        之前已有文件时计数留在原来的文件中，汇总时照常计入；之前只记在内存中的
+        计数转入新的文件。
+        """
+        with self._lock:
+            pending = None
+            if self._values is not None and self._path is None:
+                pending = (self._layout, self._values)
+            self.routes = routes
+            self._layout = None
+            self._values = None
+            self._path = None
+            if pending is not None:
+                self._open()
+                _carry(pending[0], pending[1], self._layout, self._values)
+
+    def values(self):
+        if self._values is None:
+            with self._lock:
+                if self._values is None:
+                    self._open()
+        return self._values
+
+    def _open(self):
+        if self._layout is None:
+            self._layout = Layout(self.routes or [])
+        size = self._layout.size * 8
+        if self.routes is None:
+            # 布局还没有确定，先记在内存中，set_routes 时转入文件
+            self._values = memoryview(mmap.mmap(-1, size)).cast('d')
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}-{time.time_ns()}')
+            with open(path + '.json', 'w') as f:
+                json.dump(self._layout.series, f)
+            with open(path + '.bin', 'w+b') as f:
+                f.truncate(size)
+                buffer = mmap.mmap(f.fileno(), size)
+            self._path = path
+        except OSError as e:
+            # 目录不可写时只统计本进程
+            print(f"Error creating metrics file: {str(e)}")
+            buffer = mmap.mmap(-1, size)
+        self._values = memoryview(buffer).cast('d')
+
+    @property
+    def layout(self):
+        self.values()
+        return self._layout
+
+    def observe_request(self, route, method, status, duration, request_bytes, response_bytes):
+        values = self.values()
+        layout = self._layout
+        key = (route, method)
+        base = layout.requests.get(key)
+        if base is None:
+            key = (UNMATCHED_ROUTE, method)
+            base = layout.requests.get(key)
+            if base is None:
+                return
+        status_offset = base + layout.status_index.get(status, len(STATUS_CODES))
+        with self._lock:
+            values[status_offset] += 1
+            _observe(values, layout.latency[key], LATENCY_BUCKETS, duration)
+            if request_bytes is not None:
+                _observe(values, layout.request_size[key], SIZE_BUCKETS, request_bytes)
+            if response_bytes is not None:
+                _observe(values, layout.response_size[key], SIZE_BUCKETS, response_bytes)
+
+    def observe_query(self, sql, duration, failed=False):
+        values = self.values()
+        layout = self._layout
+        statement = self._statements.get(sql)
+        if statement is None:
+            word = sql.lstrip().split(None, 1)[0].lower() if sql.strip() else 'other'
+            statement = word if word in layout.queries else 'other'
+            if len(self._statements) < MAX_CACHED_STATEMENTS:
+                self._statements[sql] = statement
+        with self._lock:
+            _observe(values, layout.queries[statement], QUERY_BUCKETS, duration)
+            if failed:
+                values[layout.query_errors] += 1
+
+    def observe_compression(self, encoding, size, compressed, seconds):
+        values = self.values()
+        offsets = self._layout.compression.get(encoding)
+        if offsets is None:
+            return
+        with self._lock:
+            values[offsets[0]] += size
+            values[offsets[1]] += compressed
+            values[offsets[2]] += seconds
+
+    def observe_response_cache(self, event, amount=1):
+        """event 为 hit、miss、store、saved_tokens 或淘汰原因"""
+        values = self.values()
+        offset = self._layout.response_cache.get(event)
+        if offset is None:
+            return
+        with self._lock:
+            values[offset] += amount
+
+    def inflight(self, delta):
+        values = self.values()
+        with self._lock:
+            values[self._layout.inflight] += delta
+
+    def close(self):
+        """进程正常退出时清零进行中的请求数"""
+        if self._values is not None:
+            self._values[self._layout.inflight] = 0
+
+    def collect(self):
+        """汇总目录下所有进程的指标，返回 {(名称, 类型): {标签元组: 值或 [桶..., 总和]}}"""
+        self.values()
+        # 布局相同（同一份代码和路由）的进程先按位置逐项相加，最后只遍历一次布局
+        totals = {}  # 布局文本 -> (series, 各位置之和)
+        sources = [(json.dumps(self._layout.series), self._values, True)]
+        try:
+            with self._directory_lock(fcntl.LOCK_EX):
+                self._merge_dead(self._list_files())
+            # 共享锁：读取期间其他进程不会把文件合并进 aggregate，同一份计数不会读到两次
+            with self._directory_lock(fcntl.LOCK_SH):
+                for name in self._list_files():
+                    path = os.path.join(self.directory, name)
+                    if path == self._path:
+                        continue
+                    try:
+                        layout = self._read_layout(path)
+                        with open(path + '.bin', 'rb') as f:
+                            data = array('d', f.read())
+                    except (OSError, ValueError):
+                        continue
+                    sources.append((layout, data, _file_alive(name)))
+        except OSError:
+            pass
+
+        for layout, data, alive in sources:
+            entry = totals.get(layout)
+            if entry is None:
+                series = json.loads(layout)
+                entry = totals[layout] = (series, [0.0] * sum(_width(s) for s in series))
+            series, total = entry
+            if len(data) < len(total):
+                continue
+            for i, value in enumerate(data[:len(total)]):
+                total[i] += value
+            if not alive:
+                # 已退出进程的进行中请求数不计入
+                for _, kind, _, offset, _ in series:
+                    if kind == 'gauge':
+                        total[offset] -= data[offset]
+
+        merged = {}
+        for series, total in totals.values():
+            for name, kind, labels, offset, buckets in series:
+                key = tuple(sorted(labels.items()))
+                metric = merged.setdefault((name, kind), {})
+                if buckets is None:
+                    metric[key] = metric.get(key, 0.0) + total[offset]
+                    continue
+                values = metric.get(key)
+                if values is None:
+                    values = metric[key] = [0.0] * (len(buckets) + 2)
+                for i in range(len(values)):
+                    values[i] += total[offset + i]
+        return merged
+
+    def _list_files(self):
+        return [name[:-5] for name in os.listdir(self.directory) if name.endswith('.json')]
+
+    def _read_layout(self, path):
+        layout = self._layout_files.get(path)
+        if layout is None:
+            with open(path + '.json') as f:
+                layout = self._layout_files[path] = f.read()
+        return layout
+
+    @contextmanager
+    def _directory_lock(self, operation):
+        with open(os.path.join(self.directory, '.lock'), 'a') as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _merge_dead(self, files):
+        """把已退出进程的文件按布局加到 aggregate 文件中并删除（需持有目录的排他锁）"""
+        for name in files:
+            if _file_alive(name):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                layout = self._read_layout(path)
+                with open(path + '.bin', 'rb') as f:
+                    data = array('d', f.read())
+                target, size, gauges = self._aggregate(layout)
+                if len(data) >= size:
+                    try:
+                        with open(target + '.bin', 'rb') as f:
+                            total = array('d', f.read())
+                    except FileNotFoundError:
+                        total = array('d', bytes(size * 8))
+                        with open(target + '.json', 'w') as f:
+                            f.write(layout)
+                    total = array('d', map(operator.add, total[:size], data[:size]))
+                    for offset in gauges:
+                        total[offset] = 0.0  # 已退出进程的进行中请求数不计入
+                    # 先写临时文件再替换，合并中途出错不会留下写了一半的文件
+                    with open(target + '.tmp', 'wb') as f:
+                        f.write(total.tobytes())
+                    os.replace(target + '.tmp', target + '.bin')
+                os.remove(path + '.bin')
+                os.remove(path + '.json')
+            except (OSError, ValueError) as e:
+                print(f"Error merging metrics file {name}: {str(e)}")
+            self._layout_files.pop(path, None)
+
+    def _aggregate(self, layout):
+        entry = self._aggregates.get(layout)
+        if entry is None:
+            series = json.loads(layout)
+            entry = self._aggregates[layout] = (
+                os.path.join(self.directory, f'{AGGREGATE_PREFIX}-' + hashlib.sha1(layout.encode()).hexdigest()[:16]),
+                sum(_width(s) for s in series),
+                [offset for _, kind, _, offset, _ in series if kind == 'gauge']
+            )
+        return entry
+
+    def render(self):
+        """Prometheus 文本格式（0.0.4）"""
+        lines = []
+        buckets_of = {}
+        for name, _, _, _, buckets in self.layout.series:
+            buckets_of.setdefault(name, buckets)
+        for (name, kind), metric in sorted(self.collect().items()):
+            lines.append(f'# HELP {name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(metric.items()):
+                if kind == 'histogram':
+                    count = sum(value[:-1])
+                    if not count:
+                        continue
+                    cumulative = 0.0
+                    for bound, n in zip(buckets_of[name] + ('+Inf',), value[:-1]):
+                        cumulative += n
+                        lines.append(f'{name}_bucket{_labels(labels, le=bound)} {_number(cumulative)}')
+                    lines.append(f'{name}_sum{_labels(labels)} {_number(value[-1])}')
+                    lines.append(f'{name}_count{_labels(labels)} {_number(count)}')
+                elif value or kind == 'gauge' or not labels:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+HELP = {
+    'webui_http_requests_total': 'HTTP requests by route, method and status code',
+    'webui_http_request_duration_seconds': 'Time until the response headers are ready',
+    'webui_http_request_size_bytes': 'Request body size',
+    'webui_http_response_size_bytes': 'Response body size (streamed responses are not counted)',
+    'webui_http_requests_in_flight': 'Requests currently being handled',
+    'webui_db_query_duration_seconds': 'SQLite statement execution time by statement type',
+    'webui_db_query_errors_total': 'SQLite statements that raised an error',
+    'webui_http_compression_input_bytes_total': 'Response bytes before compression',
+    'webui_http_compression_output_bytes_total': 'Response bytes after compression (sent on the wire)',
+    'webui_http_compression_cpu_seconds_total': 'CPU time spent compressing responses',
+    'webui_response_cache_lookups_total': 'Deterministic completion cache lookups by result',
+    'webui_response_cache_stores_total': 'Completions stored in the response cache',
+    'webui_response_cache_saved_tokens_total': 'Completion tokens served from the response cache instead of the model',
+    'webui_response_cache_evictions_total': 'Response cache entries removed by reason',
+}
+
+
+def _observe(values, offset, buckets, value):
+    values[offset + bisect.bisect_left(buckets, value)] += 1
+    values[offset + len(buckets) + 1] += value
+
+
+def _width(series):
+    buckets = series[4]
+    return 1 if buckets is None else len(buckets) + 2
+
+
+def _carry(old_layout, old_values, layout, values):
+    """把旧布局中的计数按 (名称, 标签) 加到新布局的对应位置"""
+    offsets = {(name, json.dumps(labels, sort_keys=True)): offset
+               for name, _, labels, offset, _ in layout.series}
+    for series in old_layout.series:
+        name, kind, labels, offset, _ = series
+        target = offsets.get((name, json.dumps(labels, sort_keys=True)))
+        if target is None or kind == 'gauge':
+            continue
+        for i in range(_width(series)):
+            values[target + i] += old_values[offset + i]
+
+
+def _file_alive(name):
+    """文件名以进程号开头；aggregate 文件不属于任何进程，其中的进行中请求数已清零"""
+    pid = name.split('-', 1)[0]
+    return pid == AGGREGATE_PREFIX or _alive(int(pid))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _labels(labels, **extra):
+    items = list(labels) + [(k, v) for k, v in extra.items()]
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """记录每条语句执行耗时的游标（不含读取后续结果行的时间）"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            result = super().execute(sql, parameters)
+        except sqlite3.Error:
+            store.observe_query(sql, time.perf_counter() - started, failed=True)
+            raise
+        store.observe_query(sql, time.perf_counter() - started)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            result = super().executemany(sql, seq_of_parameters)
+        except sqlite3.Error:
+            store.observe_query(sql, time.perf_counter() - started, failed=True)
+            raise
+        store.observe_query(sql, time.perf_counter() - started)
+        return result
+
+
+class TimedConnection(sqlite3.Connection):
+    """database.connect() 使用的连接类，所有语句经过 TimedCursor"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        super().commit()
+        store.observe_query('commit', time.perf_counter() - started)
+
+
+def init_app(app):
+    """注册请求钩子，需要在所有路由注册之后调用，布局按这时的路由分配"""
+    routes = {}
+    for rule in app.url_map.iter_rules():
+        routes.setdefault(rule.rule, set()).update(rule.methods)
+    store.set_routes([(rule, tuple(sorted(methods))) for rule, methods in sorted(routes.items())])
+    atexit.register(store.close)
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        store.inflight(1)
+
+    @app.after_request
+    def record(response):
+        started = g.get('metrics_started')
+        if started is not None:
+            rule = request.url_rule
+            store.observe_request(
+                rule.rule if rule is not None else UNMATCHED_ROUTE, request.method, response.status_code,
+                time.perf_counter() - started, request.content_length,
+                None if response.is_streamed else response.content_length
+            )
+        return response
+
+    @app.teardown_request
+    def finish(exc=None):
+        if g.pop('metrics_started', None) is not None:
+            store.inflight(-1)
+
+
+store = MetricsStore()
@@ -0,0 +1,203 @@
+"""数据库结构的版本管理
+
+migrations/ 下的 NNNN_说明.sql 按编号依次执行，每个迁移在一个事务中执行并
+记入 schema_version，只会执行一次。schema.sql 始终是最新的完整结构：新建
+的数据库直接执行 schema.sql，并把现有的迁移全部记为已执行。修改结构时同时
+修改 schema.sql 并新增一个迁移文件（迁移中不要写 BEGIN / COMMIT）。
+
+迁移在进程启动时执行（app.py 导入时，gunicorn 的每个 worker 和网关都会
+执行）。已是最新版本时只读一次 schema_version；否则用 BEGIN IMMEDIATE 取得
+数据库的写锁，拿到锁后重新读取版本，其他进程等待它提交后发现已是最新版本，
+什么也不做。迁移出错时整个事务回滚，进程启动失败。
+
+早于这个机制的数据库（有表但没有 schema_version）第一次启动时，按表结构
+判断原来手动执行的迁移脚本是否已执行过，只补执行缺少的，再执行一遍
+schema.sql 补建之后新增的表。
+
+用法（在 backend 目录下）:
+    python migrate.py           # 执行尚未执行的迁移
+    python migrate.py status    # 查看当前版本和待执行的迁移
+"""
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import database
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_LOCK_TIMEOUT = int(os.getenv('MIGRATION_LOCK_TIMEOUT', '600'))  # 等待其他进程执行完迁移的最长秒数
+DB_AUTO_MIGRATE = os.getenv('DB_AUTO_MIGRATE', '1') == '1'                 # 进程启动时自动执行迁移，为 0 时需手动执行 python migrate.py
+
+MIGRATION_FILE = re.compile(r'(\d{4})_(\w+)\.sql$')
+
+
+def table_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def column_type(conn, table, column):
+    """列声明的类型，列不存在时返回 None"""
+    row = conn.execute('SELECT type FROM pragma_table_info(?) WHERE name = ?', (table, column)).fetchone()
+    return row[0] if row else None
+
+
+# 加入版本管理之前手动执行的迁移脚本：表结构已经是迁移之后的样子（或者相关的表
+# 还不存在，之后由 schema.sql 按最新结构创建）时视为已执行
+LEGACY_APPLIED = {
+    1: lambda conn: not table_exists(conn, 'announcements') or column_type(conn, 'announcements', 'display_start'),
+    2: lambda conn: not table_exists(conn, 'chat_sessions') or table_exists(conn, 'session_messages'),
+    3: lambda conn: not table_exists(conn, 'chat_sessions') or column_type(conn, 'chat_sessions', 'message_count'),
+    4: lambda conn: not table_exists(conn, 'chat_history') or column_type(conn, 'chat_history', 'timestamp') == 'REAL',
+    5: lambda conn: not table_exists(conn, 'model_stats'),
+    6: lambda conn: (not table_exists(conn, 'session_messages')
+                     or column_type(conn, 'session_messages', 'message_json')),
+    7: lambda conn: not table_exists(conn, 'session_messages') or column_type(conn, 'session_messages', 'tokens'),
+}
+
+
+class Migration:
+    __slots__ = ('version', 'name', 'path')
+
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE.fullmatch(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort(key=lambda migration: migration.version)
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f'duplicate migration version in {directory}')
+    return migrations
+
+
+def run_script(conn, path):
+    """在当前事务中逐条执行 SQL 文件
+
+    executescript 会先提交当前事务，不能用在迁移里。按 sqlite3.complete_statement
+    切分语句，触发器中的多条语句不会被拆开。
+    """
+    with open(path, 'r') as f:
+        script = f.read()
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+    remainder = [line for line in statement.splitlines() if line.strip() and not line.strip().startswith('--')]
+    if remainder:
+        raise sqlite3.ProgrammingError(f'incomplete statement at end of {path}')
+
+
+def current_version(conn):
+    """已执行的最大迁移版本，没有 schema_version 表时返回 None"""
+    if not table_exists(conn, 'schema_version'):
+        return None
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def record(conn, migration):
+    conn.execute('INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                 (migration.version, migration.name, time.time()))
+
+
+def adopt(conn, migrations):
+    """把没有 schema_version 的数据库纳入版本管理，返回补执行的迁移"""
+    fresh = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    ).fetchone() is None
+    conn.execute('''
+        CREATE TABLE schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at REAL NOT NULL  -- 执行时间（Unix 时间，秒）
+        )
+    ''')
+    if fresh:
+        run_script(conn, database.SCHEMA_FILE)
+        for migration in migrations:
+            record(conn, migration)
+        return []
+
+    applied = []
+    for migration in migrations:
+        if migration.version not in LEGACY_APPLIED:
+            break
+        if not LEGACY_APPLIED[migration.version](conn):
+            run_script(conn, migration.path)
+            applied.append(migration)
+        record(conn, migration)
+    # 之后新增的表和索引
+    search_created = not table_exists(conn, 'search_index')
+    run_script(conn, database.SCHEMA_FILE)
+    if search_created:
+        # 已有数据的库第一次启用全文搜索时，按原表建立索引
+        from search import search_index
+        search_index.rebuild(conn)
+    return applied
+
+
+def migrate(path=None):
+    """把数据库升级到最新版本，返回这次执行的迁移"""
+    migrations = load_migrations()
+    latest = migrations[-1].version
+    conn = database.connect(path)
+    conn.isolation_level = None  # 手动管理事务，DDL 和数据修改在同一个事务中
+    try:
+        if current_version(conn) == latest:
+            return []
+        conn.execute(f'PRAGMA busy_timeout = {MIGRATION_LOCK_TIMEOUT * 1000}')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 拿到写锁后重新读取，其他进程可能刚刚执行完
+            version = current_version(conn)
+            applied = adopt(conn, migrations) if version is None else []
+            version = current_version(conn)
+            for migration in migrations:
+                if migration.version > version:
+                    run_script(conn, migration.path)
+                    record(conn, migration)
+                    applied.append(migration)
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+    for migration in applied:
+        print(f'数据库迁移 {migration.version:04d}_{migration.name} 已执行')
+    return applied
+
+
+def status(path=None):
+    """返回 (当前版本, 待执行的迁移)"""
+    conn = database.connect(path)
+    try:
+        version = current_version(conn)
+    finally:
+        conn.close()
+    pending = [migration for migration in load_migrations() if version is None or migration.version > version]
+    return version, pending
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['status']:
+        version, pending = status()
+        print(f'schema version: {"none" if version is None else version}')
+        for migration in pending:
+            print(f'pending: {migration.version:04d}_{migration.name}')
+    elif sys.argv[1:]:
+        sys.exit('usage: python migrate.py [status]')
+    else:
+        applied = migrate()
+        print(f'applied {len(applied)} migration(s)')
@@ -0,0 +1,5 @@
+-- 为已有数据库启用增量 auto_vacuum，之后由后台任务分步回收删除和归档腾出的空间
+-- auto_vacuum 模式只有在 VACUUM 重建数据库时才会生效；VACUUM 不能在事务中执行，会锁住整个数据库并需要约一倍的临时磁盘空间，请在停机维护时执行
+-- 用法: sqlite3 users.db < migrate_auto_vacuum.sql
+PRAGMA auto_vacuum = INCREMENTAL;
+VACUUM;
@@ -0,0 +1,33 @@
+-- 将 chat_sessions.messages 中的 JSON 数组迁移到 session_messages 表
+
+CREATE TABLE IF NOT EXISTS session_messages (
+    session_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq),
+    FOREIGN KEY (session_id) REFERENCES chat_sessions(id)
+);
+
+-- 旧数据中有用单引号保存的消息，先尝试按原样解析，失败再替换引号
+INSERT OR IGNORE INTO session_messages (session_id, seq, role, content)
+SELECT
+    s.id,
+    m.key,
+    COALESCE(
+        json_extract(m.value, '$.role'),
+        CASE WHEN json_extract(m.value, '$.user') IS NOT NULL THEN 'user' ELSE 'assistant' END
+    ),
+    COALESCE(json_extract(m.value, '$.content'), json_extract(m.value, '$.text'), '')
+FROM chat_sessions s, json_each(
+    CASE
+        WHEN json_valid(s.messages) AND json_type(s.messages) = 'array' THEN s.messages
+        WHEN json_valid(replace(s.messages, '''', '"')) AND json_type(replace(s.messages, '''', '"')) = 'array'
+            THEN replace(s.messages, '''', '"')
+        ELSE '[]'
+    END
+) m
+WHERE m.type = 'object';
+
+-- 消息已搬走，清空旧列释放空间
+UPDATE chat_sessions SET messages = '[]' WHERE messages != '[]';
@@ -0,0 +1,10 @@
+-- 为会话列表增加最后更新时间、消息数量和分页索引
+
+ALTER TABLE chat_sessions ADD COLUMN updatedAt TEXT;
+ALTER TABLE chat_sessions ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE chat_sessions SET
+    updatedAt = createdAt,
+    message_count = (SELECT COALESCE(MAX(seq) + 1, 0) FROM session_messages WHERE session_id = chat_sessions.id);
+
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_username_created ON chat_sessions (username, createdAt);
@@ -0,0 +1,28 @@
+-- 将 chat_history.timestamp 从 str(datetime.now()) 文本改为 Unix 时间（秒），并添加分页索引
+-- 旧值为服务器本地时间，转换时按本地时区换算为 UTC
+
+-- 原列声明为 TEXT，数值会被转回文本，因此需要重建表
+CREATE TABLE chat_history_new (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    user TEXT NOT NULL,
+    ai TEXT NOT NULL,
+    model TEXT NOT NULL,
+    timestamp REAL NOT NULL,  -- Unix 时间（秒）
+    FOREIGN KEY (username) REFERENCES users(username)
+);
+
+INSERT INTO chat_history_new (id, username, user, ai, model, timestamp)
+SELECT
+    id,
+    username,
+    user,
+    ai,
+    model,
+    COALESCE((julianday(timestamp, 'utc') - 2440587.5) * 86400.0, 0)
+FROM chat_history;
+
+DROP TABLE chat_history;
+ALTER TABLE chat_history_new RENAME TO chat_history;
+
+CREATE INDEX IF NOT EXISTS idx_chat_history_username_timestamp ON chat_history (username, timestamp);
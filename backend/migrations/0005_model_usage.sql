@@ -0,0 +1,4 @@
+-- 模型使用统计改为按时间桶汇总：删除只有累计对话数的 model_stats 表
+-- model_usage 和 model_usage_users 由 schema.sql 创建（早于迁移机制的数据库在纳入版本管理时补建），这里只删除旧表
+
+DROP TABLE IF EXISTS model_stats;
@@ -0,0 +1,10 @@
+-- 为 session_messages 增加写入时生成的 message_json，读取会话时直接拼接，不再逐条解码再编码
+-- 同时一次性修复旧数据迁移遗留的不规范消息，之后所有消息都在写入时校验
+
+ALTER TABLE session_messages ADD COLUMN message_json TEXT;
+
+-- 旧 JSON 中的角色可能是任意字符串，内容可能是数字或嵌套对象
+UPDATE session_messages SET role = 'assistant' WHERE role NOT IN ('system', 'user', 'assistant');
+UPDATE session_messages SET content = CAST(content AS TEXT) WHERE typeof(content) != 'text';
+
+UPDATE session_messages SET message_json = json_object('role', role, 'content', content);
@@ -0,0 +1,5 @@
+-- 为服务端组装上下文增加每条消息的 token 数和会话的窗口起点，见 context_window.py
+-- 已有消息的 token 数为空，在所属会话下一次补全时计算并写入
+
+ALTER TABLE session_messages ADD COLUMN tokens INTEGER;
+ALTER TABLE chat_sessions ADD COLUMN context_start INTEGER NOT NULL DEFAULT 0;
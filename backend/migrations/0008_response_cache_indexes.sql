@@ -0,0 +1,5 @@
+-- 回复缓存每次写入时执行的三条清理语句原来都要扫描整个 response_cache 表
+-- 两个索引都只包含很短的列，加上 WITHOUT ROWID 表自带的主键 key，删除时不需要回表
+
+CREATE INDEX IF NOT EXISTS idx_response_cache_model_generation ON response_cache (model, generation);
+CREATE INDEX IF NOT EXISTS idx_response_cache_created ON response_cache (created_at);
@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+
+# model_rotator.py 写出的模型状态快照
+MODEL_STATE_FILE = os.getenv(
+    'MODEL_STATE_FILE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model_states.json')
+)
+
+# 静态配置的模型地址，优先于快照，同一模型可以出现多次表示多个副本，例如
+# "DS-R1=http://10.21.22.204:29500,QwQ-32B=http://10.21.22.201:29500,QwQ-32B=http://10.21.22.205:29500"
+MODEL_UPSTREAMS = os.getenv('MODEL_UPSTREAMS', '')
+
+# 静态配置的每个请求可用的上下文长度（llama-server 的 -c 除以 -np），优先于快照，例如
+# "DS-R1=10240,QwQ-32B=16384"；都没有配置时使用 context_window.py 中的默认值
+MODEL_CONTEXT = os.getenv('MODEL_CONTEXT', '')
+
+
+def parse_upstreams(value):
+    upstreams = {}
+    for item in value.split(','):
+        if '=' in item:
+            name, url = item.split('=', 1)
+            upstreams.setdefault(name.strip(), []).append(url.strip().rstrip('/'))
+    return upstreams
+
+
+class ModelRegistry:
+    """模型名称到 llama-server 地址的映射
+
+    快照文件按修改时间缓存，只有文件变化时才重新读取。
+    """
+
+    def __init__(self, state_file=MODEL_STATE_FILE, static=MODEL_UPSTREAMS, context=MODEL_CONTEXT):
+        self.state_file = state_file
+        self.static = parse_upstreams(static)
+        self.context = {name: int(values[-1]) for name, values in parse_upstreams(context).items()}
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._states = {}
+
+    def states(self):
+        """返回 (mtime, 状态字典)，快照不存在时 mtime 为 None"""
+        try:
+            mtime = os.stat(self.state_file).st_mtime
+        except OSError:
+            return None, {}
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    with open(self.state_file, 'r') as f:
+                        self._states = json.load(f)
+                    self._mtime = mtime
+        return self._mtime, self._states
+
+    def names(self):
+        """所有已知模型的完整名称"""
+        _, states = self.states()
+        return list(self.static) + [name for name in states if name not in self.static]
+
+    def resolve(self, model):
+        """把前端使用的模型名（如 QwQ、DS-R1）解析为完整模型名"""
+        names = self.names()
+        if model in names:
+            return model
+        for name in names:
+            if name.startswith(model):
+                return name
+        return None
+
+    def upstreams(self, model):
+        """返回模型当前所有副本的服务地址，不可用时返回空列表"""
+        name = self.resolve(model)
+        if name is None:
+            return []
+        if name in self.static:
+            return self.static[name]
+        state = self.states()[1].get(name, {})
+        if not state.get('is_available'):
+            return []
+        # 旧版快照只有单个 api 字段
+        replicas = state.get('replicas') or [{'api': state.get('api')}]
+        return [r['api'].rstrip('/') for r in replicas if r.get('api')]
+
+    def generation(self, model):
+        """模型当前部署的标识：快照中各副本的作业号，模型被重启或轮换后改变；静态配置的模型为地址列表"""
+        name = self.resolve(model)
+        if name is None:
+            return None
+        if name in self.static:
+            return ','.join(self.static[name])
+        state = self.states()[1].get(name, {})
+        replicas = state.get('replicas') or [{'job_id': state.get('job_id')}]
+        return ','.join(sorted(str(r.get('job_id')) for r in replicas))
+
+    def context_window(self, model):
+        """模型每个请求可用的上下文 token 数，未配置时返回 None"""
+        name = self.resolve(model)
+        if name is None:
+            return None
+        if name in self.context:
+            return self.context[name]
+        return self.states()[1].get(name, {}).get('context_window')
+
+
+model_registry = ModelRegistry()
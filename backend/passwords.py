@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+# 密码哈希配置
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', str(os.cpu_count() or 1)))  # 0 表示在请求线程内直接计算
+BCRYPT_MAX_PENDING = int(os.getenv('BCRYPT_MAX_PENDING', str(max(BCRYPT_WORKERS, 1) * 4)))
+BCRYPT_TIMEOUT = float(os.getenv('BCRYPT_TIMEOUT', '5'))  # 秒
+
+# 登录限流配置：窗口内次数超过上限后拒绝，直到窗口结束
+# 按 IP 只统计失败次数，同一教室 NAT 后面的大量正常登录不会被拦截
+LOGIN_WINDOW = int(os.getenv('LOGIN_WINDOW', '300'))
+LOGIN_MAX_FAILURES_PER_USER = int(os.getenv('LOGIN_MAX_FAILURES_PER_USER', '5'))
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv('LOGIN_MAX_FAILURES_PER_IP', '50'))
+REGISTER_MAX_PER_IP = int(os.getenv('REGISTER_MAX_PER_IP', '100'))
+
+
+class HasherBusy(Exception):
+    """哈希进程池已满或等待超时"""
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+class PasswordHasher:
+    """把 bcrypt 计算放到独立进程池中执行
+
+    同时在途的任务数有上限，超过时立即抛出 HasherBusy，而不是让请求排队
+    占住 worker。进程池按需创建，gunicorn fork 后每个 worker 各自持有一份。
+    """
+
+    def __init__(self, workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING,
+                 timeout=BCRYPT_TIMEOUT, rounds=BCRYPT_ROUNDS):
+        self.workers = workers
+        self.timeout = timeout
+        self.rounds = rounds
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HasherBusy()
+
+    def hash(self, password):
+        return self._run(_hashpw, password.encode('utf-8'), self.rounds)
+
+    def check(self, password, hashed):
+        if isinstance(hashed, str):
+            hashed = hashed.encode('utf-8')
+        return self._run(_checkpw, password.encode('utf-8'), hashed)
+
+    def needs_rehash(self, hashed):
+        """哈希的 cost 与当前配置不同时返回 True"""
+        if isinstance(hashed, str):
+            hashed = hashed.encode('utf-8')
+        try:
+            return int(hashed.split(b'$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+class AttemptLimiter:
+    """固定窗口计数器，按 key 统计次数"""
+
+    def __init__(self, limit, window=LOGIN_WINDOW, max_keys=100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._counts = {}  # key -> (count, window_start)
+
+    def retry_after(self, key):
+        """超过上限时返回需要等待的秒数，否则返回 0"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is None or now - entry[1] >= self.window:
+                return 0
+            if entry[0] >= self.limit:
+                return int(self.window - (now - entry[1])) + 1
+            return 0
+
+    def hit(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is None or now - entry[1] >= self.window:
+                if len(self._counts) >= self.max_keys:
+                    self._prune(now)
+                self._counts[key] = (1, now)
+            else:
+                self._counts[key] = (entry[0] + 1, entry[1])
+
+    def reset(self, key):
+        with self._lock:
+            self._counts.pop(key, None)
+
+    def _prune(self, now):
+        expired = [k for k, (_, start) in self._counts.items() if now - start >= self.window]
+        for k in expired:
+            del self._counts[k]
+        # 仍然太多时丢弃最早的窗口，保证内存有上限
+        if len(self._counts) >= self.max_keys:
+            for k in sorted(self._counts, key=lambda k: self._counts[k][1])[:len(self._counts) // 2]:
+                del self._counts[k]
+
+
+class LoginThrottle:
+    """按用户名和 IP 统计登录失败次数、按 IP 统计注册次数，在计算哈希之前拒绝"""
+
+    def __init__(self):
+        self.users = AttemptLimiter(LOGIN_MAX_FAILURES_PER_USER)
+        self.ips = AttemptLimiter(LOGIN_MAX_FAILURES_PER_IP)
+        self.registrations = AttemptLimiter(REGISTER_MAX_PER_IP)
+
+    def check(self, username, ip):
+        """返回需要等待的秒数，0 表示允许"""
+        return max(self.users.retry_after(username), self.ips.retry_after(ip))
+
+    def check_register(self, ip):
+        """注册同样要计算哈希，按 IP 限制次数；允许时计入一次"""
+        retry_after = self.registrations.retry_after(ip)
+        if not retry_after:
+            self.registrations.hit(ip)
+        return retry_after
+
+    def failed(self, username, ip):
+        self.users.hit(username)
+        self.ips.hit(ip)
+
+    def succeeded(self, username):
+        self.users.reset(username)
+
+
+password_hasher = PasswordHasher()
+login_throttle = LoginThrottle()
@@ -0,0 +1,279 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import jsonify
+from flask_jwt_extended import get_jwt_identity
+
+import database
+
+# 限流和额度配置
+RATE_LIMIT_FILE = os.getenv('RATE_LIMIT_FILE', database.DATABASE + '-ratelimit')  # 所有 worker 和网关共享的计数文件，默认在数据库文件旁边
+RATE_LIMIT_SLOTS = int(os.getenv('RATE_LIMIT_SLOTS', '65536'))  # 共享表的槽位数，每个 32 字节
+# 每个用户在各类接口上的令牌桶，"组=容量/秒数" 表示最多连续请求容量次，之后每 秒数/容量 秒恢复一次；容量为 0 表示不限
+RATE_LIMITS = os.getenv('RATE_LIMITS', 'completions=20/60,chat=30/60,search=60/60,writes=120/60')
+TOKEN_QUOTA_DAILY = int(os.getenv('TOKEN_QUOTA_DAILY', '0'))    # 没有配置规则时每个用户每个模型每天可生成的 token 数，0 表示不限
+
+SLOT = struct.Struct('<Qddd')  # 键的哈希、值（令牌数或已用 token 数）、更新时间、日期（额度所属的日期序号）
+PROBE = 8                      # 每个键所在的一组槽位数，组内都被占用时覆盖其中最久未更新的（当天的额度除外）
+LOCK_STRIPES = 64              # 跨进程文件锁的分段数，每组槽位只对应一个分段
+WILDCARD = '*'
+
+
+class QuotaExceeded(Exception):
+    """用户当天在该模型上的 token 额度已用完"""
+
+    def __init__(self, retry_after):
+        super().__init__('今日该模型的 token 额度已用完')
+        self.message = str(self)
+        self.retry_after = retry_after
+
+
+def parse_limits(value):
+    limits = {}
+    for item in value.split(','):
+        if '=' in item:
+            name, spec = item.split('=', 1)
+            burst, _, seconds = spec.partition('/')
+            if int(burst) > 0:
+                limits[name.strip()] = (int(burst), float(seconds or 60))
+    return limits
+
+
+class SharedCounters:
+    """多个进程共享的定长哈希表
+
+    文件映射到每个进程的内存中，第 1 个槽位起每 PROBE 个槽位为一组，按键的
+    64 位哈希选定一组，读写一个键只涉及这一组槽位。进程内用线程锁、进程间用
+    按组分段的 fcntl 文件锁（锁住一组中的所有槽位）保证读-改-写的原子性。
+    第 0 个槽位保存额度规则的版本号。
+
+    组内没有空槽位时覆盖最久未更新的令牌桶或往日的额度（日期不是今天的
+    槽位），被覆盖的桶只是提前恢复满；当天的额度不会被覆盖，否则用户的
+    已用量会清零。组内全是当天的额度时这次更新不写入（限流放行、用量不
+    累加），RATE_LIMIT_SLOTS 应明显大于每天使用的 (用户, 模型) 数。
+    """
+
+    def __init__(self, path=RATE_LIMIT_FILE, slots=RATE_LIMIT_SLOTS):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def _open(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                    size = self.slots * SLOT.size
+                    if os.fstat(fd).st_size < size:
+                        os.ftruncate(fd, size)
+                    self._map = mmap.mmap(fd, size)
+                    self._fd = fd
+                    self._pid = os.getpid()
+        return self._map
+
+    def _locate(self, key):
+        """返回 (哈希, 所在组的第一个槽位, 锁分段)，0 号槽位和空槽位的哈希 0 不会被用到"""
+        digest = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+        group = digest % ((self.slots - 1) // PROBE)
+        return digest, group * PROBE + 1, group % LOCK_STRIPES
+
+    @contextmanager
+    def _locked(self, stripe):
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+
+    def update(self, key, fn):
+        """在锁内执行 fn(value, updated_at, day, found, now)，它返回 (新值, 新日期, 结果)；写回后返回结果"""
+        buffer = self._open()
+        digest, base, stripe = self._locate(key)
+        now = time.time()
+        with self._locked(stripe):
+            slots = [SLOT.unpack_from(buffer, index * SLOT.size) for index in range(base, base + PROBE)]
+            for index, (slot_key, value, updated_at, day) in enumerate(slots, base):
+                if slot_key == digest:
+                    value, day, result = fn(value, updated_at, day, True, now)
+                    break
+            else:
+                current = today()[0]
+                victims = [(updated_at, index) for index, (_, _, updated_at, day) in enumerate(slots, base)
+                           if day != current]
+                value, day, result = fn(0.0, 0.0, 0.0, False, now)
+                if not victims:
+                    return result
+                _, index = min(victims)
+            SLOT.pack_into(buffer, index * SLOT.size, digest, value, now, day)
+        return result
+
+    def read(self, key):
+        """返回 (value, day)，不存在时返回 None；只读，不占用槽位"""
+        buffer = self._open()
+        digest, base, stripe = self._locate(key)
+        with self._locked(stripe):
+            for index in range(base, base + PROBE):
+                slot_key, value, _, day = SLOT.unpack_from(buffer, index * SLOT.size)
+                if slot_key == digest:
+                    return value, day
+        return None
+
+    def version(self):
+        return SLOT.unpack_from(self._open(), 0)[1]
+
+    def bump_version(self):
+        buffer = self._open()
+        with self._locked(LOCK_STRIPES):
+            _, value, _, _ = SLOT.unpack_from(buffer, 0)
+            SLOT.pack_into(buffer, 0, 0, value + 1, time.time(), 0)
+
+
+def today():
+    """(当天的日期序号, 距离次日零点的秒数)，按服务器本地时间划分"""
+    now = datetime.now()
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return now.date().toordinal(), (tomorrow - now).total_seconds()
+
+
+class RateLimiter:
+    """按用户限流和限制每天生成的 token 数
+
+    - 令牌桶：每个用户在每组接口（RATE_LIMITS）上一个桶，请求取走一个令牌，
+      桶空时返回需要等待的秒数
+    - 额度：每个用户在每个模型上每天可生成的 token 数。规则保存在
+      token_quotas 表中，用户名和模型都可以是 *；按 (用户, 模型)、(用户, *)、
+      (*, 模型)、(*, *) 的顺序取第一条，都没有时为 TOKEN_QUOTA_DAILY。补全
+      开始前检查当天已用量，结束后累加实际生成的 token 数，所以最后一次请求
+      可以略微超出额度
+
+    计数都在 SharedCounters 中，所有 worker 和网关共享，每次检查只读写一两个
+    槽位。额度规则在每个进程中缓存，管理员修改后递增共享的版本号，各进程
+    下一次检查时重新加载。
+    """
+
+    def __init__(self, limits=RATE_LIMITS, default_quota=TOKEN_QUOTA_DAILY):
+        self.limits = parse_limits(limits)
+        self.default_quota = default_quota
+        self.counters = SharedCounters()
+        self._lock = threading.Lock()
+        self._rules = None
+        self._rules_version = None
+
+    def take(self, group, username):
+        """从用户在该组的桶中取一个令牌，返回需要等待的秒数，0 表示允许"""
+        limit = self.limits.get(group)
+        if limit is None:
+            return 0
+        burst, seconds = limit
+        rate = burst / seconds
+
+        def take_token(tokens, updated_at, day, found, now):
+            tokens = min(burst, tokens + (now - updated_at) * rate) if found else burst
+            if tokens >= 1:
+                return tokens - 1, day, 0
+            return tokens, day, (1 - tokens) / rate
+
+        return self.counters.update(f'bucket:{group}:{username}', take_token)
+
+    def quota(self, cursor, username, model):
+        """用户在该模型上每天的 token 额度，0 表示不限"""
+        rules = self.rules(cursor)
+        for key in ((username, model), (username, WILDCARD), (WILDCARD, model), (WILDCARD, WILDCARD)):
+            if key in rules:
+                return rules[key]
+        return self.default_quota
+
+    def used(self, username, model):
+        day, _ = today()
+        entry = self.counters.read(f'quota:{model}:{username}')
+        return int(entry[0]) if entry and entry[1] == day else 0
+
+    def check_quota(self, cursor, username, model):
+        """额度已用完时抛出 QuotaExceeded，retry_after 为距离次日零点的秒数"""
+        limit = self.quota(cursor, username, model)
+        if limit and self.used(username, model) >= limit:
+            raise QuotaExceeded(today()[1])
+
+    def consume(self, username, model, tokens):
+        """补全结束后累加当天生成的 token 数"""
+        if not tokens:
+            return
+        day, _ = today()
+
+        def add(used, updated_at, stored_day, found, now):
+            used = used if found and stored_day == day else 0
+            return used + tokens, day, None
+
+        self.counters.update(f'quota:{model}:{username}', add)
+
+    def rules(self, cursor):
+        version = self.counters.version()
+        if self._rules is None or self._rules_version != version:
+            cursor.execute('SELECT username, model, daily_tokens FROM token_quotas')
+            rules = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+            with self._lock:
+                self._rules = rules
+                self._rules_version = version
+        return self._rules
+
+    def set_rule(self, cursor, username, model, daily_tokens):
+        """daily_tokens 为 None 时删除规则；提交后调用 rules_changed"""
+        if daily_tokens is None:
+            cursor.execute('DELETE FROM token_quotas WHERE username = ? AND model = ?', (username, model))
+        else:
+            cursor.execute('''
+                INSERT INTO token_quotas (username, model, daily_tokens) VALUES (?, ?, ?)
+                ON CONFLICT (username, model) DO UPDATE SET daily_tokens = excluded.daily_tokens
+            ''', (username, model, daily_tokens))
+
+    def rules_changed(self):
+        self.counters.bump_version()
+
+    def usage(self, cursor, username, models):
+        """用户今天在各模型上的用量和额度"""
+        result = {}
+        for model in models:
+            limit = self.quota(cursor, username, model)
+            used = self.used(username, model)
+            result[model] = {'used': used, 'limit': limit, 'remaining': max(0, limit - used) if limit else None}
+        return result
+
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+
+def too_many_requests(message, retry_after):
+    response = jsonify({'error': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = retry_after_header(retry_after)
+    return response
+
+
+def rate_limited(group):
+    """按当前用户在 group 上的令牌桶限流，放在 jwt_required 之后"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            retry_after = rate_limiter.take(group, get_jwt_identity())
+            if retry_after:
+                return too_many_requests('请求过于频繁，请稍后再试', retry_after)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+rate_limiter = RateLimiter()
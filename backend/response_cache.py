@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from completions import SAMPLING_PARAMS, sse_event
+from model_registry import model_registry
+from write_queue import write_queue
+
+# 确定性补全的回复缓存配置
+RESPONSE_CACHE = os.getenv('RESPONSE_CACHE', 'off')                                   # off / memory / sqlite，sqlite 时多个 worker 共享且重启后保留
+RESPONSE_CACHE_ENTRIES = int(os.getenv('RESPONSE_CACHE_ENTRIES', '2000'))             # 最多缓存的回复数（内存和数据库各自限制）
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(32 << 20)))  # 每个进程内存中缓存的回复总字节数上限
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '86400'))                  # 回复的有效期（秒）
+RESPONSE_CACHE_CHUNK = int(os.getenv('RESPONSE_CACHE_CHUNK', '16'))                   # 回放时每个数据块的字符数
+
+
+def deterministic(options):
+    """temperature 为 0 或 top_k 为 1 时为贪心解码，相同输入得到相同输出"""
+    temperature = options.get('temperature')
+    top_k = options.get('top_k')
+    return ((isinstance(temperature, (int, float)) and not isinstance(temperature, bool) and temperature == 0)
+            or (isinstance(top_k, int) and not isinstance(top_k, bool) and top_k == 1))
+
+
+class CacheKey:
+    __slots__ = ('key', 'model', 'generation')
+
+    def __init__(self, key, model, generation):
+        self.key = key
+        self.model = model
+        self.generation = generation  # 计算键时模型的部署标识，存入时沿用，避免把重启前生成的回复记到新部署下
+
+
+class CachedResponse:
+    __slots__ = ('model', 'generation', 'content', 'tokens', 'created_at', 'size')
+
+    def __init__(self, model, generation, content, tokens, created_at):
+        self.model = model
+        self.generation = generation
+        self.content = content
+        self.tokens = tokens
+        self.created_at = created_at
+        self.size = len(content.encode('utf-8'))
+
+
+class ResponseCache:
+    """确定性补全的精确匹配缓存
+
+    只缓存贪心解码（见 deterministic）的请求。键为模型、实际发送给上游的消息
+    （统一换行并去掉首尾空白）和全部采样参数的 SHA-256，只有正常结束
+    （finish_reason 为 stop）的回复才存入。命中时不占用模型 slot，按
+    llama-server 的流式格式回放，客户端的处理流程不变。
+
+    每个进程在内存中按 LRU 保存，条目数和总字节数有上限，超过
+    RESPONSE_CACHE_TTL 的条目在读取时丢弃。RESPONSE_CACHE=sqlite 时同时写入
+    response_cache 表，内存未命中时再查表，表中按写入时间淘汰。每个条目记录
+    生成时模型的部署标识（副本的作业号），model_rotator 重启或轮换模型后标识
+    改变，旧的回复不再命中并被清除。
+    """
+
+    def __init__(self, mode=RESPONSE_CACHE):
+        if mode not in ('off', 'memory', 'sqlite'):
+            raise ValueError(f'unknown RESPONSE_CACHE: {mode}')
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> CachedResponse，最近使用的在末尾
+        self._bytes = 0
+        self._generations = {}         # 模型 -> 最近看到的部署标识
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'saved_tokens': 0}
+
+    def prepare(self, model_name, messages, options):
+        """可以缓存的请求返回 CacheKey，否则返回 None"""
+        if self.mode == 'off' or not deterministic(options):
+            return None
+        generation = model_registry.generation(model_name)
+        normalized = [[msg['role'], msg['content'].replace('\r\n', '\n').strip()] for msg in messages]
+        params = {name: options[name] for name in SAMPLING_PARAMS if name in options}
+        raw = json.dumps([model_name, normalized, params], ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return CacheKey(hashlib.sha256(raw.encode('utf-8')).hexdigest(), model_name, generation)
+
+    def lookup(self, cursor, cache_key):
+        """返回 CachedResponse，未命中时返回 None；sqlite 模式下内存未命中时用 cursor 查表"""
+        now = time.time()
+        with self._lock:
+            if self._generations.get(cache_key.model) != cache_key.generation:
+                self._invalidate(cache_key.model, cache_key.generation)
+            entry = self._entries.get(cache_key.key)
+            if entry is not None:
+                if self._usable(entry, cache_key, now):
+                    self._entries.move_to_end(cache_key.key)
+                else:
+                    self._remove(cache_key.key, 'ttl')
+                    entry = None
+        if entry is None and self.mode == 'sqlite':
+            cursor.execute('SELECT generation, content, tokens, created_at FROM response_cache WHERE key = ?',
+                           (cache_key.key,))
+            row = cursor.fetchone()
+            if row is not None:
+                entry = CachedResponse(cache_key.model, row[0], row[1], row[2], row[3])
+                if self._usable(entry, cache_key, now):
+                    with self._lock:
+                        self._insert(cache_key.key, entry)
+                else:
+                    entry = None
+
+        with self._lock:
+            if entry is None:
+                self._stats['misses'] += 1
+            else:
+                self._stats['hits'] += 1
+                self._stats['saved_tokens'] += entry.tokens
+        if entry is None:
+            metrics.store.observe_response_cache('miss')
+        else:
+            metrics.store.observe_response_cache('hit')
+            metrics.store.observe_response_cache('saved_tokens', entry.tokens)
+        return entry
+
+    def store(self, cache_key, parser):
+        """补全结束后调用，只存入正常结束的回复"""
+        content, ttft, tokens, _ = parser.result()
+        if parser.finish_reason != 'stop' or ttft is None or not content:
+            return
+        entry = CachedResponse(cache_key.model, cache_key.generation, content, tokens, time.time())
+        if entry.size > RESPONSE_CACHE_MAX_BYTES:
+            return
+        with self._lock:
+            # 生成期间模型被重启，这个回复不属于当前部署
+            if self._generations.get(cache_key.model, cache_key.generation) != cache_key.generation:
+                return
+            self._insert(cache_key.key, entry)
+            self._stats['stores'] += 1
+        metrics.store.observe_response_cache('store')
+        if self.mode == 'sqlite':
+            try:
+                write_queue.run(self._save, cache_key.key, entry)
+            except Exception as e:
+                print(f"Error saving response cache: {str(e)}")
+
+    def _save(self, cursor, key, entry):
+        cursor.execute('''
+            INSERT OR REPLACE INTO response_cache (key, model, generation, content, tokens, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (key, entry.model, entry.generation, entry.content, entry.tokens, entry.created_at))
+        cursor.execute('DELETE FROM response_cache WHERE model = ? AND generation != ?',
+                       (entry.model, entry.generation))
+        cursor.execute('DELETE FROM response_cache WHERE created_at < ?', (entry.created_at - RESPONSE_CACHE_TTL,))
+        # 在 created_at 索引上跳过最新的 RESPONSE_CACHE_ENTRIES 条，删除更早的
+        cursor.execute('''
+            DELETE FROM response_cache WHERE created_at < (
+                SELECT created_at FROM response_cache ORDER BY created_at DESC LIMIT 1 OFFSET ?
+            )
+        ''', (RESPONSE_CACHE_ENTRIES - 1,))
+
+    def _usable(self, entry, cache_key, now):
+        return entry.generation == cache_key.generation and now - entry.created_at < RESPONSE_CACHE_TTL
+
+    def _insert(self, key, entry):
+        if key in self._entries:
+            self._remove(key, None)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while len(self._entries) > RESPONSE_CACHE_ENTRIES or self._bytes > RESPONSE_CACHE_MAX_BYTES:
+            self._remove(next(iter(self._entries)), 'lru')
+
+    def _remove(self, key, reason):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        if reason is not None:
+            self._stats['evictions'] += 1
+            metrics.store.observe_response_cache(reason)
+
+    def _invalidate(self, model, generation):
+        """模型的部署标识变化时清除该模型在内存中的所有条目，表中的在下一次写入时清除"""
+        for key in [key for key, entry in self._entries.items() if entry.model == model]:
+            self._remove(key, 'invalidated')
+        self._generations[model] = generation
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(self._stats,
+                        mode=self.mode,
+                        entries=len(self._entries),
+                        bytes=self._bytes,
+                        hit_rate=self._stats['hits'] / lookups if lookups else 0.0)
+
+
+def replay(model_name, content):
+    """按 llama-server 的流式格式逐块输出缓存的回复，最后一块带 "cached": true"""
+    for i in range(0, len(content), RESPONSE_CACHE_CHUNK):
+        yield sse_event({
+            'object': 'chat.completion.chunk',
+            'model': model_name,
+            'choices': [{'index': 0, 'delta': {'content': content[i:i + RESPONSE_CACHE_CHUNK]}, 'finish_reason': None}]
+        })
+    yield sse_event({
+        'object': 'chat.completion.chunk',
+        'model': model_name,
+        'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+        'cached': True
+    })
+    yield b'data: [DONE]\n\n'
+
+
+response_cache = ResponseCache()
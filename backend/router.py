@@ -0,0 +1,311 @@
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import requests
+
+from completions import upstream_pool, UpstreamError
+
+# 副本路由配置
+ROUTER_POLL_INTERVAL = float(os.getenv('ROUTER_POLL_INTERVAL', '2'))           # 轮询 /health 和 /slots 的间隔（秒）
+ROUTER_POLL_TIMEOUT = float(os.getenv('ROUTER_POLL_TIMEOUT', '1'))             # 单次轮询超时（秒）
+ROUTER_EJECT_SECONDS = float(os.getenv('ROUTER_EJECT_SECONDS', '5'))           # 请求失败后摘除副本的时长，连续失败时翻倍
+ROUTER_MAX_EJECT_SECONDS = float(os.getenv('ROUTER_MAX_EJECT_SECONDS', '60'))
+ROUTER_MAX_ATTEMPTS = int(os.getenv('ROUTER_MAX_ATTEMPTS', '3'))               # 一个请求最多尝试的副本数
+ROUTER_DEFAULT_SLOTS = int(os.getenv('ROUTER_DEFAULT_SLOTS', '4'))             # 与 llama-server -np 4 一致，/slots 不可用时使用
+ROUTER_IDLE_EXPIRE = float(os.getenv('ROUTER_IDLE_EXPIRE', '600'))             # 超过这么久没有请求的副本不再轮询
+ROUTER_SESSION_AFFINITY = os.getenv('ROUTER_SESSION_AFFINITY', '1') == '1'      # 同一会话尽量发往同一副本和 slot，复用 KV 缓存
+ROUTER_AFFINITY_SIZE = int(os.getenv('ROUTER_AFFINITY_SIZE', '10000'))          # 记住的会话 slot 分配数
+
+
+def _hash(*parts):
+    return int.from_bytes(hashlib.blake2b('\0'.join(map(str, parts)).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class Replica:
+    """一个 llama-server 实例的负载状态"""
+
+    def __init__(self, url):
+        self.url = url
+        self.inflight = 0           # 本进程发往该副本、尚未结束的请求数
+        self.slots = ROUTER_DEFAULT_SLOTS
+        self.busy_others = 0        # 最近一次轮询时被其他进程占用的 slot 数
+        self.busy_slots = set()     # 最近一次轮询时被其他请求占用的 slot id
+        self.pinned = Counter()     # 本进程在途请求指定的 slot id
+        self.assigned = Counter()   # 分配到各 slot 的会话数
+        self.healthy = True
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.last_used = time.monotonic()
+
+    def load(self):
+        return (self.inflight + self.busy_others) / max(self.slots, 1)
+
+    def available(self, now):
+        return self.healthy and self.ejected_until <= now
+
+
+class Lease:
+    """一次请求选中的副本，以及会话固定使用的 slot"""
+
+    def __init__(self, replica, slot=None, sticky=False):
+        self.replica = replica
+        self.slot = slot
+        self.sticky = sticky
+
+    @property
+    def url(self):
+        return self.replica.url
+
+    def apply(self, payload):
+        """返回带上 cache_prompt 和 id_slot 的请求体"""
+        payload = dict(payload, cache_prompt=True)
+        if self.slot is not None:
+            payload['id_slot'] = self.slot
+        return payload
+
+
+class UpstreamRouter:
+    """在同一模型的多个副本之间选择负载最低的一个
+
+    负载 = 本进程在途请求数 + 其他进程占用的 slot 数（来自 /slots），再除以
+    slot 总数。后台线程定期轮询 /health 和 /slots，不健康的副本不参与选择；
+    请求失败的副本立即摘除，到期后重新尝试，连续失败时摘除时间翻倍。
+
+    带会话 id 的请求按最高随机权重（rendezvous）哈希选出会话的“归属”副本，
+    只要该副本存活且有空闲 slot 就发往那里，llama-server 可以复用上一轮留在
+    slot 中的前缀缓存。副本的选择只依赖会话 id 和存活副本列表，所有 worker
+    得到同一结果；副本下线后会话自然落到下一个副本。会话在副本内固定使用的
+    slot 由本进程分配（选分配会话最少的 slot），其他 worker 处理同一会话时
+    不指定 slot，由 llama-server 按前缀相似度选择。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._replicas = {}  # url -> Replica
+        self._poller = None
+        self._pid = None
+        self._stats = Counter()
+        self._sessions = OrderedDict()  # session_key -> (url, slot)
+
+    def _replica(self, url):
+        replica = self._replicas.get(url)
+        if replica is None:
+            replica = self._replicas[url] = Replica(url)
+        return replica
+
+    def candidates(self, urls, session_key=None):
+        """返回依次尝试的 Lease 列表
+
+        没有会话 id 时按负载从低到高排列；有会话 id 且归属副本有空闲 slot 时
+        归属副本排在最前。被摘除的副本排在最后作为兜底。
+        """
+        self.ensure_poller()
+        now = time.monotonic()
+        with self._lock:
+            replicas = [self._replica(url) for url in urls]
+            for replica in replicas:
+                replica.last_used = now
+            live = [r for r in replicas if r.available(now)]
+            # 负载相同时随机选择，避免各个 worker 同时挤向同一个副本
+            random.shuffle(live)
+            live.sort(key=Replica.load)
+            dead = sorted((r for r in replicas if not r.available(now)), key=lambda r: r.ejected_until)
+            leases = [Lease(r) for r in live + dead]
+
+            if session_key is not None and ROUTER_SESSION_AFFINITY and live:
+                home = max(live, key=lambda r: _hash(session_key, r.url))
+                if home.load() < 1:
+                    slot = self._session_slot(session_key, home)
+                    # 固定的 slot 正忙时不指定 slot，避免排队等它，由 llama-server 按前缀相似度选择
+                    if slot in home.busy_slots or home.pinned[slot]:
+                        slot = None
+                    leases = [Lease(home, slot, sticky=True)] + [lease for lease in leases if lease.replica is not home]
+                    self._stats['sticky'] += 1
+                    self._stats['slot_pinned'] += slot is not None
+                else:
+                    self._stats['fallback'] += 1
+        return leases[:ROUTER_MAX_ATTEMPTS]
+
+    def capacity(self, urls):
+        """本进程还能占用的 slot 数：存活副本的 slot 总数减去其他进程占用的
+
+        没有存活副本时返回 None，由 open_stream 按摘除时间兜底尝试。
+        """
+        self.ensure_poller()
+        now = time.monotonic()
+        with self._lock:
+            replicas = [self._replica(url) for url in urls]
+            for replica in replicas:
+                replica.last_used = now
+            live = [r for r in replicas if r.available(now)]
+            if not live:
+                return None
+            return sum(max(0, r.slots - r.busy_others) for r in live)
+
+    def _session_slot(self, session_key, replica):
+        """返回会话在副本中固定使用的 slot，归属副本变化时重新分配"""
+        entry = self._sessions.get(session_key)
+        if entry is not None:
+            url, slot = entry
+            if url == replica.url and slot < replica.slots:
+                self._sessions.move_to_end(session_key)
+                return slot
+            self._forget(session_key)
+        slot = min(range(replica.slots), key=lambda i: replica.assigned[i])
+        replica.assigned[slot] += 1
+        self._sessions[session_key] = (replica.url, slot)
+        while len(self._sessions) > ROUTER_AFFINITY_SIZE:
+            self._forget(next(iter(self._sessions)))
+        return slot
+
+    def _forget(self, session_key):
+        url, slot = self._sessions.pop(session_key)
+        replica = self._replicas.get(url)
+        if replica is not None and replica.assigned[slot] > 0:
+            replica.assigned[slot] -= 1
+
+    def begin(self, lease):
+        with self._lock:
+            lease.replica.inflight += 1
+            if lease.slot is not None:
+                lease.replica.pinned[lease.slot] += 1
+
+    def end(self, lease, prompt_tokens=None, cached_tokens=None):
+        """请求结束，记录本次预填充节省的 token 数"""
+        with self._lock:
+            self._release(lease)
+            self._stats['completed'] += 1
+            if prompt_tokens is not None and cached_tokens is not None:
+                self._stats['prompt_tokens'] += prompt_tokens
+                self._stats['cached_tokens'] += cached_tokens
+                if lease.sticky:
+                    self._stats['sticky_cached_tokens'] += cached_tokens
+
+    def failed(self, lease):
+        """请求未能建立：结束在途计数并摘除副本"""
+        replica = lease.replica
+        with self._lock:
+            self._release(lease)
+            replica.failures += 1
+            eject = min(ROUTER_EJECT_SECONDS * 2 ** (replica.failures - 1), ROUTER_MAX_EJECT_SECONDS)
+            replica.ejected_until = time.monotonic() + eject
+        print(f"副本 {replica.url} 请求失败，摘除 {eject:.0f} 秒")
+
+    def succeeded(self, lease):
+        with self._lock:
+            lease.replica.failures = 0
+
+    def _release(self, lease):
+        lease.replica.inflight -= 1
+        if lease.slot is not None:
+            lease.replica.pinned[lease.slot] -= 1
+            if not lease.replica.pinned[lease.slot]:
+                del lease.replica.pinned[lease.slot]
+
+    def open_stream(self, urls, payload, session_key=None):
+        """依次尝试各副本，返回 (lease, resp)，调用方在流结束后调用 end(lease)"""
+        error = UpstreamError('no upstream available')
+        for lease in self.candidates(urls, session_key):
+            self.begin(lease)
+            try:
+                resp = upstream_pool.open_stream(lease.url, lease.apply(payload))
+            except UpstreamError as e:
+                # 4xx 是请求本身的问题，换副本也没有用
+                if e.status is not None and e.status < 500:
+                    self.end(lease)
+                    raise
+                self.failed(lease)
+                error = e
+                continue
+            self.succeeded(lease)
+            return lease, resp
+        raise error
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                url: {
+                    'inflight': r.inflight,
+                    'slots': r.slots,
+                    'busy_others': r.busy_others,
+                    'healthy': r.healthy,
+                    'ejected': r.ejected_until > now
+                }
+                for url, r in self._replicas.items()
+            }
+
+    def affinity_stats(self):
+        """会话亲和的命中情况和节省的预填充 token 数（本进程累计）"""
+        with self._lock:
+            stats = dict(self._stats)
+        prompt_tokens = stats.get('prompt_tokens', 0)
+        return {
+            'completed': stats.get('completed', 0),
+            'sticky': stats.get('sticky', 0),
+            'slot_pinned': stats.get('slot_pinned', 0),
+            'fallback': stats.get('fallback', 0),
+            'prompt_tokens': prompt_tokens,
+            'prefill_tokens_saved': stats.get('cached_tokens', 0),
+            'prefill_saved_ratio': stats.get('cached_tokens', 0) / prompt_tokens if prompt_tokens else 0.0
+        }
+
+    def ensure_poller(self):
+        if self._poller is None or self._pid != os.getpid() or not self._poller.is_alive():
+            with self._lock:
+                if self._poller is None or self._pid != os.getpid() or not self._poller.is_alive():
+                    self._poller = threading.Thread(target=self._poll_loop, name='upstream-router', daemon=True)
+                    self._pid = os.getpid()
+                    self._poller.start()
+
+    def _poll_loop(self):
+        session = requests.Session()
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                for url in [u for u, r in self._replicas.items() if now - r.last_used > ROUTER_IDLE_EXPIRE]:
+                    del self._replicas[url]
+                replicas = list(self._replicas.values())
+            for replica in replicas:
+                try:
+                    self.poll(session, replica)
+                except Exception as e:
+                    print(f"Error polling {replica.url}: {str(e)}")
+            time.sleep(ROUTER_POLL_INTERVAL)
+
+    def poll(self, session, replica):
+        try:
+            # 模型加载中时 llama-server 的 /health 返回 503
+            healthy = session.get(f'{replica.url}/health', timeout=ROUTER_POLL_TIMEOUT).status_code == 200
+        except requests.RequestException:
+            healthy = False
+
+        slots = busy = None
+        busy_slots = set()
+        if healthy:
+            try:
+                resp = session.get(f'{replica.url}/slots', timeout=ROUTER_POLL_TIMEOUT)
+                if resp.status_code == 200:
+                    data = resp.json()
+                    slots = len(data)
+                    # 新版本返回 is_processing，旧版本返回 state（0 为空闲）
+                    busy_slots = {s.get('id', i) for i, s in enumerate(data)
+                                  if s.get('is_processing', s.get('state', 0) != 0)}
+                    busy = len(busy_slots)
+            except (requests.RequestException, ValueError):
+                pass
+
+        with self._lock:
+            replica.healthy = healthy
+            if slots:
+                replica.slots = slots
+                replica.busy_others = max(0, busy - replica.inflight)
+                # 本进程指定的 slot 由 pinned 实时跟踪，这里只保留其他请求占用的
+                replica.busy_slots = busy_slots - set(replica.pinned)
+
+
+upstream_router = UpstreamRouter()
@@ -13,19 +13,53 @@ CREATE TABLE IF NOT EXISTS chat_history (
     user TEXT NOT NULL,
     ai TEXT NOT NULL,
     model TEXT NOT NULL,
-    timestamp TEXT NOT NULL,
+    timestamp REAL NOT NULL,  -- Unix 时间（秒）
     FOREIGN KEY (username) REFERENCES users(username)
 );
 
+CREATE INDEX IF NOT EXISTS idx_chat_history_username_timestamp ON chat_history (username, timestamp);
+
 CREATE TABLE IF NOT EXISTS chat_sessions (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     username TEXT NOT NULL,
     title TEXT NOT NULL,
     messages TEXT NOT NULL,
     createdAt TEXT NOT NULL,
+    updatedAt TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    context_start INTEGER NOT NULL DEFAULT 0,  -- 上一次发送给模型的窗口起点（消息序号），见 context_window.py
     FOREIGN KEY (username) REFERENCES users(username)
 );
 
+-- 会话列表按 (username, createdAt) 做游标分页
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_username_created ON chat_sessions (username, createdAt);
+
+-- 会话消息按条存储，保存时只写入新增或变化的消息
+CREATE TABLE IF NOT EXISTS session_messages (
+    session_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    message_json TEXT NOT NULL,  -- 写入时生成的 {"role", "content"} JSON，读取会话时直接拼接进响应
+    tokens INTEGER,              -- 写入时估算的 token 数，为空时在下一次补全时补上
+    PRIMARY KEY (session_id, seq),
+    FOREIGN KEY (session_id) REFERENCES chat_sessions(id)
+);
+
+-- 冷会话归档：长期未修改的会话，消息拼成 JSON 数组压缩后存为一行，session_messages 中不再保留，见 archive.py
+CREATE TABLE IF NOT EXISTS session_archive (
+    session_id INTEGER PRIMARY KEY,
+    codec TEXT NOT NULL,           -- zstd 或 zlib
+    data BLOB NOT NULL,
+    raw_size INTEGER NOT NULL,     -- 压缩前的字节数
+    archived_at INTEGER NOT NULL,  -- 归档时间（Unix 时间，秒）
+    FOREIGN KEY (session_id) REFERENCES chat_sessions(id)
+);
+
+-- 全文搜索索引：会话标题、会话消息和聊天历史，只保存倒排索引，由 search.py 增量维护
+-- 每个词带有用户前缀，查询只读取自己的倒排列表；分词和 rowid 的编码见 search.py
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(text, content='', tokenize='unicode61');
+
 CREATE TABLE IF NOT EXISTS announcements (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     content TEXT NOT NULL,
@@ -35,20 +69,60 @@ CREATE TABLE IF NOT EXISTS announcements (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
-CREATE TABLE IF NOT EXISTS model_stats (
-    model_name TEXT PRIMARY KEY,
-    current_users INTEGER DEFAULT 0,
-    total_chats INTEGER DEFAULT 0,
-    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+-- 每个用户聊天数据（会话和聊天记录）的版本号，用于列表接口的 ETag / Last-Modified
+CREATE TABLE IF NOT EXISTS user_data_versions (
+    username TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL  -- 最后修改时间（Unix 时间，秒）
+) WITHOUT ROWID;
+
+-- 确定性补全（temperature 为 0）的回复缓存，RESPONSE_CACHE=sqlite 时使用，见 response_cache.py
+CREATE TABLE IF NOT EXISTS response_cache (
+    key TEXT PRIMARY KEY,       -- 模型、消息和采样参数的 SHA-256
+    model TEXT NOT NULL,
+    generation TEXT NOT NULL,   -- 生成时模型的部署标识（副本的作业号），模型重启后不再命中
+    content TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL    -- 写入时间（Unix 时间，秒）
+) WITHOUT ROWID;
+
+-- 写入回复时按部署标识清除旧回复、按写入时间淘汰（索引中带有主键 key，删除时不需要回表）
+CREATE INDEX IF NOT EXISTS idx_response_cache_model_generation ON response_cache (model, generation);
+CREATE INDEX IF NOT EXISTS idx_response_cache_created ON response_cache (created_at);
+
+-- 每个用户在每个模型上每天可生成的 token 数，username / model 为 * 时匹配所有，见 rate_limits.py
+CREATE TABLE IF NOT EXISTS token_quotas (
+    username TEXT NOT NULL,
+    model TEXT NOT NULL,
+    daily_tokens INTEGER NOT NULL,  -- 0 表示不限
+    PRIMARY KEY (username, model)
+) WITHOUT ROWID;
+
+-- 模型使用统计按时间桶汇总（bucket 为桶开始的 Unix 时间），由 usage_stats.py 批量累加写入
+CREATE TABLE IF NOT EXISTS model_usage (
+    bucket INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    chats INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    ttft_count INTEGER NOT NULL DEFAULT 0,        -- 收到首 token 的对话数
+    ttft_total REAL NOT NULL DEFAULT 0,           -- 首 token 延迟之和（秒）
+    generation_seconds REAL NOT NULL DEFAULT 0,   -- 首 token 之后的生成耗时之和（秒）
+    ttft_max REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, model)
+) WITHOUT ROWID;
+
+-- 每个时间桶内使用过各模型的用户，查询时去重统计活跃用户数
+CREATE TABLE IF NOT EXISTS model_usage_users (
+    bucket INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    username TEXT NOT NULL,
+    PRIMARY KEY (bucket, model, username)
+) WITHOUT ROWID;
 
 CREATE TABLE IF NOT EXISTS user_agreement (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     content TEXT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
-
-INSERT OR IGNORE INTO model_stats (model_name) VALUES 
-    ('gpt-3.5'),
-    ('gpt-4'),
-    ('claude'); 
\ No newline at end of file
+ 
\ No newline at end of file
@@ -0,0 +1,265 @@
+import hashlib
+import os
+import re
+import sys
+
+from archive import session_archive
+
+# 全文搜索配置
+SEARCH_SNIPPET_CHARS = int(os.getenv('SEARCH_SNIPPET_CHARS', '40'))  # 片段中第一个匹配位置前后各保留的字符数
+
+# search_index 的 rowid 编码：会话标题为 session_id << 20，会话消息为 (session_id << 20) + seq + 1，
+# chat_history 为 -id。删除会话时按 rowid 区间定位，不需要额外的映射表
+SEQ_BITS = 20
+MAX_INDEXED_SEQ = (1 << SEQ_BITS) - 2
+
+# 汉字没有空格分词，unicode61 会把连续的汉字当成一个词。建索引时把连续汉字拆成
+# 重叠的二元组，并在末尾补一个单字，这样任意位置的单字都是某个词的前缀
+CJK_RUN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+TOKEN = re.compile(r'[^\W_]+')  # 与 unicode61 的分词规则一致：字母和数字
+
+
+def segment(text, query=False):
+    """按 unicode61 分词前的预处理；query=True 时不补末尾单字，二元组序列作为短语匹配"""
+    def split_run(match):
+        run = match.group()
+        if len(run) == 1:
+            return f' {run} '
+        tokens = [run[i:i + 2] for i in range(len(run) - 1)]
+        if not query:
+            tokens.append(run[-1])
+        return ' ' + ' '.join(tokens) + ' '
+    return CJK_RUN.sub(split_run, text)
+
+
+def owner_prefix(username):
+    """用户名对应的词前缀，不受用户名中标点的影响"""
+    return 'u' + hashlib.blake2b(username.encode('utf-8'), digest_size=6).hexdigest()
+
+
+def tokenize(username, text, query=False):
+    """返回写入索引（或用于短语查询）的词列表
+
+    每个词前面加上用户前缀，不同用户的同一个词在索引里是不同的词，查询只读取
+    该用户自己的倒排列表，耗时与总数据量无关。前缀哈希碰撞时搜索结果还会按
+    原表的 username 核对。
+    """
+    prefix = owner_prefix(username)
+    return [prefix + token for token in TOKEN.findall(segment(text, query).lower())]
+
+
+def session_rowid(session_id, seq=None):
+    return (session_id << SEQ_BITS) + (0 if seq is None else seq + 1)
+
+
+def history_rowid(history_id):
+    return -history_id
+
+
+def decode_rowid(rowid):
+    """返回 ('history', id, None)、('title', session_id, None) 或 ('message', session_id, seq)"""
+    if rowid < 0:
+        return 'history', -rowid, None
+    session_id, seq = rowid >> SEQ_BITS, (rowid & ((1 << SEQ_BITS) - 1)) - 1
+    return ('title', session_id, None) if seq < 0 else ('message', session_id, seq)
+
+
+def history_text(user, ai):
+    return f'{user}\n{ai}'
+
+
+class SearchIndex:
+    """search_index 的增量维护和查询
+
+    search_index 是无内容（content=''）的 FTS5 表，只保存倒排索引，不重复
+    保存消息正文；片段从原表读取后生成。无内容表删除时必须提供原来写入的
+    文本，所以各个写路径先读出旧内容，只对内容变化的行删除再写入。所有操作
+    使用调用方的 cursor，与原表的修改在同一个事务中提交。
+    """
+
+    def add(self, cursor, rowid, username, text):
+        cursor.execute('INSERT INTO search_index (rowid, text) VALUES (?, ?)',
+                       (rowid, ' '.join(tokenize(username, text))))
+
+    def remove(self, cursor, rowid, username, text):
+        cursor.execute('''
+            INSERT INTO search_index (search_index, rowid, text) VALUES ('delete', ?, ?)
+        ''', (rowid, ' '.join(tokenize(username, text))))
+
+    def replace_messages(self, cursor, username, session_id, old, messages, start):
+        """old 为 seq -> 原内容（start 之后的全部旧消息），messages 从 start 开始覆盖"""
+        old = dict(old)
+        for i, msg in enumerate(messages):
+            seq = start + i
+            previous = old.pop(seq, None)
+            if previous == msg['content'] or seq > MAX_INDEXED_SEQ:
+                continue
+            if previous is not None:
+                self.remove(cursor, session_rowid(session_id, seq), username, previous)
+            self.add(cursor, session_rowid(session_id, seq), username, msg['content'])
+        for seq, previous in old.items():
+            if seq <= MAX_INDEXED_SEQ:
+                self.remove(cursor, session_rowid(session_id, seq), username, previous)
+
+    def replace_title(self, cursor, username, session_id, old_title, title):
+        if old_title == title:
+            return
+        if old_title is not None:
+            self.remove(cursor, session_rowid(session_id), username, old_title)
+        self.add(cursor, session_rowid(session_id), username, title)
+
+    def remove_session(self, cursor, username, session_id, title):
+        cursor.execute('SELECT seq, content FROM session_messages WHERE session_id = ?', (session_id,))
+        self.replace_messages(cursor, username, session_id, cursor.fetchall(), [], 0)
+        self.remove(cursor, session_rowid(session_id), username, title)
+
+    def add_history(self, cursor, username, history_id, user, ai):
+        self.add(cursor, history_rowid(history_id), username, history_text(user, ai))
+
+    def rebuild(self, conn):
+        """按原表重建整个索引（已有数据库首次启用搜索时使用），由调用方提交"""
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO search_index (search_index) VALUES ('delete-all')")
+        rows = conn.execute('SELECT id, username, title FROM chat_sessions')
+        for session_id, username, title in rows:
+            self.add(cursor, session_rowid(session_id), username, title)
+        rows = conn.execute('''
+            SELECT m.session_id, m.seq, m.content, s.username
+            FROM session_messages m JOIN chat_sessions s ON s.id = m.session_id
+            WHERE m.seq <= ?
+        ''', (MAX_INDEXED_SEQ,))
+        for session_id, seq, content, username in rows:
+            self.add(cursor, session_rowid(session_id, seq), username, content)
+        for session_id, username, messages in session_archive.all_messages(conn):
+            for seq, message in enumerate(messages[:MAX_INDEXED_SEQ + 1]):
+                self.add(cursor, session_rowid(session_id, seq), username, message['content'])
+        rows = conn.execute('SELECT id, username, user, ai FROM chat_history')
+        for history_id, username, user, ai in rows:
+            self.add_history(cursor, username, history_id, user, ai)
+        cursor.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+
+    def build_query(self, username, q):
+        """把用户输入转换为 FTS5 查询，返回 (query, words)；没有可搜索的词时 query 为 None
+
+        空格分隔的每个词都必须出现；词内的汉字按二元组短语匹配，单个汉字按前缀匹配。
+        """
+        terms, words = [], []
+        for word in q.split():
+            tokens = tokenize(username, word, query=True)
+            if not tokens:
+                continue
+            words.append(word)
+            if len(word) == 1 and CJK_RUN.fullmatch(word):
+                terms.append(f'"{tokens[0]}"*')
+            else:
+                terms.append('"' + ' '.join(tokens) + '"')
+        if not terms:
+            return None, words
+        return ' '.join(terms), words
+
+    def search(self, cursor, username, q, limit, offset=0):
+        """按相关度返回 (results, has_more)，结果已经核对属于该用户"""
+        query, words = self.build_query(username, q)
+        if query is None:
+            return [], False
+        cursor.execute('''
+            SELECT rowid, rank FROM search_index
+            WHERE search_index MATCH ? ORDER BY rank LIMIT ? OFFSET ?
+        ''', (query, limit + 1, offset))
+        hits = cursor.fetchall()
+        has_more = len(hits) > limit
+        hits = hits[:limit]
+
+        decoded = [(decode_rowid(rowid), score) for rowid, score in hits]
+        session_ids = {ref for (kind, ref, _), _ in decoded if kind != 'history'}
+        history_ids = [ref for (kind, ref, _), _ in decoded if kind == 'history']
+        # +username 让 SQLite 按主键逐个查找；命中超过 3 条时它会改用 username 索引，读取该用户的全部记录
+        sessions = self._fetch(cursor, '''
+            SELECT id, title FROM chat_sessions WHERE +username = ? AND id IN ({})
+        ''', username, session_ids)
+        history = self._fetch(cursor, '''
+            SELECT id, user, ai, model, timestamp FROM chat_history WHERE +username = ? AND id IN ({})
+        ''', username, history_ids)
+
+        results = []
+        archived = {}  # 命中的已归档会话只解压一次
+        for (kind, ref, seq), score in decoded:
+            if kind == 'history':
+                row = history.get(ref)
+                if row is None:
+                    continue
+                text = history_text(row['user'], row['ai'])
+                result = {'type': 'history', 'history_id': ref, 'model': row['model'], 'timestamp': row['timestamp']}
+            else:
+                session = sessions.get(ref)
+                if session is None:
+                    continue
+                result = {'type': 'session', 'session_id': ref, 'title': session['title'], 'seq': seq, 'role': None}
+                if kind == 'title':
+                    text = session['title']
+                else:
+                    cursor.execute('SELECT role, content FROM session_messages WHERE session_id = ? AND seq = ?',
+                                   (ref, seq))
+                    message = cursor.fetchone()
+                    if message is None:
+                        if ref not in archived:
+                            archived[ref] = session_archive.messages(cursor, ref) or []
+                        if seq >= len(archived[ref]):
+                            continue
+                        message = archived[ref][seq]
+                    text = message['content']
+                    result['role'] = message['role']
+            result['snippet'], result['highlights'] = make_snippet(text, words)
+            result['score'] = score
+            results.append(result)
+        return results, has_more
+
+    def _fetch(self, cursor, sql, username, ids):
+        if not ids:
+            return {}
+        ids = list(ids)
+        cursor.execute(sql.format(','.join('?' * len(ids))), [username] + ids)
+        return {row[0]: row for row in cursor.fetchall()}
+
+
+def make_snippet(text, words, context=SEARCH_SNIPPET_CHARS):
+    """截取第一个匹配位置附近的文本，返回 (snippet, highlights)
+
+    highlights 为片段中匹配部分的 [start, end) 偏移，片段本身是原文，不含标记。
+    """
+    lowered = text.lower()
+    needles = [w.lower() for w in words]
+    first = min((i for i in (lowered.find(n) for n in needles) if i >= 0), default=0)
+    start = max(0, first - context)
+    end = min(len(text), first + context * 2)
+    snippet = text[start:end]
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text) else ''
+
+    highlights = []
+    window = lowered[start:end]
+    for needle in needles:
+        i = window.find(needle)
+        while needle and i >= 0:
+            highlights.append([i + len(prefix), i + len(prefix) + len(needle)])
+            i = window.find(needle, i + len(needle))
+    highlights.sort()
+    return prefix + snippet + suffix, highlights
+
+
+search_index = SearchIndex()
+
+
+if __name__ == '__main__':
+    # 已有数据库启用搜索：python search.py rebuild
+    if sys.argv[1:] != ['rebuild']:
+        sys.exit('usage: python search.py rebuild')
+    import database
+    database.init_db()
+    conn = database.connect()
+    try:
+        search_index.rebuild(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    print('search index rebuilt')
@@ -0,0 +1,174 @@
+import atexit
+import os
+import threading
+import time
+
+import database
+
+# 模型使用统计配置
+USAGE_BUCKET_SECONDS = int(os.getenv('USAGE_BUCKET_SECONDS', '300'))        # 汇总表的时间粒度（秒）
+USAGE_FLUSH_INTERVAL = float(os.getenv('USAGE_FLUSH_INTERVAL', '10'))       # 进程内计数写入数据库的间隔（秒）
+USAGE_USER_RETENTION = int(os.getenv('USAGE_USER_RETENTION', str(90 * 86400)))  # 活跃用户明细保留时长（秒）
+USAGE_MAX_POINTS = int(os.getenv('USAGE_MAX_POINTS', '2000'))               # 一次查询最多返回的时间点数
+
+# 进程内计数和 model_usage 表中累加的列，顺序一致
+COUNTERS = ('chats', 'prompt_tokens', 'completion_tokens', 'ttft_count', 'ttft_total', 'generation_seconds')
+
+
+class UsageStats:
+    """按模型统计对话数、活跃用户、token 数、首 token 延迟和生成速度
+
+    请求路径只在进程内累加计数，不写数据库；后台线程每隔 USAGE_FLUSH_INTERVAL
+    秒把计数按时间桶合并写入 model_usage（累加）和 model_usage_users（去重），
+    一次事务写完。多个 worker 写同一个时间桶时各自累加，活跃用户在查询时去重。
+    写入失败的计数并回内存，下一次再写；进程退出时写出剩余计数。
+    """
+
+    def __init__(self, bucket_seconds=USAGE_BUCKET_SECONDS, interval=USAGE_FLUSH_INTERVAL):
+        self.bucket_seconds = bucket_seconds
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._counts = {}   # (bucket, model) -> [chats, prompt_tokens, ..., ttft_max]
+        self._users = set()  # (bucket, model, username)
+        self._flusher = None
+        self._pid = None
+        self._pruned_at = 0.0
+
+    def record(self, model, username, prompt_tokens=None, completion_tokens=0, ttft=None,
+               generation_seconds=0.0, now=None):
+        """记录一次对话；ttft 为 None 表示没有收到任何 token"""
+        self.ensure_flusher()
+        bucket = int((now if now is not None else time.time()) // self.bucket_seconds) * self.bucket_seconds
+        with self._lock:
+            counts = self._counts.get((bucket, model))
+            if counts is None:
+                counts = self._counts[(bucket, model)] = [0, 0, 0, 0, 0.0, 0.0, 0.0]
+            counts[0] += 1
+            counts[1] += prompt_tokens or 0
+            counts[2] += completion_tokens or 0
+            if ttft is not None:
+                counts[3] += 1
+                counts[4] += ttft
+                counts[5] += generation_seconds
+                counts[6] = max(counts[6], ttft)
+            if username:
+                self._users.add((bucket, model, username))
+
+    def ensure_flusher(self):
+        if self._flusher is None or self._pid != os.getpid() or not self._flusher.is_alive():
+            with self._lock:
+                if self._flusher is None or self._pid != os.getpid() or not self._flusher.is_alive():
+                    if self._pid != os.getpid():
+                        # fork 出的 worker 不重复写父进程的计数
+                        self._counts, self._users = {}, set()
+                        atexit.register(self.flush)
+                    self._flusher = threading.Thread(target=self._flush_loop, name='usage-stats', daemon=True)
+                    self._pid = os.getpid()
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """把进程内计数写入汇总表，返回写入的 (时间桶, 模型) 数"""
+        with self._lock:
+            counts, users = self._counts, self._users
+            self._counts, self._users = {}, set()
+        if not counts and not users:
+            return 0
+        try:
+            with database.connection() as conn:
+                self.write(conn, counts, users)
+        except Exception as e:
+            print(f"Error flushing usage stats: {str(e)}")
+            with self._lock:
+                for key, values in counts.items():
+                    merged = self._counts.get(key)
+                    if merged is None:
+                        self._counts[key] = values
+                    else:
+                        for i in range(6):
+                            merged[i] += values[i]
+                        merged[6] = max(merged[6], values[6])
+                self._users |= users
+            return 0
+        return len(counts)
+
+    def write(self, conn, counts, users):
+        conn.executemany(f'''
+            INSERT INTO model_usage (bucket, model, {', '.join(COUNTERS)}, ttft_max)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (bucket, model) DO UPDATE SET
+                {', '.join(f'{c} = {c} + excluded.{c}' for c in COUNTERS)},
+                ttft_max = MAX(ttft_max, excluded.ttft_max)
+        ''', [key + tuple(values) for key, values in counts.items()])
+        conn.executemany('INSERT OR IGNORE INTO model_usage_users (bucket, model, username) VALUES (?, ?, ?)',
+                         list(users))
+        now = time.time()
+        if now - self._pruned_at > 3600:
+            conn.execute('DELETE FROM model_usage_users WHERE bucket < ?', (now - USAGE_USER_RETENTION,))
+            self._pruned_at = now
+        conn.commit()
+
+    def query(self, cursor, start, end, step, model=None):
+        """按 step 秒聚合 [start, end) 内的汇总数据，返回 (totals, series)
+
+        totals 为 model -> 统计，series 为按时间和模型排序的列表。start 和 end
+        按时间桶取整，step 必须是时间桶长度的整数倍。
+        """
+        start, end, where, params = self._range(start, end, model)
+        sums = ', '.join(f'SUM({c})' for c in COUNTERS) + ', MAX(ttft_max)'
+
+        cursor.execute(f'''
+            SELECT (bucket - ?) / ? * ? + ? AS t, model, {sums} FROM model_usage
+            WHERE {where} GROUP BY t, model ORDER BY t, model
+        ''', [start, step, step, start] + params)
+        series = [dict(summarize(row[2:]), time=row[0], model=row[1]) for row in cursor.fetchall()]
+        cursor.execute(f'''
+            SELECT (bucket - ?) / ? * ? + ? AS t, model, COUNT(DISTINCT username) FROM model_usage_users
+            WHERE {where} GROUP BY t, model
+        ''', [start, step, step, start] + params)
+        active = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+        for point in series:
+            point['active_users'] = active.get((point['time'], point['model']), 0)
+
+        cursor.execute(f'SELECT model, {sums} FROM model_usage WHERE {where} GROUP BY model', params)
+        totals = {row[0]: summarize(row[1:]) for row in cursor.fetchall()}
+        cursor.execute(f'''
+            SELECT model, COUNT(DISTINCT username) FROM model_usage_users WHERE {where} GROUP BY model
+        ''', params)
+        for name, count in cursor.fetchall():
+            if name in totals:
+                totals[name]['active_users'] = count
+        return totals, series
+
+    def active_users(self, cursor, start, end, model=None):
+        """时间范围内使用过任一模型（或指定模型）的用户数"""
+        _, _, where, params = self._range(start, end, model)
+        cursor.execute(f'SELECT COUNT(DISTINCT username) FROM model_usage_users WHERE {where}', params)
+        return cursor.fetchone()[0]
+
+    def _range(self, start, end, model):
+        start = int(start // self.bucket_seconds) * self.bucket_seconds
+        end = int(-(-end // self.bucket_seconds)) * self.bucket_seconds
+        where = 'bucket >= ? AND bucket < ?' + (' AND model = ?' if model else '')
+        return start, end, where, [start, end] + ([model] if model else [])
+
+
+def summarize(row):
+    """把累加值换算为接口返回的统计项"""
+    chats, prompt_tokens, completion_tokens, ttft_count, ttft_total, generation_seconds, ttft_max = row
+    return {
+        'chats': chats,
+        'active_users': 0,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'avg_ttft': ttft_total / ttft_count if ttft_count else None,
+        'max_ttft': ttft_max if ttft_count else None,
+        'tokens_per_second': completion_tokens / generation_seconds if generation_seconds else None
+    }
+
+
+usage_stats = UsageStats()
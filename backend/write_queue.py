@@ -0,0 +1,164 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+import database
+
+# 写入模式：strict 时每个请求各自提交事务；grouped 时写操作交给本进程的写线程，
+# 多个请求的写入合并到同一个事务中提交（group commit），调用方等到提交完成才返回
+DB_WRITE_MODE = os.getenv('DB_WRITE_MODE', 'strict')
+GROUP_COMMIT_DELAY = float(os.getenv('GROUP_COMMIT_DELAY', '0'))      # 攒批时额外等待的时间（秒），0 表示只合并已经在排队的写操作
+GROUP_COMMIT_SIZE = int(os.getenv('GROUP_COMMIT_SIZE', '64'))        # 一个事务最多包含的写操作数
+GROUP_COMMIT_QUEUE = int(os.getenv('GROUP_COMMIT_QUEUE', '4096'))    # 排队的写操作上限，满时调用方阻塞等待
+GROUP_COMMIT_DRAIN_TIMEOUT = float(os.getenv('GROUP_COMMIT_DRAIN_TIMEOUT', '10'))  # 退出时等待队列写完的最长时间（秒）
+
+
+class Write:
+    """排队中的一个写操作，提交完成（或失败）后 done 被设置"""
+
+    __slots__ = ('fn', 'args', 'done', 'result', 'error')
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class WriteQueue:
+    """会话和聊天记录的写入
+
+    写操作是 fn(cursor, *args)，只使用传入的 cursor 读写，不自己提交。run()
+    返回 fn 的返回值，返回即表示所在事务已经提交，是明确的持久化确认：
+
+    - strict：在连接池的连接上执行并立即提交，与原来每个请求一次提交相同
+    - grouped：放入队列，写线程每次取出正在排队的写操作（最多 GROUP_COMMIT_SIZE
+      个，可以再等待 GROUP_COMMIT_DELAY 秒攒更多），在一个事务中依次执行，一次
+      提交。上一个事务提交期间到达的写操作自然合并到下一个事务。每个操作在
+      自己的 SAVEPOINT 中执行，某个操作出错只回滚它自己，异常抛给它的调用方
+
+    写线程按进程创建；进程正常退出时停止接收新操作并把队列写完。
+    """
+
+    def __init__(self, mode=DB_WRITE_MODE, delay=GROUP_COMMIT_DELAY, size=GROUP_COMMIT_SIZE):
+        if mode not in ('strict', 'grouped'):
+            raise ValueError(f'unknown DB_WRITE_MODE: {mode}')
+        self.mode = mode
+        self.delay = delay
+        self.size = size
+        self._lock = threading.Lock()
+        self._put_lock = threading.Lock()
+        self._queue = None
+        self._writer = None
+        self._pid = None
+        self._closing = False
+        self._stats = {'writes': 0, 'batches': 0, 'failed': 0}
+
+    def run(self, fn, *args):
+        """执行写操作并等待提交，返回 fn 的返回值；fn 或提交出错时抛出异常"""
+        if self.mode == 'strict' or threading.current_thread() is self._writer:
+            return self._run_strict(fn, args)
+        write = Write(fn, args)
+        with self._put_lock:
+            # 关闭后不再排队，保证结束标记之后没有写操作
+            queued = not self._closing
+            if queued:
+                self._ensure_writer().put(write)
+        if not queued:
+            return self._run_strict(fn, args)
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def _run_strict(self, fn, args):
+        with database.connection() as conn:
+            result = fn(conn.cursor(), *args)
+            conn.commit()
+            return result
+
+    def _ensure_writer(self):
+        if self._writer is None or self._pid != os.getpid() or not self._writer.is_alive():
+            with self._lock:
+                if self._writer is None or self._pid != os.getpid() or not self._writer.is_alive():
+                    if self._pid != os.getpid():
+                        self._queue = queue.Queue(GROUP_COMMIT_QUEUE)
+                        atexit.register(self.close)
+                    self._writer = threading.Thread(target=self._write_loop, args=(self._queue,),
+                                                    name='group-commit', daemon=True)
+                    self._pid = os.getpid()
+                    self._writer.start()
+        return self._queue
+
+    def _write_loop(self, writes):
+        conn = database.connect()
+        conn.isolation_level = None  # 事务和 SAVEPOINT 由这里显式控制
+        while True:
+            write = writes.get()
+            if write is None:
+                break
+            batch = [write]
+            deadline = time.monotonic() + self.delay
+            stop = False
+            while len(batch) < self.size:
+                try:
+                    write = writes.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if write is None:
+                    stop = True
+                    break
+                batch.append(write)
+            self._commit(conn, batch)
+            if stop:
+                break
+        conn.close()
+
+    def _commit(self, conn, batch):
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for write in batch:
+                cursor.execute('SAVEPOINT write')
+                try:
+                    write.result = write.fn(cursor, *write.args)
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO write')
+                    write.error = e
+                cursor.execute('RELEASE write')
+            cursor.execute('COMMIT')
+        except Exception as e:
+            print(f"Error in group commit: {str(e)}")
+            if conn.in_transaction:
+                conn.rollback()
+            for write in batch:
+                write.error = write.error or e
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['writes'] += len(batch)
+            self._stats['failed'] += sum(1 for write in batch if write.error is not None)
+        for write in batch:
+            write.done.set()
+
+    def close(self, timeout=GROUP_COMMIT_DRAIN_TIMEOUT):
+        """停止接收新的排队写操作，等待已排队的写完"""
+        with self._put_lock:
+            self._closing = True
+            writer = self._writer
+            if writer is None or self._pid != os.getpid() or not writer.is_alive():
+                return
+            self._queue.put(None)
+        writer.join(timeout)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['mode'] = self.mode
+        stats['avg_batch'] = stats['writes'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+
+write_queue = WriteQueue()
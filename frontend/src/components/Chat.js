@@ -23,6 +23,35 @@ import Sidebar from './Sidebar';
 import UserAgreement from './UserAgreement';
 import config from '../config';
 
+// 固定的模型名称列表
+const MODEL_NAMES = ['QwQ', 'Qwen2.5', 'DS-R1'];
+
+// 推送连接断开后重连的等待时间（毫秒）
+const EVENTS_RETRY_DELAY = 3000;
+
+// 根据运行中的服务生成模型列表
+const buildModelList = (runningModels) => MODEL_NAMES.map(modelName => {
+  const runningModel = runningModels.find(m =>
+    m.job_name === modelName || (m.model && m.model.startsWith(modelName))
+  );
+  if (runningModel) {
+    return {
+      name: modelName,
+      api: runningModel.api,
+      node: runningModel.node,
+      running: true,
+      status: runningModel.status || 'running'
+    };
+  }
+  return {
+    name: modelName,
+    api: '',
+    node: '未部署',
+    running: false,
+    status: 'stopped'
+  };
+});
+
 function Chat({ getToken, setToken }) {
   const [message, setMessage] = useState('');
   const [chatHistory, setChatHistory] = useState([]);
@@ -31,14 +60,18 @@ function Chat({ getToken, setToken }) {
   const [currentModel, setCurrentModel] = useState('');
   const [models, setModels] = useState([]);
   const [chatSessions, setChatSessions] = useState([]);
+  const [nextSessionCursor, setNextSessionCursor] = useState(null);
   const [currentSessionId, setCurrentSessionId] = useState(null);
   const [showAgreement, setShowAgreement] = useState(false);
   const [isResponding, setIsResponding] = useState(false);
+  const [queueStatus, setQueueStatus] = useState(null);
   const [announcement, setAnnouncement] = useState("暂无公告");
   const [announcementEndTime, setAnnouncementEndTime] = useState(null);
   const [remainingTime, setRemainingTime] = useState('');
   const messagesEndRef = useRef(null);
   const abortControllerRef = useRef(null);
+  // 每个会话已同步到后端的消息，保存时只发送与之不同的部分
+  const syncedMessagesRef = useRef({});
   const navigate = useNavigate();
   const [expandedThoughts, setExpandedThoughts] = useState({});
   const [isAdmin, setIsAdmin] = useState(false);
@@ -61,46 +94,14 @@ function Chat({ getToken, setToken }) {
     const fetchModels = async () => {
       try {
         console.log('开始获取模型状态...');
-        console.log('API地址:', `${config.MODEL_SERVICE_URL}/api/check-service`);
-        
-        // 固定的模型名称列表
-        const modelNames = ['QwQ', 'Qwen2.5', 'DS-R1'];
-        console.log('固定的模型列表:', modelNames);
-        
-        // 获取运行中的模型信息
         const response = await axios.get(`${config.MODEL_SERVICE_URL}/api/check-service`);
-        console.log('API响应数据:', response.data);
         const runningModels = response.data.services || [];
         console.log('运行中的模型:', runningModels);
         
-        // 更新模型状态
-        const newModels = modelNames.map(modelName => {
-          const runningModel = runningModels.find(m => m.job_name === modelName);
-          console.log(`处理模型 ${modelName}:`, runningModel ? '找到运行状态' : '未运行');
-          if (runningModel) {
-            return {
-              name: modelName,
-              api: runningModel.api,
-              node: runningModel.node,
-              running: true,
-              status: runningModel.status || 'running'
-            };
-          }
-          return {
-            name: modelName,
-            api: '',
-            node: '未部署',
-            running: false,
-            status: 'stopped'
-          };
-        });
-
+        const newModels = buildModelList(runningModels);
         console.log('更新后的模型列表:', newModels);
         setModels(newModels);
-        if (!currentModel && newModels.length > 0) {
-          console.log('设置当前模型为:', newModels[0].name);
-          setCurrentModel(newModels[0].name);
-        }
+        setCurrentModel(prev => prev || newModels[0].name);
       } catch (error) {
         console.error('获取模型状态失败:', error);
         console.error('错误详情:', {
@@ -112,10 +113,9 @@ function Chat({ getToken, setToken }) {
       }
     };
 
+    // 之后的模型上下线由 /api/events 推送
     fetchModels();
-    const interval = setInterval(fetchModels, 30000);
-    return () => clearInterval(interval);
-  }, [currentModel]);
+  }, []);
 
   useEffect(() => {
     const fetchUserInfo = async () => {
@@ -143,50 +143,88 @@ function Chat({ getToken, setToken }) {
   }, [getToken, setToken, navigate]);
 
   useEffect(() => {
-    const fetchAnnouncement = async () => {
-      try {
-        const token = getToken();
-        if (!token) {
-          return;
+    const applyAnnouncement = (data) => {
+      // 确保返回的数据存在且有content字段
+      if (data && data.content && data.content.trim() !== '') {
+        setAnnouncement(data.content);
+        if (data.display_end) {
+          setAnnouncementEndTime(new Date(data.display_end));
         }
-        
-        const response = await axios.get(`${config.API_BASE_URL}/api/admin/announcement`, {
+      } else {
+        setAnnouncement("暂无公告");
+        setAnnouncementEndTime(null);
+        setRemainingTime('');
+      }
+    };
+
+    const token = getToken();
+    if (!token) {
+      return;
+    }
+
+    // 公告和模型状态的变化由后端推送，不再定时轮询。
+    // EventSource 不能设置请求头，每次连接前用 access token 换一个只能用于
+    // 推送、很快过期的 token 放在查询参数中；断线后关闭连接，换新的 token
+    // 并带上最后收到的事件 id 重连
+    let events = null;
+    let retryTimer = null;
+    let lastEventId = '';
+    let closed = false;
+
+    const reconnect = () => {
+      if (!closed) {
+        retryTimer = setTimeout(connect, EVENTS_RETRY_DELAY);
+      }
+    };
+
+    const connect = async () => {
+      let streamToken;
+      try {
+        const response = await axios.post(`${config.API_BASE_URL}/api/stream-token`, null, {
           headers: {
-            Authorization: `Bearer ${token}`
+            Authorization: `Bearer ${getToken()}`
           }
         });
-        
-        // 确保返回的数据存在且有content字段
-        if (response.data && response.data.content) {
-          const { content, display_end } = response.data;
-          
-          // 检查是否有内容，有则设置公告和结束时间，没有则显示"暂无公告"
-          if (content && content.trim() !== '') {
-            setAnnouncement(content);
-            if (display_end) {
-              setAnnouncementEndTime(new Date(display_end));
-            }
-          } else {
-            setAnnouncement("暂无公告");
-            setAnnouncementEndTime(null);
-            setRemainingTime('');
-          }
-        } else {
-          setAnnouncement("暂无公告");
-          setAnnouncementEndTime(null);
-          setRemainingTime('');
-        }
+        streamToken = response.data.token;
       } catch (error) {
-        console.error('Error fetching announcement:', error);
-        setAnnouncement("暂无公告");
-        setAnnouncementEndTime(null);
-        setRemainingTime('');
+        console.error('获取推送 token 失败:', error);
+        reconnect();
+        return;
+      }
+      if (closed) {
+        return;
       }
+
+      const params = new URLSearchParams({ token: streamToken });
+      if (lastEventId) {
+        params.set('last_event_id', lastEventId);
+      }
+      events = new EventSource(`${config.STREAM_BASE_URL}/api/events?${params}`);
+      events.addEventListener('announcement', (event) => {
+        lastEventId = event.lastEventId || lastEventId;
+        applyAnnouncement(JSON.parse(event.data));
+      });
+      events.addEventListener('models', (event) => {
+        lastEventId = event.lastEventId || lastEventId;
+        const newModels = buildModelList(JSON.parse(event.data).services || []);
+        setModels(newModels);
+        setCurrentModel(prev => prev || newModels[0].name);
+      });
+      events.onerror = () => {
+        console.error('公告推送连接中断，正在重连...');
+        events.close();
+        reconnect();
+      };
     };
 
-    fetchAnnouncement();
-    const interval = setInterval(fetchAnnouncement, 5000);
-    return () => clearInterval(interval);
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (events) {
+        events.close();
+      }
+    };
   }, [getToken]);
 
   useEffect(() => {
@@ -215,8 +253,9 @@ function Chat({ getToken, setToken }) {
     return () => clearInterval(timer);
   }, [announcementEndTime]);
 
-  // 当聊天历史变化时自动保存
+  // 当聊天历史变化时自动保存；回复生成期间由后端在结束时保存
   useEffect(() => {
+    if (isResponding) return;
     let saveTimeout;
     const saveWithDebounce = () => {
       clearTimeout(saveTimeout);
@@ -231,7 +270,7 @@ function Chat({ getToken, setToken }) {
 
     saveWithDebounce();
     return () => clearTimeout(saveTimeout);
-  }, [chatHistory, currentSessionId, chatSessions]);
+  }, [chatHistory, currentSessionId, chatSessions, isResponding]);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -258,6 +297,22 @@ function Chat({ getToken, setToken }) {
       return;
     }
 
+    let sessionId = currentSessionId;
+    let newChatHistory = chatHistory;
+    let currentContent = '';
+
+    // 记录后端保存的本轮对话，避免自动保存再提交一次
+    const markSynced = () => {
+      const messages = [
+        ...newChatHistory.map(msg => ({ role: msg.role, content: msg.content })),
+        { role: 'assistant', content: currentContent }
+      ];
+      syncedMessagesRef.current[sessionId] = messages;
+      setChatSessions(prev =>
+        prev.map(s => s.id === sessionId ? { ...s, messages } : s)
+      );
+    };
+
     try {
       const currentModelInfo = models.find(m => m.name === currentModel);
       
@@ -266,26 +321,25 @@ function Chat({ getToken, setToken }) {
       }
 
       // 如果没有当前会话，创建一个新会话
-      if (!currentSessionId) {
+      if (!sessionId) {
         const newSession = {
           title: '新对话',
           messages: [],
           createdAt: new Date()
         };
         const savedSession = await saveSessionToBackend(newSession);
+        syncedMessagesRef.current[savedSession.id] = [];
         setChatSessions(prev => [savedSession, ...prev]);
         setCurrentSessionId(savedSession.id);
+        sessionId = savedSession.id;
       }
 
       // 添加用户消息到历史记录
       const userMessage = { role: 'user', content: message };
-      const newChatHistory = [...chatHistory, userMessage];
+      newChatHistory = [...chatHistory, userMessage];
       setChatHistory(newChatHistory);
       setMessage('');
 
-      // 立即保存用户消息
-      await saveCurrentSession();
-
       // 添加一个空的助手消息用于流式更新
       const assistantMessage = { role: 'assistant', content: '' };
       setChatHistory(prev => [...prev, assistantMessage]);
@@ -294,35 +348,36 @@ function Chat({ getToken, setToken }) {
       // 创建新的 AbortController
       abortControllerRef.current = new AbortController();
 
-      const response = await fetch(`${currentModelInfo.api}/v1/chat/completions`, {
+      // 由后端转发到模型服务，回复结束后后端负责保存本轮对话
+      const token = getToken();
+      const response = await fetch(`${config.STREAM_BASE_URL}/api/chat/completions`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'Accept': 'text/event-stream'
+          'Accept': 'text/event-stream',
+          Authorization: `Bearer ${token}`
         },
         body: JSON.stringify({
+          session_id: sessionId,
           model: currentModel,
-          messages: [
-            ...newChatHistory.map(msg => ({
-              role: msg.role,
-              content: msg.content
-            }))
-          ],
-          temperature: 0.7,
-          stream: true
+          messages: newChatHistory.map(msg => ({
+            role: msg.role,
+            content: msg.content
+          })),
+          temperature: 0.7
         }),
         signal: abortControllerRef.current.signal
       });
 
       if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
+        // 模型繁忙时后端返回 429/503 和原因
+        const body = await response.json().catch(() => ({}));
+        throw new Error(body.error || `HTTP error! status: ${response.status}`);
       }
 
       const reader = response.body.getReader();
       const decoder = new TextDecoder();
       let buffer = '';
-      let currentContent = '';
-      let lastSaveTime = Date.now();
 
       while (true) {
         const { done, value } = await reader.read();
@@ -338,42 +393,56 @@ function Chat({ getToken, setToken }) {
             const data = line.slice(6);
             if (data === '[DONE]') continue;
 
+            let parsed;
             try {
-              const parsed = JSON.parse(data);
-              if (parsed.choices && parsed.choices[0]?.delta?.content) {
-                const newContent = parsed.choices[0].delta.content;
-                currentContent += newContent;
-                setChatHistory(prev => {
-                  const newHistory = [...prev];
-                  const lastMessage = newHistory[newHistory.length - 1];
-                  if (lastMessage && lastMessage.role === 'assistant') {
-                    lastMessage.content = currentContent;
-                  }
-                  return newHistory;
-                });
-
-                // 每2秒保存一次，避免过于频繁的保存
-                const now = Date.now();
-                if (now - lastSaveTime > 2000) {
-                  await saveCurrentSession();
-                  lastSaveTime = now;
-                }
-              }
+              parsed = JSON.parse(data);
             } catch (e) {
               console.error('Error parsing stream data:', e);
+              continue;
+            }
+            // 模型繁忙时后端先推送排队位置和预计等待时间，排队失败时推送 error
+            if (parsed.queue) {
+              setQueueStatus(parsed.queue);
+              continue;
+            }
+            if (parsed.error) {
+              throw new Error(parsed.error.message || parsed.error);
+            }
+            setQueueStatus(null);
+            if (parsed.choices && parsed.choices[0]?.delta?.content) {
+              const newContent = parsed.choices[0].delta.content;
+              currentContent += newContent;
+              setChatHistory(prev => {
+                const newHistory = [...prev];
+                const lastMessage = newHistory[newHistory.length - 1];
+                if (lastMessage && lastMessage.role === 'assistant') {
+                  lastMessage.content = currentContent;
+                }
+                return newHistory;
+              });
             }
           }
         }
       }
 
-      // 最后保存一次完整的对话
-      await saveCurrentSession();
+      if (currentContent) {
+        markSynced();
+      }
     } catch (error) {
-      console.error('Error sending message:', error);
+      if (error.name === 'AbortError' && currentContent) {
+        // 用户停止生成时，后端同样会保存已收到的部分
+        markSynced();
+      } else {
+        console.error('Error sending message:', error);
+        if (error.name !== 'AbortError') {
+          alert(error.message);
+        }
+      }
       // 如果发生错误，移除空的助手消息
       setChatHistory(prev => prev.filter(msg => !(msg.role === 'assistant' && !msg.content)));
     } finally {
       setIsResponding(false);
+      setQueueStatus(null);
     }
   };
 
@@ -458,33 +527,24 @@ function Chat({ getToken, setToken }) {
     );
   };
 
-  // 从后端加载聊天会话
-  const loadChatSessions = async () => {
+  // 从后端分页加载会话列表（只含标题等索引信息，消息在打开会话时再加载）
+  const loadChatSessions = async (cursor = null) => {
     try {
       const token = getToken();
       const response = await axios.get(`${config.API_BASE_URL}/api/chat/sessions`, {
         headers: {
           Authorization: `Bearer ${token}`
         },
+        params: cursor ? { cursor } : {},
         withCredentials: true
       });
-      // 确保每个会话的messages都是数组，并且格式正确
-      const sessions = response.data.map(session => ({
-        ...session,
-        messages: Array.isArray(session.messages) ? session.messages.map(msg => ({
-          role: msg.role || (msg.user ? 'user' : 'assistant'),
-          content: msg.content || msg.text || ''
-        })) : []
-      }));
-      console.log('Loaded sessions:', sessions);
-      setChatSessions(sessions);
+      const sessions = response.data.sessions;
+      setNextSessionCursor(response.data.next_cursor);
+      setChatSessions(prev => cursor ? [...prev, ...sessions] : sessions);
       
-      // 如果有会话，设置第一个为当前会话并显示其消息
-      if (sessions.length > 0) {
-        const firstSession = sessions[0];
-        setCurrentSessionId(firstSession.id);
-        setChatHistory(firstSession.messages);
-        console.log('Set initial session:', firstSession.id, 'Messages:', firstSession.messages);
+      // 首次加载时打开最近的会话
+      if (!cursor && sessions.length > 0) {
+        await openSession(sessions[0].id);
       }
     } catch (error) {
       console.error('Error loading chat sessions:', error);
@@ -494,6 +554,50 @@ function Chat({ getToken, setToken }) {
     }
   };
 
+  // 全文搜索聊天记录
+  const searchMessages = async (q, cursor = null) => {
+    const token = getToken();
+    const response = await axios.get(`${config.API_BASE_URL}/api/search`, {
+      headers: {
+        Authorization: `Bearer ${token}`
+      },
+      params: cursor ? { q, cursor, limit: 20 } : { q, limit: 20 },
+      withCredentials: true
+    });
+    return response.data;
+  };
+
+  // 加载单个会话的消息
+  const fetchSessionMessages = async (sessionId) => {
+    const token = getToken();
+    const response = await axios.get(`${config.API_BASE_URL}/api/chat/sessions/${sessionId}`, {
+      headers: {
+        Authorization: `Bearer ${token}`
+      },
+      withCredentials: true
+    });
+    const messages = Array.isArray(response.data.messages) ? response.data.messages : [];
+    syncedMessagesRef.current[sessionId] = messages;
+    setChatSessions(prev =>
+      prev.map(s => s.id === sessionId ? { ...s, messages } : s)
+    );
+    return messages;
+  };
+
+  // 打开会话，消息未加载过时先从后端获取
+  const openSession = async (sessionId, knownSessions = chatSessions) => {
+    const session = knownSessions.find(s => s.id === sessionId);
+    try {
+      const messages = Array.isArray(session?.messages)
+        ? session.messages
+        : await fetchSessionMessages(sessionId);
+      setCurrentSessionId(sessionId);
+      setChatHistory(messages);
+    } catch (error) {
+      console.error('Error loading session messages:', error);
+    }
+  };
+
   // 切换会话
   const switchSession = async (sessionId) => {
     // 检查当前是否有正在进行的回复
@@ -502,18 +606,12 @@ function Chat({ getToken, setToken }) {
       return;
     }
 
-    const session = chatSessions.find(s => s.id === sessionId);
-    if (session) {
-      // 确保消息数组存在且格式正确
-      const messages = Array.isArray(session.messages) ? session.messages : [];
-      setCurrentSessionId(sessionId);
-      setChatHistory(messages);
+    await openSession(sessionId);
       
-      // 滚动到底部
-      setTimeout(() => {
-        messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
-      }, 100);
-    }
+    // 滚动到底部
+    setTimeout(() => {
+      messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
+    }, 100);
   };
 
   // 保存会话到后端
@@ -568,6 +666,7 @@ function Chat({ getToken, setToken }) {
     };
     try {
       const savedSession = await saveSessionToBackend(newSession);
+      syncedMessagesRef.current[savedSession.id] = [];
       setChatSessions(prev => [savedSession, ...prev]);
       setCurrentSessionId(savedSession.id);
       setChatHistory([]);  // 清空当前聊天记录
@@ -576,15 +675,20 @@ function Chat({ getToken, setToken }) {
     }
   };
 
-  // 更新会话标题
+  // 更新会话标题（只发送标题，不重写消息）
   const updateSessionTitle = async (sessionId, title) => {
     try {
       const session = chatSessions.find(s => s.id === sessionId);
       if (session) {
-        const updatedSession = { ...session, title };
-        await saveSessionToBackend(updatedSession);
+        const token = getToken();
+        await axios.put(`${config.API_BASE_URL}/api/chat/sessions/${sessionId}`, { title }, {
+          headers: {
+            Authorization: `Bearer ${token}`
+          },
+          withCredentials: true
+        });
         setChatSessions(prev => 
-          prev.map(s => s.id === sessionId ? updatedSession : s)
+          prev.map(s => s.id === sessionId ? { ...s, title } : s)
         );
       }
     } catch (error) {
@@ -592,22 +696,43 @@ function Chat({ getToken, setToken }) {
     }
   };
 
-  // 保存当前会话
+  // 保存当前会话：只发送第一条发生变化的消息及其之后的部分
   const saveCurrentSession = async () => {
     if (currentSessionId) {
       const session = chatSessions.find(s => s.id === currentSessionId);
       if (session) {
-        console.log('Current chat history:', chatHistory); // 添加日志
-        const updatedSession = { 
-          ...session, 
-          messages: chatHistory,
-          updatedAt: new Date().toISOString()
-        };
+        const messages = chatHistory.map(msg => ({
+          role: msg.role,
+          content: msg.content
+        }));
+        const synced = syncedMessagesRef.current[currentSessionId] || [];
+        let start = 0;
+        while (
+          start < synced.length &&
+          start < messages.length &&
+          synced[start].role === messages[start].role &&
+          synced[start].content === messages[start].content
+        ) {
+          start++;
+        }
+        if (start === synced.length && start === messages.length) {
+          return;
+        }
+
         try {
-          const savedSession = await saveSessionToBackend(updatedSession);
-          console.log('Saved session:', savedSession); // 添加日志
+          const token = getToken();
+          await axios.patch(`${config.API_BASE_URL}/api/chat/sessions/${currentSessionId}/messages`, {
+            start,
+            messages: messages.slice(start)
+          }, {
+            headers: {
+              Authorization: `Bearer ${token}`
+            },
+            withCredentials: true
+          });
+          syncedMessagesRef.current[currentSessionId] = messages;
           setChatSessions(prev => 
-            prev.map(s => s.id === currentSessionId ? savedSession : s)
+            prev.map(s => s.id === currentSessionId ? { ...s, messages } : s)
           );
         } catch (error) {
           console.error('Error saving current session:', error);
@@ -627,37 +752,11 @@ function Chat({ getToken, setToken }) {
     try {
       console.log('API地址:', `${config.MODEL_SERVICE_URL}/api/check-service`);
       
-      // 固定的模型名称列表
-      const modelNames = ['QwQ', 'Qwen2.5', 'DS-R1'];
-      console.log('固定的模型列表:', modelNames);
-      
       // 获取运行中的模型信息
       const response = await axios.get(`${config.MODEL_SERVICE_URL}/api/check-service`);
       console.log('API响应数据:', response.data);
       const runningModels = response.data.services || [];
-      console.log('运行中的模型:', runningModels);
-      
-      // 更新模型状态
-      const newModels = modelNames.map(modelName => {
-        const runningModel = runningModels.find(m => m.job_name === modelName);
-        console.log(`处理模型 ${modelName}:`, runningModel ? '找到运行状态' : '未运行');
-        if (runningModel) {
-          return {
-            name: modelName,
-            api: runningModel.api,
-            node: runningModel.node,
-            running: true,
-            status: runningModel.status || 'running'
-          };
-        }
-        return {
-          name: modelName,
-          api: '',
-          node: '未部署',
-          running: false,
-          status: 'stopped'
-        };
-      });
+      const newModels = buildModelList(runningModels);
 
       console.log('刷新后的模型列表:', newModels);
       setModels(newModels);
@@ -697,8 +796,7 @@ function Chat({ getToken, setToken }) {
       if (sessionId === currentSessionId) {
         const remainingSessions = chatSessions.filter(s => s.id !== sessionId);
         if (remainingSessions.length > 0) {
-          setCurrentSessionId(remainingSessions[0].id);
-          setChatHistory(remainingSessions[0].messages);
+          await openSession(remainingSessions[0].id, remainingSessions);
         } else {
           setCurrentSessionId(null);
           setChatHistory([]);
@@ -836,7 +934,10 @@ function Chat({ getToken, setToken }) {
         onUpdateTitle={updateSessionTitle}
         onRefreshModels={handleRefreshModels}
         onDeleteSession={handleDeleteSession}
+        hasMoreSessions={!!nextSessionCursor}
+        onLoadMoreSessions={() => loadChatSessions(nextSessionCursor)}
         onBackToHome={handleBackToHome}
+        onSearch={searchMessages}
         chatHistory={chatHistory}
         isResponding={isResponding}
         isRefreshing={isRefreshing}
@@ -917,6 +1018,11 @@ function Chat({ getToken, setToken }) {
         </Box>
 
         <Box sx={{ p: 2, borderTop: 1, borderColor: 'divider' }}>
+          {queueStatus && (
+            <Typography variant="body2" color="text.secondary" sx={{ mb: 1 }}>
+              模型繁忙，排队中：第 {queueStatus.position} 位，预计等待 {queueStatus.eta} 秒
+            </Typography>
+          )}
           <Box sx={{ display: 'flex', gap: 1 }}>
             <TextField
               fullWidth
@@ -29,7 +29,9 @@ import {
   Refresh as RefreshIcon,
   Delete as DeleteIcon,
   Home as HomeIcon,
-  Info as InfoIcon
+  Info as InfoIcon,
+  Search as SearchIcon,
+  Clear as ClearIcon
 } from '@mui/icons-material';
 import UserAgreement from './UserAgreement';
 
@@ -46,7 +48,10 @@ function Sidebar({
   onUpdateTitle,
   onRefreshModels,
   onDeleteSession,
+  hasMoreSessions,
+  onLoadMoreSessions,
   onBackToHome,
+  onSearch,
   chatHistory,
   isResponding,
   isRefreshing
@@ -60,6 +65,45 @@ function Sidebar({
   const [showModelDetails, setShowModelDetails] = useState(false);
   const [selectedModel, setSelectedModel] = useState(null);
   const [showAllModelsInfo, setShowAllModelsInfo] = useState(false);
+  const [searchQuery, setSearchQuery] = useState('');
+  const [searchResults, setSearchResults] = useState(null);
+  const [searchCursor, setSearchCursor] = useState(null);
+
+  // 搜索会话标题和消息内容，结果按相关度排序并分页
+  const runSearch = async (cursor = null) => {
+    const query = searchQuery.trim();
+    if (!query) {
+      setSearchResults(null);
+      return;
+    }
+    try {
+      const data = await onSearch(query, cursor);
+      setSearchResults(prev => cursor ? [...prev, ...data.results] : data.results);
+      setSearchCursor(data.next_cursor);
+    } catch (error) {
+      console.error('Error searching:', error);
+    }
+  };
+
+  const clearSearch = () => {
+    setSearchQuery('');
+    setSearchResults(null);
+    setSearchCursor(null);
+  };
+
+  // 片段是原文，highlights 给出匹配部分的位置
+  const renderSnippet = (result) => {
+    const parts = [];
+    let last = 0;
+    result.highlights.forEach(([start, end], i) => {
+      if (start < last) return;
+      parts.push(result.snippet.slice(last, start));
+      parts.push(<mark key={i}>{result.snippet.slice(start, end)}</mark>);
+      last = end;
+    });
+    parts.push(result.snippet.slice(last));
+    return parts;
+  };
 
   const handleExpandClick = () => {
     setExpanded(!expanded);
@@ -257,7 +301,64 @@ function Sidebar({
             <AddIcon />
           </IconButton>
         </Box>
-        <List>
+        <Box sx={{ px: 2, pb: 1 }}>
+          <TextField
+            size="small"
+            fullWidth
+            placeholder="搜索聊天记录"
+            value={searchQuery}
+            onChange={(e) => setSearchQuery(e.target.value)}
+            onKeyDown={(e) => {
+              if (e.key === 'Enter') {
+                runSearch();
+              }
+            }}
+            InputProps={{
+              startAdornment: (
+                <InputAdornment position="start">
+                  <SearchIcon fontSize="small" />
+                </InputAdornment>
+              ),
+              endAdornment: searchResults && (
+                <InputAdornment position="end">
+                  <IconButton size="small" onClick={clearSearch}>
+                    <ClearIcon fontSize="small" />
+                  </IconButton>
+                </InputAdornment>
+              )
+            }}
+          />
+        </Box>
+        {searchResults && (
+          <List>
+            {searchResults.length === 0 && (
+              <Typography variant="body2" color="text.secondary" sx={{ px: 2 }}>
+                没有找到相关内容
+              </Typography>
+            )}
+            {searchResults.map((result, index) => (
+              <ListItem key={index} disablePadding>
+                <ListItemButton
+                  onClick={() => result.type === 'session' && onSwitchSession(result.session_id)}
+                  disabled={isResponding || result.type !== 'session'}
+                >
+                  <ListItemText
+                    primary={result.type === 'session' ? result.title : '聊天历史'}
+                    secondary={renderSnippet(result)}
+                  />
+                </ListItemButton>
+              </ListItem>
+            ))}
+            {searchCursor && (
+              <Box sx={{ textAlign: 'center' }}>
+                <Button variant="text" size="small" onClick={() => runSearch(searchCursor)}>
+                  更多结果
+                </Button>
+              </Box>
+            )}
+          </List>
+        )}
+        <List sx={{ display: searchResults ? 'none' : 'block' }}>
           {chatSessions.map((session) => (
             <React.Fragment key={session.id}>
               <ListItem disablePadding>
@@ -320,6 +421,13 @@ function Sidebar({
             </React.Fragment>
           ))}
         </List>
+        {hasMoreSessions && !searchResults && (
+          <Box sx={{ textAlign: 'center' }}>
+            <Button variant="text" size="small" onClick={onLoadMoreSessions}>
+              加载更多
+            </Button>
+          </Box>
+        )}
         <Box sx={{ mt: 'auto', p: 2, textAlign: 'center' }}>
           <Button
             variant="text"
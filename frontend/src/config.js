@@ -1,6 +1,8 @@
 const config = {
   // 后端 API 地址
   API_BASE_URL: 'http://192.168.0.122:50000',
+  // 流式补全和服务端推送地址，部署异步网关（backend/gateway.py）时改为网关地址
+  STREAM_BASE_URL: 'http://192.168.0.122:50000',
   // 模型服务地址
   MODEL_SERVICE_URL: 'http://10.21.22.100:30000',
 };
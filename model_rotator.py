@@ -27,6 +27,18 @@ NODE_IP_BASE = "10.21.22.200"  # 节点IP基础地址
 # 可用节点列表
 AVAILABLE_NODES = ["compute01", "compute04", "compute05"]
 
+# 同时运行的模型作业数上限
+MAX_RUNNING_JOBS = 2
+
+# 每个模型默认的副本数，可在 MODEL_CONFIGS 中用 'replicas' 单独配置
+# 空闲节点足够时在不同节点上各启动一个副本，后端按负载在副本之间分配请求
+DEFAULT_MODEL_REPLICAS = int(os.getenv('MODEL_REPLICAS', '1'))
+
+# llama-server 的总上下文长度（-c）和并行 slot 数（-np），可在 MODEL_CONFIGS 中用 'context'、'parallel' 单独配置
+# 每个 slot 分到 context / parallel 个 token，后端据此裁剪发送给模型的历史消息
+DEFAULT_MODEL_CONTEXT = 40960
+DEFAULT_MODEL_PARALLEL = 4
+
 # 模型配置
 MODEL_CONFIGS = {
     'QwQ-32B': {
@@ -65,6 +77,7 @@ model_states = {
         'is_available': False,
         'node_name': None,
         'job_id': None,
+        'replicas': [],  # 所有运行中的副本 [{'job_id', 'node_name'}]
         'last_health_check': None,
         'last_rotation_time': None  # 添加最后轮换时间
     }
@@ -74,11 +87,61 @@ model_states = {
 # 轮换时间间隔（秒）
 ROTATION_INTERVAL = 3600  # 1小时轮换一次
 
+# 模型状态快照文件，后端据此向前端推送模型上下线
+MODEL_STATE_FILE = os.getenv('MODEL_STATE_FILE', './model_states.json')
+
+def get_node_api_ip(node_name: str) -> str:
+    """根据节点名称计算模型服务监听的IP"""
+    node_number = int(node_name.replace("compute", ""))
+    return f"{NODE_IP_BASE[:-3]}{200 + node_number}"
+
+def get_model_replicas(model_name: str) -> int:
+    """模型期望的副本数"""
+    return MODEL_CONFIGS[model_name].get('replicas', DEFAULT_MODEL_REPLICAS)
+
+def get_model_context(model_name: str) -> int:
+    """每个 slot（即单个请求）可用的上下文长度"""
+    config = MODEL_CONFIGS[model_name]
+    return config.get('context', DEFAULT_MODEL_CONTEXT) // config.get('parallel', DEFAULT_MODEL_PARALLEL)
+
+def get_model_api(model_name: str, node_name: Optional[str]) -> Optional[str]:
+    """模型在指定节点上的服务地址；等待中的作业没有分配节点时返回 None"""
+    if not node_name or not node_name.startswith("compute"):
+        return None
+    return f"http://{get_node_api_ip(node_name)}:{MODEL_CONFIGS[model_name]['port']}"
+
+def save_model_states():
+    """将模型状态写入快照文件（原子替换）"""
+    snapshot = {}
+    for model_name, state in model_states.items():
+        api = get_model_api(model_name, state['node_name']) if state['is_available'] else None
+        replicas = []
+        if state['is_available']:
+            for replica in state['replicas']:
+                replica_api = get_model_api(model_name, replica['node_name'])
+                if replica_api:
+                    replicas.append({'job_id': replica['job_id'], 'node_name': replica['node_name'], 'api': replica_api})
+        snapshot[model_name] = {
+            'is_available': state['is_available'],
+            'node_name': state['node_name'],
+            'job_id': state['job_id'],
+            'api': api,
+            'replicas': replicas,
+            'context_window': get_model_context(model_name),
+            'last_health_check': state['last_health_check'].isoformat() if state['last_health_check'] else None
+        }
+    try:
+        tmp_path = MODEL_STATE_FILE + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, MODEL_STATE_FILE)
+    except Exception as e:
+        logging.error(f"写入模型状态快照失败: {str(e)}")
+
 def generate_model_script(model_name: str, node_name: str) -> str:
     """生成模型启动脚本"""
     config = MODEL_CONFIGS[model_name]
-    node_number = int(node_name.replace("compute", ""))
-    api_ip = f"{NODE_IP_BASE[:-3]}{200 + node_number}"
+    api_ip = get_node_api_ip(node_name)
     
     # 使用短名称作为作业名称
     short_name = model_name.split('-')[0]
@@ -108,9 +171,9 @@ source /archive/liugu/venv_llama.cpp/bin/activate
   -ctv q8_0 \\
   --host {api_ip} \\
   --port {config['port']} \\
-  -np 4 \\
+  -np {config.get('parallel', DEFAULT_MODEL_PARALLEL)} \\
   -t 12 \\
-  -c 40960
+  -c {config.get('context', DEFAULT_MODEL_CONTEXT)}
 """
     return script
 
@@ -173,8 +236,7 @@ def check_node_status(node_name: str) -> Tuple[bool, List[str]]:
 def check_model_service(node_name: str, model_name: str) -> bool:
     """检查模型服务是否正常运行"""
     try:
-        node_number = int(node_name.replace("compute", ""))
-        api_ip = f"{NODE_IP_BASE[:-3]}{200 + node_number}"
+        api_ip = get_node_api_ip(node_name)
         port = MODEL_CONFIGS[model_name]['port']
         
         result = subprocess.run(
@@ -207,8 +269,8 @@ def find_available_nodes() -> List[str]:
             logging.info(f"节点 {node_name} 当前不可用")
     return available_nodes
 
-def check_squeue_status() -> Dict[str, str]:
-    """检查所有作业的状态"""
+def check_squeue_status() -> Dict[str, Dict]:
+    """检查所有作业的状态，按作业ID索引（同一模型的多个副本作业名相同）"""
     try:
         result = subprocess.run(
             "squeue -u liugu -o '%.18i %.9P %.8j %.8u %.2t %.10M %.6D %R'",
@@ -228,8 +290,9 @@ def check_squeue_status() -> Dict[str, str]:
                     job_name = parts[2]
                     status = parts[4]
                     node = parts[7]
-                    jobs[job_name] = {
+                    jobs[job_id] = {
                         'job_id': job_id,
+                        'name': job_name,
                         'status': status,
                         'node': node
                     }
@@ -354,19 +417,25 @@ def stop_model_job(model_name: str) -> bool:
     if not state['job_id']:
         return False
     
+    # 同时停止该模型的所有副本
+    job_ids = [replica['job_id'] for replica in state['replicas']] or [state['job_id']]
+    if state['job_id'] not in job_ids:
+        job_ids.append(state['job_id'])
     try:
         result = subprocess.run(
-            f"scancel {state['job_id']}",
+            f"scancel {' '.join(job_ids)}",
             shell=True,
             capture_output=True,
             text=True
         )
         
         if result.returncode == 0:
-            logging.info(f"成功停止模型 {model_name} 的作业 {state['job_id']}")
+            logging.info(f"成功停止模型 {model_name} 的作业 {', '.join(job_ids)}")
             state['is_available'] = False
             state['job_id'] = None
             state['node_name'] = None
+            state['replicas'] = []
+            save_model_states()
             return True
         else:
             logging.error(f"停止模型 {model_name} 失败: {result.stderr}")
@@ -381,8 +450,8 @@ def rotate_models():
         # 获取当前所有作业状态
         job_status = check_squeue_status()
         logging.info("当前作业状态:")
-        for job_name, status in job_status.items():
-            logging.info(f"作业 {job_name}: ID={status['job_id']}, 状态={status['status']}, 节点={status['node']}")
+        for status in job_status.values():
+            logging.info(f"作业 {status['name']}: ID={status['job_id']}, 状态={status['status']}, 节点={status['node']}")
         
         # 统计当前运行中的模型数量
         running_models = sum(1 for job_info in job_status.values() if job_info['status'] in ['R', 'PD'])
@@ -397,9 +466,10 @@ def rotate_models():
             if state['is_available'] and state['node_name']:
                 if should_stop_model_for_pending(model_name, state['node_name']):
                     logging.info(f"模型 {model_name} 需要为等待中的任务让路")
+                    replica_nodes = [replica['node_name'] for replica in state['replicas']] or [state['node_name']]
                     if stop_model_job(model_name):
-                        running_models -= 1
-                        used_nodes.remove(state['node_name'])
+                        running_models -= len(replica_nodes)
+                        used_nodes.difference_update(replica_nodes)
         
         # 获取下一个应该轮换的模型
         next_model = get_next_model_to_rotate()
@@ -417,16 +487,19 @@ def rotate_models():
             short_name = model_name.split('-')[0]
             matching_job = None
             
-            # 查找匹配的作业
-            for job_name, job_info in job_status.items():
-                if job_name.startswith(short_name):
-                    matching_job = job_info
-                    break
+            # 查找匹配的作业，同一模型可能有多个副本
+            matching_jobs = [job_info for job_info in job_status.values() if job_info['name'].startswith(short_name)]
+            if matching_jobs:
+                matching_job = matching_jobs[0]
             
             if matching_job:
                 state['job_id'] = matching_job['job_id']
                 state['node_name'] = matching_job['node']
                 state['is_available'] = matching_job['status'] in ['R', 'PD']
+                state['replicas'] = [
+                    {'job_id': job_info['job_id'], 'node_name': job_info['node']}
+                    for job_info in matching_jobs if job_info['status'] in ['R', 'PD']
+                ]
                 state['last_health_check'] = datetime.now()
                 logging.info(f"模型 {model_name} 在节点 {matching_job['node']} 上运行，状态: {matching_job['status']}")
                 
@@ -439,7 +512,7 @@ def rotate_models():
                 logging.info(f"模型 {model_name} 当前没有运行中的作业")
                 
                 # 如果这个模型是下一个要轮换的模型，并且有可用节点，则启动它
-                if model_name == next_model and running_models < 2:
+                if model_name == next_model and running_models < MAX_RUNNING_JOBS:
                     logging.info(f"准备启动模型 {model_name} 进行轮换")
                     all_available_nodes = find_available_nodes()
                     available_nodes = [node for node in all_available_nodes if node not in used_nodes]
@@ -451,6 +524,7 @@ def rotate_models():
                         if job_id:
                             state['node_name'] = new_node
                             state['job_id'] = job_id
+                            state['replicas'] = [{'job_id': job_id, 'node_name': new_node}]
                             state['is_available'] = True
                             state['last_health_check'] = datetime.now()
                             state['last_rotation_time'] = datetime.now()  # 更新最后轮换时间
@@ -461,8 +535,8 @@ def rotate_models():
                         logging.info(f"没有可用节点来启动模型 {model_name}")
                         state['is_available'] = False
                         state['last_health_check'] = datetime.now()
-                elif running_models < 2 and model_name in MODEL_ROTATION_ORDER:
-                    # 如果不是下一个要轮换的模型，但当前运行模型数量少于2个，也可以启动
+                elif running_models < MAX_RUNNING_JOBS and model_name in MODEL_ROTATION_ORDER:
+                    # 如果不是下一个要轮换的模型，但当前运行模型数量少于上限，也可以启动
                     logging.info(f"当前运行模型数量({running_models})小于2，尝试启动模型 {model_name}")
                     all_available_nodes = find_available_nodes()
                     available_nodes = [node for node in all_available_nodes if node not in used_nodes]
@@ -474,6 +548,7 @@ def rotate_models():
                         if job_id:
                             state['node_name'] = new_node
                             state['job_id'] = job_id
+                            state['replicas'] = [{'job_id': job_id, 'node_name': new_node}]
                             state['is_available'] = True
                             state['last_health_check'] = datetime.now()
                             state['last_rotation_time'] = datetime.now()  # 更新最后轮换时间
@@ -489,9 +564,27 @@ def rotate_models():
                     state['is_available'] = False
                     state['last_health_check'] = datetime.now()
         
+        # 还有空闲节点时为已运行的模型补齐副本
+        for model_name in SUPPORTED_MODELS:
+            state = model_states[model_name]
+            while (state['is_available'] and len(state['replicas']) < get_model_replicas(model_name)
+                   and running_models < MAX_RUNNING_JOBS):
+                available_nodes = [node for node in find_available_nodes() if node not in used_nodes]
+                if not available_nodes:
+                    break
+                new_node = available_nodes[0]
+                logging.info(f"为模型 {model_name} 在节点 {new_node} 上增加副本")
+                job_id = submit_model_job(model_name, new_node)
+                if not job_id:
+                    break
+                state['replicas'].append({'job_id': job_id, 'node_name': new_node})
+                running_models += 1
+                used_nodes.add(new_node)
+        
         # 获取当前可用的模型
         available_models = [model for model, state in model_states.items() if state['is_available']]
         logging.info(f"\n模型轮换完成，当前可用模型: {', '.join(available_models) if available_models else '无'}")
+        save_model_states()
         
         return running_models
     except Exception as e: